@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark the collector storage backends on a synthetic multi-symbol workload.
+
+For each backend in storage.BACKENDS this measures:
+  - insert throughput: candles/s written in collector-sized per-symbol batches
+  - tail-read latency: p50/p99 ms for "last N candles of a symbol"
+  - range-scan throughput: rows/s reading a symbol's full history into pandas
+  - on-disk size after the load
+
+Usage:
+    python bench_storage.py --symbols 100 --hours 6 --backends sqlite duckdb
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from storage import open_store, BACKENDS, CANDLE_COLUMNS
+
+CANDLE_INTERVAL_MS = 5000
+
+
+def synthetic_rows(symbol, start_ms, count, seed):
+    """Random-walk 5s candles for one symbol."""
+    rng = random.Random(seed)
+    price = 100 + rng.random() * 3000
+    rows = []
+    for i in range(count):
+        ts = start_ms + i * CANDLE_INTERVAL_MS
+        open_ = price
+        price *= 1 + rng.gauss(0, 0.0005)
+        high = max(open_, price) * (1 + abs(rng.gauss(0, 0.0002)))
+        low = min(open_, price) * (1 - abs(rng.gauss(0, 0.0002)))
+        dt = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts / 1000)) + '.000000'
+        rows.append((symbol, ts, dt, open_, high, low, price, rng.random() * 50))
+    return rows
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_backend(backend, workdir, symbols, candles_per_symbol, batch_size, tail_limit, tail_reads):
+    store = open_store(backend, os.path.join(workdir, f"bench_{backend}.db"))
+    store.create_tables('candles', prepare=True)
+    start_ms = 1_700_000_000_000 - 1_700_000_000_000 % CANDLE_INTERVAL_MS
+    data = {s: synthetic_rows(s, start_ms, candles_per_symbol, seed=i) for i, s in enumerate(symbols)}
+
+    # Insert in time order, one batch per symbol per step, like the collector's writers
+    t0 = time.perf_counter()
+    for offset in range(0, candles_per_symbol, batch_size):
+        for symbol in symbols:
+            store.upsert('candles', CANDLE_COLUMNS, data[symbol][offset:offset + batch_size])
+    insert_s = time.perf_counter() - t0
+    total_rows = candles_per_symbol * len(symbols)
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(tail_reads):
+        symbol = rng.choice(symbols)
+        t0 = time.perf_counter()
+        store.read_frame('SELECT * FROM candles WHERE symbol = ? ORDER BY timestamp DESC LIMIT ?',
+                         (symbol, tail_limit))
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    scan_symbols = symbols[:min(10, len(symbols))]
+    t0 = time.perf_counter()
+    scanned = 0
+    for symbol in scan_symbols:
+        scanned += len(store.read_frame(
+            'SELECT timestamp, open, high, low, close, volume FROM candles '
+            'WHERE symbol = ? AND timestamp >= ? ORDER BY timestamp', (symbol, start_ms)))
+    scan_s = time.perf_counter() - t0
+
+    size = store.size_bytes()
+    store.close()
+    return {
+        'backend': backend,
+        'rows': total_rows,
+        'insert_rows_s': total_rows / insert_s,
+        'tail_p50_ms': statistics.median(latencies),
+        'tail_p99_ms': percentile(latencies, 99),
+        'scan_rows_s': scanned / scan_s,
+        'size_mb': size / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare collector storage backends')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--symbols', type=int, default=100, help='Number of symbols (default: 100)')
+    parser.add_argument('--hours', type=float, default=6, help='Hours of 5s candles per symbol (default: 6)')
+    parser.add_argument('--batch', type=int, default=25, help='Candles per insert batch (default: 25)')
+    parser.add_argument('--tail', type=int, default=500, help='Rows per tail read (default: 500)')
+    parser.add_argument('--tail-reads', type=int, default=200, help='Number of tail reads (default: 200)')
+    parser.add_argument('--workdir', type=str, default=None, help='Directory for benchmark files (default: temp)')
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i:03d}/USDT:USDT" for i in range(args.symbols)]
+    candles_per_symbol = int(args.hours * 3600 * 1000 // CANDLE_INTERVAL_MS)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_storage_')
+    os.makedirs(workdir, exist_ok=True)
+
+    print(f"{len(symbols)} symbols x {candles_per_symbol:,} candles, batch {args.batch}, in {workdir}\n")
+    results = []
+    try:
+        for backend in args.backends:
+            try:
+                results.append(bench_backend(backend, workdir, symbols, candles_per_symbol,
+                                             args.batch, args.tail, args.tail_reads))
+            except ImportError as e:
+                print(f"Skipping {backend}: {e}")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    table = [[r['backend'], f"{r['rows']:,}", f"{r['insert_rows_s']:,.0f}", f"{r['tail_p50_ms']:.2f}",
+              f"{r['tail_p99_ms']:.2f}", f"{r['scan_rows_s']:,.0f}", f"{r['size_mb']:.1f}"] for r in results]
+    headers = ['Backend', 'Rows', 'Insert rows/s', 'Tail p50 ms', 'Tail p99 ms', 'Scan rows/s', 'Size MB']
+    print(tabulate(table, headers=headers, tablefmt='simple'))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,9 @@ from dataclasses import dataclass
 from asyncio import Queue, Semaphore
 
 from database import MarketDatabase
-from settings import EXCHANGE, EXCHANGE_CREDENTIALS, SYMBOLS, LOG_LEVEL, LOG_FILE
+from maintenance import MaintenanceScheduler
+from settings import (EXCHANGE, EXCHANGE_CREDENTIALS, SYMBOLS, LOG_LEVEL, LOG_FILE,
+                      CANDLE_RETENTION_DAYS, MAINTENANCE_INTERVAL, MAINTENANCE_TIME_BUDGET)
 
 logging.basicConfig(level=getattr(logging, LOG_LEVEL), format='%(asctime)s - %(levelname)s - %(message)s',
                    handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()])
@@ -46,7 +48,11 @@ class Candle:
 
 class DataCollector:
     def __init__(self):
-        self.db = MarketDatabase()
+        self.db = MarketDatabase(prepare=True)
+        self.maintenance = self.db.register_maintenance(
+            MaintenanceScheduler(interval=MAINTENANCE_INTERVAL, time_budget=MAINTENANCE_TIME_BUDGET),
+            candle_retention_ms=CANDLE_RETENTION_DAYS * 86400000 if CANDLE_RETENTION_DAYS else None
+        )
         self.exchange = None
         self.running = False
         
@@ -257,6 +263,7 @@ class DataCollector:
             
             self.running = True
             logger.info("Starting 5s Data Collector")
+            self.maintenance.start()
             
             tasks = []
             for symbol in SYMBOLS:
@@ -278,6 +285,7 @@ class DataCollector:
     async def stop(self):
         logger.info("Shutting down collector...")
         self.running = False
+        self.maintenance.stop()
         if self.exchange:
             await self.exchange.close()
 
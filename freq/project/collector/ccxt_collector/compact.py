@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Compact closed UTC days of 5s candles (and trades) from the live store into Parquet.
+
+Each fully closed day lands in an immutable partition:
+    ARCHIVE_DIR/candles/symbol=ETH_USDT_USDT/date=2025-08-01/data.parquet
+sorted by timestamp, zstd-compressed, with row-group statistics. A day is
+written to a temporary file, re-opened to verify its row count, atomically
+renamed into place, and only then deleted from SQLite, an hour at a time and
+only where the store still holds exactly the rows that were archived. A day
+that changed meanwhile (late upserts, backfills) is archived again.
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from database import MarketDatabase
+from settings import SYMBOLS, ARCHIVE_DIR, ARCHIVE_ROW_GROUP_SIZE, ARCHIVE_ZSTD_LEVEL
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86400 * 1000
+HOUR_MS = 3600 * 1000
+ARCHIVE_ATTEMPTS = 3  # Archive passes over a day that keeps changing before giving up on it
+
+SCHEMAS = {
+    'candles': pa.schema([
+        ('timestamp', pa.int64()),
+        ('open', pa.float64()),
+        ('high', pa.float64()),
+        ('low', pa.float64()),
+        ('close', pa.float64()),
+        ('volume', pa.float64()),
+    ]),
+    'trades': pa.schema([
+        ('id', pa.string()),
+        ('timestamp', pa.int64()),
+        ('price', pa.float64()),
+        ('amount', pa.float64()),
+        ('side', pa.string()),
+        ('info', pa.string()),
+    ]),
+}
+# Row order of a read, total so re-reads of unchanged rows compare equal
+ORDER_BY = {'candles': 'timestamp', 'trades': 'timestamp, id'}
+
+
+def symbol_to_dirname(symbol):
+    """ETH/USDT:USDT -> ETH_USDT_USDT (freqtrade pair file naming)."""
+    return symbol.replace('/', '_').replace(':', '_')
+
+
+def partition_path(kind, symbol, day, archive_dir=ARCHIVE_DIR):
+    """Path of the Parquet partition holding one UTC day."""
+    return os.path.join(archive_dir, kind, f"symbol={symbol_to_dirname(symbol)}",
+                        f"date={day.strftime('%Y-%m-%d')}", "data.parquet")
+
+
+class CandleCompactor:
+    """Moves closed UTC days out of MarketDatabase into Parquet partitions."""
+
+    def __init__(self, db=None, archive_dir=ARCHIVE_DIR, row_group_size=ARCHIVE_ROW_GROUP_SIZE,
+                 zstd_level=ARCHIVE_ZSTD_LEVEL):
+        self.db = db or MarketDatabase()
+        self.archive_dir = archive_dir
+        self.row_group_size = row_group_size
+        self.zstd_level = zstd_level
+
+    def _store(self, kind):
+        return self.db.candles_store if kind == 'candles' else self.db.trades_store
+
+    def closed_days(self, kind, symbol, now=None):
+        """UTC days with rows in SQLite that ended before today (UTC)."""
+        now = now or datetime.now(timezone.utc)
+        today_ms = int(datetime(now.year, now.month, now.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+        rows = self._store(kind).query(f'SELECT MIN(timestamp) FROM {kind} WHERE symbol = ?', (symbol,))
+        if not rows or rows[0][0] is None:
+            return []
+
+        days = []
+        day_ms = rows[0][0] - rows[0][0] % DAY_MS
+        while day_ms + DAY_MS <= today_ms:
+            days.append(datetime.fromtimestamp(day_ms / 1000, tz=timezone.utc))
+            day_ms += DAY_MS
+        return days
+
+    def _read_day(self, kind, symbol, start_ms, end_ms):
+        columns = ', '.join(SCHEMAS[kind].names)
+        query = (f'SELECT {columns} FROM {kind} WHERE symbol = ? AND timestamp >= ? AND timestamp < ? '
+                 f'ORDER BY {ORDER_BY[kind]}')
+        return self._store(kind).read_frame(query, (symbol, start_ms, end_ms))
+
+    def _delete_day(self, kind, symbol, start_ms, end_ms, archived):
+        """
+        Delete the archived rows of one day an hour at a time, to keep write locks short.
+
+        Each hour is re-read inside its delete transaction and only deleted if
+        it still holds exactly the archived rows, up to the newest archived
+        timestamp, and the delete must remove that many rows. An hour that
+        changed stops the pass, leaving it and the rest of the day in place.
+
+        Returns:
+            (rows deleted, whether the whole day was deleted)
+        """
+        store = self._store(kind)
+        deleted = 0
+        for chunk_start in range(start_ms, end_ms, HOUR_MS):
+            chunk_end = min(chunk_start + HOUR_MS, end_ms)
+            expected = archived[(archived['timestamp'] >= chunk_start)
+                                & (archived['timestamp'] < chunk_end)].reset_index(drop=True)
+            with store.transaction():
+                current = self._read_day(kind, symbol, chunk_start, chunk_end)
+                if current.empty and expected.empty:
+                    continue
+                if not current.equals(expected):
+                    return deleted, False
+                count = store.execute(f'DELETE FROM {kind} WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?',
+                                      (symbol, chunk_start, int(expected['timestamp'].iloc[-1])))
+                if count != len(expected):
+                    # Rolls this hour back
+                    raise IOError(f"{symbol} {kind}: deleting {len(expected)} archived rows removed {count}")
+            deleted += count
+        return deleted, True
+
+    def _write_partition(self, kind, symbol, day, df):
+        """Write df as the day's partition, merged with any existing one; returns rows in the partition."""
+        path = partition_path(kind, symbol, day, self.archive_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # A late write into an already archived day produces a new, merged partition
+        if os.path.exists(path):
+            existing = pq.read_table(path).to_pandas()
+            key = 'id' if kind == 'trades' else 'timestamp'
+            df = pd.concat([existing, df], ignore_index=True).drop_duplicates(subset=[key], keep='last')
+            logger.warning(f"{symbol} {day:%Y-%m-%d}: merging late {kind} into existing partition")
+
+        df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        table = pa.Table.from_pandas(df, schema=SCHEMAS[kind], preserve_index=False)
+
+        # Dot-prefixed so dataset scans never pick up a half-written file
+        tmp_path = os.path.join(os.path.dirname(path), '.data.parquet.tmp')
+        pq.write_table(table, tmp_path, compression='zstd', compression_level=self.zstd_level,
+                       row_group_size=self.row_group_size, write_statistics=True)
+
+        written = pq.ParquetFile(tmp_path).metadata.num_rows
+        if written != len(df):
+            os.remove(tmp_path)
+            raise IOError(f"Row count mismatch for {path}: wrote {written}, expected {len(df)}")
+        os.replace(tmp_path, path)
+        return len(df)
+
+    def compact_day(self, kind, symbol, day, prune=True):
+        """
+        Archive one UTC day for a symbol.
+
+        Returns:
+            Number of rows in the day's partition (0 if SQLite had nothing for that day).
+        """
+        start_ms = int(day.timestamp() * 1000)
+        end_ms = start_ms + DAY_MS
+        for attempt in range(1, ARCHIVE_ATTEMPTS + 1):
+            df = self._read_day(kind, symbol, start_ms, end_ms)
+            if df.empty:
+                return 0
+            archived = self._write_partition(kind, symbol, day, df)
+            if not prune:
+                logger.info(f"{symbol} {day:%Y-%m-%d}: archived {archived} {kind}")
+                return archived
+
+            if kind == 'candles':
+                self.db.drop_stats_before(symbol, end_ms)
+            deleted, complete = self._delete_day(kind, symbol, start_ms, end_ms, df)
+            if complete:
+                logger.info(f"{symbol} {day:%Y-%m-%d}: archived {archived} {kind}, pruned {deleted} from SQLite")
+                return archived
+            logger.warning(f"{symbol} {day:%Y-%m-%d}: {kind} changed while archiving "
+                           f"(attempt {attempt}/{ARCHIVE_ATTEMPTS}), {deleted} rows pruned")
+        raise IOError(f"{symbol} {day:%Y-%m-%d}: {kind} kept changing while archiving, rest left in SQLite")
+
+    def compact(self, symbols=SYMBOLS, kinds=('candles', 'trades'), prune=True):
+        """Archive every closed day for the given symbols; returns rows archived per kind."""
+        totals = {kind: 0 for kind in kinds}
+        for kind in kinds:
+            for symbol in symbols:
+                for day in self.closed_days(kind, symbol):
+                    try:
+                        totals[kind] += self.compact_day(kind, symbol, day, prune=prune)
+                    except Exception as e:
+                        logger.error(f"Compaction failed for {symbol} {kind} {day:%Y-%m-%d}: {e}")
+        return totals
+
+
+def load_archive(kind, symbol, start_time=None, end_time=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Read archived rows for a symbol, using partition and row-group statistics to skip data.
+
+    Args:
+        kind: 'candles' or 'trades'.
+        symbol: The trading pair symbol.
+        start_time, end_time: Optional inclusive millisecond bounds.
+        columns: Optional subset of columns.
+    """
+    root = os.path.join(archive_dir, kind, f"symbol={symbol_to_dirname(symbol)}")
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or SCHEMAS[kind].names)
+
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    expr = None
+    if start_time is not None:
+        expr = ds.field('timestamp') >= start_time
+    if end_time is not None:
+        end_expr = ds.field('timestamp') <= end_time
+        expr = end_expr if expr is None else expr & end_expr
+
+    df = dataset.to_table(columns=columns or SCHEMAS[kind].names, filter=expr).to_pandas()
+    if 'timestamp' in df.columns:
+        df = df.sort_values('timestamp').reset_index(drop=True)
+    return df
+
+
+def to_freqtrade(df):
+    """Convert archived candles to freqtrade's OHLCV layout (UTC `date` column)."""
+    out = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].copy()
+    out.insert(0, 'date', pd.to_datetime(out.pop('timestamp'), unit='ms', utc=True))
+    return out
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Compact closed days of collector data into Parquet')
+    parser.add_argument('--symbols', nargs='+', default=SYMBOLS, help='Symbols to compact')
+    parser.add_argument('--kinds', nargs='+', default=['candles', 'trades'], choices=['candles', 'trades'])
+    parser.add_argument('--keep', action='store_true', help='Archive without pruning SQLite')
+    args = parser.parse_args()
+
+    totals = CandleCompactor().compact(args.symbols, args.kinds, prune=not args.keep)
+    for kind, count in totals.items():
+        print(f"{kind}: {count:,} rows archived")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,371 +5,581 @@ Split into separate databases for trades and candles.
 """
 
 import logging
-import sqlite3
 import pandas as pd
 from datetime import datetime
+import bisect
 import json
 import os
-from contextlib import contextmanager
+import sys
+import threading
+import time
 
-from settings import TRADES_DB_PATH, CANDLES_DB_PATH, DATA_DIR
+from settings import TRADES_DB_PATH, CANDLES_DB_PATH, DATA_DIR, STORAGE_BACKEND
+
+# Shared collector modules live one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from maintenance import RetentionRule
+from storage import open_store, CANDLE_COLUMNS, TRADE_COLUMNS, GAP_COLUMNS, PYRAMID_COLUMNS, STATS_COLUMNS
 
 logger = logging.getLogger(__name__)
 
+CANDLE_INTERVAL_MS = 5000
+
+# Precomputed resample levels, finest first; each size divides the next
+PYRAMID_LEVELS = [('1m', 60000), ('5m', 300000), ('1h', 3600000), ('1d', 86400000)]
+TIMEFRAME_UNITS_MS = {'s': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000}
+
+
+def timeframe_to_ms(timeframe):
+    """'5s', '15m', '4h', '1d' -> milliseconds."""
+    try:
+        return int(timeframe[:-1]) * TIMEFRAME_UNITS_MS[timeframe[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid timeframe: {timeframe}")
+
+
+def aggregate_ohlcv(rows, size):
+    """Aggregate (timestamp, open, high, low, close, volume) rows sorted by time into size-ms buckets."""
+    buckets = {}
+    for ts, o, h, l, c, v in rows:
+        bucket = ts - ts % size
+        current = buckets.get(bucket)
+        if current is None:
+            buckets[bucket] = [bucket, o, h, l, c, v]
+        else:
+            current[2] = max(current[2], h)
+            current[3] = min(current[3], l)
+            current[4] = c
+            current[5] += v
+    return list(buckets.values())
+
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
 class MarketDatabase:
     """
     Database manager for market data with separate databases for trades and candles.
+
+    Storage goes through a storage.Store so the engine (SQLite, DuckDB) is
+    chosen by STORAGE_BACKEND in settings.py.
+
+    read_only is for tools that only read while the collector writes (no
+    tables are created); prepare is for the collector's startup only (see
+    storage.SQLiteStore.create_tables).
     """
-    
-    def __init__(self, trades_db_path=TRADES_DB_PATH, candles_db_path=CANDLES_DB_PATH):
+
+    def __init__(self, trades_db_path=TRADES_DB_PATH, candles_db_path=CANDLES_DB_PATH,
+                 backend=STORAGE_BACKEND, read_only=False, prepare=False):
         """Initialize the databases with the specified paths."""
-        self.trades_db_path = trades_db_path
-        self.candles_db_path = candles_db_path
-        self._create_tables()
-        logger.info(f"Initialized trades database at {trades_db_path}")
-        logger.info(f"Initialized candles database at {candles_db_path}")
-    
-    @contextmanager
+        self.trades_store = open_store(backend, trades_db_path, read_only=read_only)
+        self.candles_store = open_store(backend, candles_db_path, read_only=read_only)
+        self.trades_db_path = self.trades_store.path
+        self.candles_db_path = self.candles_store.path
+        self._last_candle_ts = {}  # symbol -> newest stored candle, for incremental gap tracking
+        # Writer threads and the maintenance thread both update stats; taken before any store transaction
+        self._stats_lock = threading.RLock()
+        if not read_only:
+            self._create_tables(prepare)
+        logger.info(f"Initialized trades database at {self.trades_db_path} ({backend})")
+        logger.info(f"Initialized candles database at {self.candles_db_path} ({backend})")
+
     def get_trades_connection(self):
-        """Context manager for trades database connections."""
-        conn = sqlite3.connect(self.trades_db_path)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-        try:
-            yield conn
-        finally:
-            conn.close()
-    
-    @contextmanager
+        """Context manager for raw trades database connections."""
+        return self.trades_store.connection()
+
     def get_candles_connection(self):
-        """Context manager for candles database connections."""
-        conn = sqlite3.connect(self.candles_db_path)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-        try:
-            yield conn
-        finally:
-            conn.close()
-    
-    def _create_tables(self):
+        """Context manager for raw candles database connections."""
+        return self.candles_store.connection()
+
+    def _create_tables(self, prepare=False):
         """Create necessary tables if they don't exist."""
-        # Create trades table
-        with self.get_trades_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trades (
-                id TEXT PRIMARY KEY,
-                symbol TEXT NOT NULL,
-                timestamp INTEGER NOT NULL,
-                datetime TEXT NOT NULL,
-                price REAL NOT NULL,
-                amount REAL NOT NULL,
-                side TEXT NOT NULL,
-                info TEXT,
-                UNIQUE(id, symbol)
-            )
-            ''')
-            
-            # Create index on timestamp and symbol for faster queries
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_ts_symbol ON trades (timestamp, symbol)')
-            
-            conn.commit()
-        
-        # Create candles table
-        with self.get_candles_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS candles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT NOT NULL,
-                timestamp INTEGER NOT NULL,
-                datetime TEXT NOT NULL,
-                open REAL NOT NULL,
-                high REAL NOT NULL,
-                low REAL NOT NULL,
-                close REAL NOT NULL,
-                volume REAL NOT NULL,
-                UNIQUE(timestamp, symbol)
-            )
-            ''')
-            
-            # Create index on timestamp and symbol for faster queries
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_candles_ts_symbol ON candles (timestamp, symbol)')
-            
-            conn.commit()
-    
+        self.trades_store.create_tables('trades', prepare=prepare)
+        self.candles_store.create_tables('candles', 'candle_gaps', 'candle_pyramid', 'candle_stats', prepare=prepare)
+
+    @staticmethod
+    def _candle_row(candle, symbol):
+        """Convert a [timestamp, open, high, low, close, volume] candle to a table row."""
+        timestamp = int(candle[0])
+        datetime_str = pd.to_datetime(timestamp, unit='ms').strftime('%Y-%m-%d %H:%M:%S.%f')
+        return (
+            symbol,
+            timestamp,
+            datetime_str,
+            float(candle[1]),  # open
+            float(candle[2]),  # high
+            float(candle[3]),  # low
+            float(candle[4]),  # close
+            float(candle[5])   # volume
+        )
+
     def insert_trades(self, trades, symbol):
         """Insert multiple trades for a symbol into the trades database."""
         if not trades:
             return 0
-        
-        with self.get_trades_connection() as conn:
-            cursor = conn.cursor()
-            inserted = 0
-            
-            for trade in trades:
-                try:
-                    # Convert trade info to JSON
-                    info_json = json.dumps(trade['info']) if 'info' in trade else None
-                    
-                    cursor.execute('''
-                    INSERT OR IGNORE INTO trades 
-                    (id, symbol, timestamp, datetime, price, amount, side, info)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        str(trade['id']),
-                        symbol,
-                        int(trade['timestamp']),
-                        trade['datetime'],
-                        float(trade['price']),
-                        float(trade['amount']),
-                        trade['side'],
-                        info_json
-                    ))
-                    if cursor.rowcount > 0:
-                        inserted += 1
-                except Exception as e:
-                    logger.error(f"Error inserting trade {trade}: {e}")
-            
-            conn.commit()
-            if inserted > 0:
-                logger.debug(f"Inserted {inserted} new trades for {symbol}")
-            return inserted
-    
-    def insert_candle(self, candle, symbol):
-        """Insert a 5s candle for a symbol into the candles database."""
-        with self.get_candles_connection() as conn:
-            cursor = conn.cursor()
-            
+
+        rows = []
+        for trade in trades:
             try:
-                timestamp = int(candle[0])
-                datetime_str = pd.to_datetime(timestamp, unit='ms').strftime('%Y-%m-%d %H:%M:%S.%f')
-                
-                cursor.execute('''
-                INSERT OR REPLACE INTO candles 
-                (symbol, timestamp, datetime, open, high, low, close, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+                # Convert trade info to JSON
+                info_json = json.dumps(trade['info']) if 'info' in trade else None
+                rows.append((
+                    str(trade['id']),
                     symbol,
-                    timestamp,
-                    datetime_str,
-                    float(candle[1]),  # open
-                    float(candle[2]),  # high
-                    float(candle[3]),  # low
-                    float(candle[4]),  # close
-                    float(candle[5])   # volume
+                    int(trade['timestamp']),
+                    trade['datetime'],
+                    float(trade['price']),
+                    float(trade['amount']),
+                    trade['side'],
+                    info_json
                 ))
-                
-                conn.commit()
-                return cursor.rowcount
             except Exception as e:
-                logger.error(f"Error inserting candle {candle} for {symbol}: {e}")
-                return 0
-    
+                logger.error(f"Error inserting trade {trade}: {e}")
+
+        inserted = self.trades_store.upsert('trades', TRADE_COLUMNS, rows, on_conflict='ignore')
+        if inserted > 0:
+            logger.debug(f"Inserted {inserted} new trades for {symbol}")
+        return inserted
+
+    def insert_candle(self, candle, symbol):
+        """Insert a 5s candle for a symbol into the candles database."""
+        return self.insert_candles([candle], symbol)
+
     def insert_candles(self, candles, symbol):
-        """Insert multiple 5s candles for a symbol into the candles database."""
+        """
+        Insert multiple 5s candles for a symbol into the candles database.
+
+        The candles and what is derived from them (candle_stats, the gap
+        index, the resample pyramid) are written in one transaction on one
+        connection: they commit together, or nothing is written and the
+        error is raised to the caller.
+        """
         if not candles:
             return 0
-        
-        with self.get_candles_connection() as conn:
-            cursor = conn.cursor()
-            inserted = 0
-            
-            for candle in candles:
-                try:
-                    timestamp = int(candle[0])
-                    datetime_str = pd.to_datetime(timestamp, unit='ms').strftime('%Y-%m-%d %H:%M:%S.%f')
-                    
-                    cursor.execute('''
-                    INSERT OR REPLACE INTO candles 
-                    (symbol, timestamp, datetime, open, high, low, close, volume)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        symbol,
-                        timestamp,
-                        datetime_str,
-                        float(candle[1]),  # open
-                        float(candle[2]),  # high
-                        float(candle[3]),  # low
-                        float(candle[4]),  # close
-                        float(candle[5])   # volume
-                    ))
-                    inserted += cursor.rowcount
-                except Exception as e:
-                    logger.error(f"Error inserting candle {candle} for {symbol}: {e}")
-            
-            conn.commit()
-            if inserted > 0:
-                logger.debug(f"Inserted {inserted} candles for {symbol}")
-            return inserted
-    
-    def get_latest_trade_timestamp(self, symbol):
-        """Get the timestamp of the latest trade for a symbol."""
-        with self.get_trades_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT MAX(timestamp) as max_ts FROM trades WHERE symbol = ?', (symbol,))
-            result = cursor.fetchone()
-            return result['max_ts'] if result and result['max_ts'] else 0
-    
-    def get_latest_candle_timestamp(self, symbol):
-        """Get the timestamp of the latest candle for a symbol."""
-        with self.get_candles_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT MAX(timestamp) as max_ts FROM candles WHERE symbol = ?', (symbol,))
-            result = cursor.fetchone()
-            return result['max_ts'] if result and result['max_ts'] else 0
-    
-    def get_trades(self, symbol, start_time=None, end_time=None, limit=None):
-        """Get trades for a symbol with optional time filtering."""
-        query = 'SELECT * FROM trades WHERE symbol = ?'
+
+        rows = []
+        for candle in candles:
+            try:
+                rows.append(self._candle_row(candle, symbol))
+            except Exception as e:
+                logger.error(f"Error inserting candle {candle} for {symbol}: {e}")
+        if not rows:
+            return 0
+
+        timestamps = [row[1] for row in rows]
+        try:
+            with self._stats_lock, self.candles_store.transaction() as store:
+                if symbol not in self._last_candle_ts:
+                    self._last_candle_ts[symbol] = self.get_latest_candle_timestamp(symbol) or None
+
+                # Rows about to be replaced, so the running stats can back them out
+                written = set(timestamps)
+                replaced = [r for r in store.query(
+                    'SELECT timestamp, close, low, high, volume FROM candles '
+                    'WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?',
+                    (symbol, min(written), max(written))) if r[0] in written]
+
+                inserted = store.upsert('candles', CANDLE_COLUMNS, rows)
+                if inserted > 0:
+                    self._update_stats(symbol, rows, replaced)
+                    self._update_gap_index(symbol, timestamps)
+                    self._update_pyramid(symbol, min(timestamps), max(timestamps))
+        except Exception:
+            # The live edge may have moved inside the rolled-back transaction: re-read it next time
+            self._last_candle_ts.pop(symbol, None)
+            raise
+        if inserted > 0:
+            logger.debug(f"Inserted {inserted} candles for {symbol}")
+        return inserted
+
+    def get_stats(self, symbol):
+        """Stored candle_stats row for a symbol as a dict, or None."""
+        rows = self.candles_store.query(f'SELECT {", ".join(STATS_COLUMNS)} FROM candle_stats WHERE symbol = ?',
+                                        (symbol,))
+        return dict(zip(STATS_COLUMNS, rows[0])) if rows else None
+
+    def _write_stats(self, stats):
+        stats['updated_ms'] = int(time.time() * 1000)
+        self.candles_store.upsert('candle_stats', STATS_COLUMNS, [tuple(stats[c] for c in STATS_COLUMNS)])
+
+    def rebuild_stats(self, symbol):
+        """Recompute a symbol's candle_stats row with one full aggregate over its candles."""
+        with self._stats_lock, self.candles_store.transaction() as store:
+            row = store.query(
+                'SELECT COUNT(*), MIN(timestamp), MAX(timestamp), SUM(close), MIN(low), MAX(high), SUM(volume) '
+                'FROM candles WHERE symbol = ?', (symbol,))[0]
+            stats = dict(zip(('candles', 'first_ts', 'last_ts', 'sum_close', 'min_low', 'max_high', 'volume'), row))
+            stats.update(symbol=symbol, floor_ts=stats['first_ts'],
+                         sum_close=stats['sum_close'] or 0.0, volume=stats['volume'] or 0.0)
+            self._write_stats(stats)
+            return stats
+
+    def _update_stats(self, symbol, rows, replaced):
+        """Fold newly written candle rows (minus the rows they replaced) into candle_stats."""
+        with self._stats_lock:
+            stats = self.get_stats(symbol)
+            if stats is not None and (stats['floor_ts'] is None or min(row[1] for row in rows) >= stats['floor_ts']):
+                self._fold_stats(stats, rows, replaced)
+                return
+            # First write since stats existed, or a backfill below the floor: rows there were never
+            # counted and may be awaiting retention, so only a full pass gets the floor right
+            self.rebuild_stats(symbol)
+
+    def _fold_stats(self, stats, rows, replaced):
+        unique = list({row[1]: row for row in rows}.values())
+        stats['candles'] += len(unique) - len(replaced)
+        stats['sum_close'] += sum(row[6] for row in unique) - sum(r[1] for r in replaced)
+        stats['volume'] += sum(row[7] for row in unique) - sum(r[4] for r in replaced)
+        # Extremes only widen here; a replaced extreme is corrected by the next rebuild_stats
+        lows = [row[5] for row in unique] + ([stats['min_low']] if stats['min_low'] is not None else [])
+        highs = [row[4] for row in unique] + ([stats['max_high']] if stats['max_high'] is not None else [])
+        stats['min_low'], stats['max_high'] = min(lows), max(highs)
+        timestamps = [row[1] for row in unique]
+        stats['first_ts'] = min(timestamps + ([stats['first_ts']] if stats['first_ts'] is not None else []))
+        stats['last_ts'] = max(timestamps + ([stats['last_ts']] if stats['last_ts'] is not None else []))
+        if stats['floor_ts'] is None:
+            stats['floor_ts'] = stats['first_ts']
+        self._write_stats(stats)
+
+    def drop_stats_before(self, symbol, cutoff):
+        """
+        Move a symbol's stats floor up to cutoff before candles older than it are deleted.
+
+        Only the rows between the old and new floor are aggregated, so batched
+        or repeated deletes never double-subtract. The read and the write of
+        candle_stats share one transaction, so a batch another process (the
+        collector, when compact.py calls this) commits meanwhile is not lost.
+        """
+        with self._stats_lock, self.candles_store.transaction() as store:
+            stats = self.get_stats(symbol)
+            if stats is None or stats['floor_ts'] is None or cutoff <= stats['floor_ts']:
+                return
+            count, sum_close, volume, min_low, max_high = store.query(
+                'SELECT COUNT(*), SUM(close), SUM(volume), MIN(low), MAX(high) FROM candles '
+                'WHERE symbol = ? AND timestamp >= ? AND timestamp < ?', (symbol, stats['floor_ts'], cutoff))[0]
+            stats['floor_ts'] = cutoff
+            if count:
+                stats['candles'] -= count
+                stats['sum_close'] -= sum_close
+                stats['volume'] -= volume
+                first, low, high = store.query(
+                    'SELECT MIN(timestamp), MIN(low), MAX(high) FROM candles WHERE symbol = ? AND timestamp >= ?'
+                    if min_low <= stats['min_low'] or max_high >= stats['max_high'] else
+                    'SELECT MIN(timestamp), NULL, NULL FROM candles WHERE symbol = ? AND timestamp >= ?',
+                    (symbol, cutoff))[0]
+                stats['first_ts'] = first
+                if low is not None or first is None:
+                    stats['min_low'], stats['max_high'] = low, high
+                if first is None:
+                    stats.update(candles=0, sum_close=0.0, volume=0.0, last_ts=None)
+            self._write_stats(stats)
+
+    def _update_gap_index(self, symbol, timestamps):
+        """
+        Keep candle_gaps in step with newly written candle timestamps.
+
+        Candles past the newest stored one open gaps for any skipped 5s
+        boundaries; older (backfilled) candles split or close the gaps they fall in,
+        and those before the first stored candle open gaps below it. The affected gaps are replaced in one transaction.
+        """
+        last_ts = self._last_candle_ts[symbol]
+        timestamps = sorted(set(timestamps))
+        split = bisect.bisect_right(timestamps, last_ts) if last_ts is not None else 0
+        backfilled, new = timestamps[:split], timestamps[split:]
+
+        with self.candles_store.transaction() as store:
+            new_gaps = []
+            affected = store.query(
+                'SELECT gap_start, gap_end FROM candle_gaps WHERE symbol = ? AND gap_end >= ? AND gap_start <= ?',
+                (symbol, backfilled[0], backfilled[-1])) if backfilled else []
+            for gap_start, gap_end in affected:
+                store.execute('DELETE FROM candle_gaps WHERE symbol = ? AND gap_start = ?', (symbol, gap_start))
+                cursor = gap_start
+                lo = bisect.bisect_left(backfilled, gap_start)
+                hi = bisect.bisect_right(backfilled, gap_end)
+                for ts in backfilled[lo:hi]:
+                    if ts > cursor:
+                        new_gaps.append((symbol, cursor, ts - CANDLE_INTERVAL_MS))
+                    cursor = ts + CANDLE_INTERVAL_MS
+                if cursor <= gap_end:
+                    new_gaps.append((symbol, cursor, gap_end))
+
+            if backfilled:
+                # Candles older than the symbol's first stored one open gaps below it
+                written = set(timestamps)
+                first = next((row[0] for row in store.query(
+                    'SELECT timestamp FROM candles WHERE symbol = ? ORDER BY timestamp LIMIT ?',
+                    (symbol, len(written) + 1)) if row[0] not in written), None)
+                older = [ts for ts in backfilled if first is None or ts < first] + ([first] if first is not None else [])
+                for previous, ts in zip(older, older[1:]):
+                    if ts - previous > CANDLE_INTERVAL_MS:
+                        new_gaps.append((symbol, previous + CANDLE_INTERVAL_MS, ts - CANDLE_INTERVAL_MS))
+
+            previous = last_ts
+            for ts in new:
+                if previous is not None and ts - previous > CANDLE_INTERVAL_MS:
+                    new_gaps.append((symbol, previous + CANDLE_INTERVAL_MS, ts - CANDLE_INTERVAL_MS))
+                previous = ts
+            store.upsert('candle_gaps', GAP_COLUMNS, new_gaps)
+        if new:
+            self._last_candle_ts[symbol] = new[-1]
+
+    def _read_level(self, symbol, level, start, end):
+        """OHLCV rows of one pyramid level (None = raw 5s candles) in [start, end), time ordered."""
+        if level is None:
+            return self.candles_store.query(
+                'SELECT timestamp, open, high, low, close, volume FROM candles '
+                'WHERE symbol = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+                (symbol, start, end))
+        return self.candles_store.query(
+            'SELECT timestamp, open, high, low, close, volume FROM candle_pyramid '
+            'WHERE symbol = ? AND timeframe = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+            (symbol, level, start, end))
+
+    def _update_pyramid(self, symbol, first_ts, last_ts):
+        """Recompute the pyramid buckets touched by candles in [first_ts, last_ts], level by level."""
+        source = None
+        for timeframe, size in PYRAMID_LEVELS:
+            start = first_ts - first_ts % size
+            end = last_ts - last_ts % size + size
+            buckets = aggregate_ohlcv(self._read_level(symbol, source, start, end), size)
+            self.candles_store.upsert('candle_pyramid', PYRAMID_COLUMNS,
+                                      [(symbol, timeframe, *bucket) for bucket in buckets])
+            source, first_ts, last_ts = timeframe, start, end - size
+
+    def rebuild_pyramid(self, symbol, start_time=None, end_time=None):
+        """Recompute every pyramid level from the stored 5s candles (e.g. after a bulk import)."""
+        rows = self.candles_store.query(
+            'SELECT MIN(timestamp), MAX(timestamp) FROM candles WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?',
+            (symbol, start_time or 0, end_time or 2 ** 62))
+        if rows and rows[0][0] is not None:
+            self._update_pyramid(symbol, rows[0][0], rows[0][1])
+
+    def get_candles_resampled(self, symbol, timeframe, start_time, end_time):
+        """
+        Get candles resampled to `timeframe` for [start_time, end_time) in ms.
+
+        The range is split into the coarsest pyramid level that divides the
+        timeframe for the aligned interior, and successively finer levels
+        (down to raw 5s candles) only for the ragged edges, so the rows read
+        stay roughly constant as the range grows.
+        """
+        size = timeframe_to_ms(timeframe)
+        if size % CANDLE_INTERVAL_MS:
+            raise ValueError(f"Timeframe {timeframe} is not a multiple of 5s")
+        levels = [(None, CANDLE_INTERVAL_MS)] + [(tf, ms) for tf, ms in PYRAMID_LEVELS if size % ms == 0]
+
+        start = start_time - start_time % CANDLE_INTERVAL_MS
+        end = end_time - end_time % CANDLE_INTERVAL_MS
+
+        def collect(lo, hi, depth):
+            if lo >= hi:
+                return []
+            level, level_ms = levels[depth]
+            inner_lo = -(-lo // level_ms) * level_ms
+            inner_hi = hi - hi % level_ms
+            if depth == 0 or inner_lo >= inner_hi:
+                return collect(lo, hi, depth - 1) if depth else self._read_level(symbol, level, lo, hi)
+            return (collect(lo, inner_lo, depth - 1)
+                    + self._read_level(symbol, level, inner_lo, inner_hi)
+                    + collect(inner_hi, hi, depth - 1))
+
+        rows = aggregate_ohlcv(collect(start, end, len(levels) - 1), size)
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def get_gaps(self, symbol, start_time=None, end_time=None):
+        """
+        List missing 5s boundaries from the gap index.
+
+        Returns:
+            DataFrame with gap_start, gap_end (inclusive, ms) and missing candle count.
+        """
+        query = ('SELECT gap_start, gap_end, '
+                 f'CAST((gap_end - gap_start) / {CANDLE_INTERVAL_MS} AS INTEGER) + 1 AS missing '
+                 'FROM candle_gaps WHERE symbol = ?')
+        params = [symbol]
+        if start_time:
+            query += ' AND gap_end >= ?'
+            params.append(start_time)
+        if end_time:
+            query += ' AND gap_start <= ?'
+            params.append(end_time)
+        return self.candles_store.read_frame(query + ' ORDER BY gap_start', params)
+
+    def scan_gaps(self, symbol, start_time=None, end_time=None):
+        """
+        Find gaps directly from the candles table with a LAG window over (symbol, timestamp).
+
+        Independent of the gap index, so it can be used to verify or rebuild it.
+        """
+        query = ('SELECT timestamp, LAG(timestamp) OVER (ORDER BY timestamp) AS prev_ts '
+                 'FROM candles WHERE symbol = ?')
         params = [symbol]
-        
         if start_time:
             query += ' AND timestamp >= ?'
             params.append(start_time)
-        
         if end_time:
             query += ' AND timestamp <= ?'
             params.append(end_time)
-        
-        query += ' ORDER BY timestamp ASC'
-        
-        if limit:
-            query += ' LIMIT ?'
-            params.append(limit)
-        
-        with self.get_trades_connection() as conn:
-            return pd.read_sql_query(query, conn, params=params)
-    
-    def get_candles(self, symbol, start_time=None, end_time=None, limit=None):
-        """Get 5s candles for a symbol with optional time filtering."""
-        query = 'SELECT * FROM candles WHERE symbol = ?'
+        query = (f'SELECT prev_ts + {CANDLE_INTERVAL_MS} AS gap_start, timestamp - {CANDLE_INTERVAL_MS} AS gap_end, '
+                 f'CAST((timestamp - prev_ts) / {CANDLE_INTERVAL_MS} AS INTEGER) - 1 AS missing '
+                 f'FROM ({query}) AS steps WHERE timestamp - prev_ts > {CANDLE_INTERVAL_MS} ORDER BY gap_start')
+        return self.candles_store.read_frame(query, params)
+
+    def rebuild_gap_index(self, symbol):
+        """Replace a symbol's gap index with a fresh scan; returns the number of gaps."""
+        with self.candles_store.transaction() as store:
+            gaps = self.scan_gaps(symbol)
+            store.execute('DELETE FROM candle_gaps WHERE symbol = ?', (symbol,))
+            store.upsert('candle_gaps', GAP_COLUMNS,
+                         [(symbol, int(s), int(e)) for s, e in zip(gaps['gap_start'], gaps['gap_end'])])
+        self._last_candle_ts.pop(symbol, None)
+        return len(gaps)
+
+    def get_latest_trade_timestamp(self, symbol):
+        """Get the timestamp of the latest trade for a symbol."""
+        rows = self.trades_store.query('SELECT MAX(timestamp) FROM trades WHERE symbol = ?', (symbol,))
+        return rows[0][0] if rows and rows[0][0] else 0
+
+    def get_latest_candle_timestamp(self, symbol):
+        """Get the timestamp of the latest candle for a symbol."""
+        rows = self.candles_store.query('SELECT MAX(timestamp) FROM candles WHERE symbol = ?', (symbol,))
+        return rows[0][0] if rows and rows[0][0] else 0
+
+    @staticmethod
+    def _range_query(table, symbol, start_time, end_time, limit):
+        query = f'SELECT * FROM {table} WHERE symbol = ?'
         params = [symbol]
-        
+
         if start_time:
             query += ' AND timestamp >= ?'
             params.append(start_time)
-        
+
         if end_time:
             query += ' AND timestamp <= ?'
             params.append(end_time)
-        
+
         query += ' ORDER BY timestamp ASC'
-        
+
         if limit:
             query += ' LIMIT ?'
             params.append(limit)
-        
-        with self.get_candles_connection() as conn:
-            return pd.read_sql_query(query, conn, params=params)
-    
+
+        return query, params
+
+    def get_trades(self, symbol, start_time=None, end_time=None, limit=None):
+        """Get trades for a symbol with optional time filtering."""
+        query, params = self._range_query('trades', symbol, start_time, end_time, limit)
+        return self.trades_store.read_frame(query, params)
+
+    def get_candles(self, symbol, start_time=None, end_time=None, limit=None):
+        """Get 5s candles for a symbol with optional time filtering."""
+        query, params = self._range_query('candles', symbol, start_time, end_time, limit)
+        return self.candles_store.read_frame(query, params)
+
     def prune_old_data(self, symbol, data_type, cutoff_timestamp):
         """
         Remove data older than the specified cutoff timestamp.
-        
+
         Args:
             symbol: The trading pair symbol.
             data_type: Either 'trades' or 'candles'.
             cutoff_timestamp: Remove data older than this timestamp (in milliseconds).
-            
+
         Returns:
             Number of records deleted.
         """
+        stores = {'trades': self.trades_store, 'candles': self.candles_store}
+        if data_type not in stores:
+            logger.error(f"Invalid data type for pruning: {data_type}")
+            return 0
+
         try:
-            if data_type == "trades":
-                with self.get_trades_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'DELETE FROM trades WHERE symbol = ? AND timestamp < ?',
-                        (symbol, cutoff_timestamp)
-                    )
-                    deleted = cursor.rowcount
-                    conn.commit()
-                    return deleted
-            elif data_type == "candles":
-                with self.get_candles_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'DELETE FROM candles WHERE symbol = ? AND timestamp < ?',
-                        (symbol, cutoff_timestamp)
-                    )
-                    deleted = cursor.rowcount
-                    conn.commit()
-                    return deleted
-            else:
-                logger.error(f"Invalid data type for pruning: {data_type}")
-                return 0
+            if data_type == 'candles':
+                self.drop_stats_before(symbol, cutoff_timestamp)
+            return stores[data_type].execute(
+                f'DELETE FROM {data_type} WHERE symbol = ? AND timestamp < ?',
+                (symbol, cutoff_timestamp)
+            )
         except Exception as e:
             logger.error(f"Error pruning old {data_type} for {symbol}: {e}")
             return 0
-    
+
     def prune_old_trades(self, symbol, max_trades):
         """Remove oldest trades beyond the maximum count to keep database size in check."""
-        with self.get_trades_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get count of trades for the symbol
-            cursor.execute('SELECT COUNT(*) as count FROM trades WHERE symbol = ?', (symbol,))
-            result = cursor.fetchone()
-            total_trades = result['count'] if result else 0
-            
-            if total_trades > max_trades:
-                # Find the timestamp cutoff for deletion
-                excess = total_trades - max_trades
-                cursor.execute(
-                    'SELECT timestamp FROM trades WHERE symbol = ? ORDER BY timestamp ASC LIMIT 1 OFFSET ?',
-                    (symbol, excess)
-                )
-                result = cursor.fetchone()
-                if result:
-                    cutoff_ts = result['timestamp']
-                    
-                    # Delete trades older than the cutoff
-                    cursor.execute(
-                        'DELETE FROM trades WHERE symbol = ? AND timestamp < ?',
-                        (symbol, cutoff_ts)
-                    )
-                    deleted = cursor.rowcount
-                    conn.commit()
-                    logger.info(f"Pruned {deleted} old trades for {symbol}")
-                    return deleted
-            
-            return 0
+        # Get count of trades for the symbol
+        rows = self.trades_store.query('SELECT COUNT(*) FROM trades WHERE symbol = ?', (symbol,))
+        total_trades = rows[0][0] if rows else 0
+
+        if total_trades > max_trades:
+            # Find the timestamp cutoff for deletion
+            excess = total_trades - max_trades
+            rows = self.trades_store.query(
+                'SELECT timestamp FROM trades WHERE symbol = ? ORDER BY timestamp ASC LIMIT 1 OFFSET ?',
+                (symbol, excess)
+            )
+            if rows:
+                # Delete trades older than the cutoff
+                deleted = self.prune_old_data(symbol, 'trades', rows[0][0])
+                logger.info(f"Pruned {deleted} old trades for {symbol}")
+                return deleted
+
+        return 0
+
+    def register_maintenance(self, scheduler, candle_retention_ms=None, trade_retention_ms=None):
+        """
+        Register both databases with a background MaintenanceScheduler.
+
+        Args:
+            scheduler: The shared maintenance.MaintenanceScheduler.
+            candle_retention_ms: Keep candles newer than this age (None keeps all).
+            trade_retention_ms: Keep trades newer than this age (None keeps all).
+        """
+        def cutoff(retention_ms):
+            if retention_ms is None:
+                return lambda: None
+            return lambda: int(time.time() * 1000) - retention_ms
+
+        def candle_cutoff():
+            # Advance the stats floor first so candle_stats never counts rows about to go
+            cutoff_ms = cutoff(candle_retention_ms)()
+            if cutoff_ms is not None:
+                for (symbol,) in self.candles_store.query('SELECT symbol FROM candle_stats'):
+                    self.drop_stats_before(symbol, cutoff_ms)
+            return cutoff_ms
+
+        scheduler.register_store(self.trades_store, [RetentionRule('trades', cutoff(trade_retention_ms))])
+        scheduler.register_store(self.candles_store, [
+            RetentionRule('candles', candle_cutoff),
+            RetentionRule('candle_gaps', cutoff(candle_retention_ms), column='gap_end'),
+            RetentionRule('candle_pyramid', cutoff(candle_retention_ms)),
+        ])
+        return scheduler
 
     def optimize_database(self):
-        """Perform optimization tasks on both databases."""
-        # Optimize trades database
+        """
+        Perform a full VACUUM and ANALYZE on both databases.
+
+        This blocks writers for the duration, so only use it offline; routine
+        upkeep while collecting is done by the MaintenanceScheduler.
+        """
         try:
-            with self.get_trades_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('VACUUM')
-                cursor.execute('ANALYZE')
-                
-                # Get database statistics
-                cursor.execute("SELECT COUNT(*) as count FROM trades")
-                trades_count = cursor.fetchone()['count']
-            
-            # Optimize candles database
-            with self.get_candles_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('VACUUM')
-                cursor.execute('ANALYZE')
-                
-                # Get database statistics
-                cursor.execute("SELECT COUNT(*) as count FROM candles")
-                candles_count = cursor.fetchone()['count']
-            
+            for store in (self.trades_store, self.candles_store):
+                store.execute('VACUUM')
+                store.execute('ANALYZE')
+
+            # Get database statistics
+            trades_count = self.trades_store.query("SELECT COUNT(*) FROM trades")[0][0]
+            candles_count = self.candles_store.query("SELECT COUNT(*) FROM candles")[0][0]
+
             logger.info(f"Databases optimized. Current stats: {trades_count} trades, {candles_count} candles")
             return True
         except Exception as e:
             logger.error(f"Error optimizing databases: {e}")
             return False
-    
+
     def close(self):
         """Close any remaining database resources."""
-        # SQLite connections are automatically closed by the context manager
-        # This method is here for compatibility and future extensions
-        pass 
\ No newline at end of file
+        self.trades_store.close()
+        self.candles_store.close()
@@ -16,6 +16,9 @@ os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)  # Ensure logs directory exists
 
 # Database settings
+STORAGE_BACKEND = "sqlite"  # "sqlite" or "duckdb" (see ../storage.py, ../bench_storage.py)
+# duckdb allows one read-write process per file: the collector and compact.py open it per call,
+# viewer.py / reconcile.py open it read-only per query, each waiting while another process holds it
 TRADES_DB_PATH = os.path.join(DATA_DIR, "trades.db")
 CANDLES_DB_PATH = os.path.join(DATA_DIR, "candles_5s.db")
 
@@ -35,6 +38,16 @@ SYMBOLS = ["ETH/USDT:USDT"]  # List of trading pairs to collect - futures format
 MAX_TRADES = 10000  # Maximum number of trades to keep per symbol
 CANDLE_TIMEFRAME = "5s"  # 5-second candles
 
+# Background maintenance (see ../maintenance.py)
+CANDLE_RETENTION_DAYS = None  # None keeps all candles
+MAINTENANCE_INTERVAL = 60  # Seconds between maintenance passes
+MAINTENANCE_TIME_BUDGET = 0.2  # Max seconds per maintenance step
+
+# Parquet archive of closed days (see compact.py)
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+ARCHIVE_ROW_GROUP_SIZE = 4320  # 6 hours of 5s candles per row group
+ARCHIVE_ZSTD_LEVEL = 9
+
 # Logging configuration
 LOG_LEVEL = "INFO"
 LOG_FILE = os.path.join(LOG_DIR, "data_collector.log")
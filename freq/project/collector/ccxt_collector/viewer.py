@@ -1,18 +1,35 @@
 #!/usr/bin/env python3
 """Data viewer for 5-second candle database."""
 
-import sqlite3
+import argparse
 import pandas as pd
 from datetime import datetime, timedelta
 import sys
+import time
 from tabulate import tabulate
 
 from database import MarketDatabase
 from settings import SYMBOLS
 
+STATS_QUERY = """
+SELECT s.candles, s.first_ts, s.last_ts, s.sum_close, s.min_low, s.max_high, s.volume,
+       (SELECT COUNT(*) FROM candles WHERE symbol = s.symbol AND timestamp > ?) AS recent
+FROM candle_stats s
+WHERE s.symbol = ?
+"""
+
+# Fallback for databases whose writer has not populated candle_stats yet
+AGGREGATE_QUERY = """
+SELECT COUNT(*), MIN(timestamp), MAX(timestamp), SUM(close), MIN(low), MAX(high), SUM(volume),
+       SUM(CASE WHEN timestamp > ? THEN 1 ELSE 0 END)
+FROM candles
+WHERE symbol = ?
+"""
+
 class DataViewer:
     def __init__(self):
-        self.db = MarketDatabase()
+        self.db = MarketDatabase(read_only=True)
+        self._recent = {}  # symbol -> cached tail of candles for live refreshes
     
     def get_recent_candles(self, symbol: str, count: int = 20) -> pd.DataFrame:
         """Get recent candles for a symbol."""
@@ -25,9 +42,7 @@ class DataViewer:
         """
         
         try:
-            conn = sqlite3.connect(self.db.candles_db_path)
-            df = pd.read_sql_query(query, conn, params=(symbol, count))
-            conn.close()
+            df = self.db.candles_store.read_frame(query, (symbol, count))
             
             if not df.empty:
                 df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
@@ -38,38 +53,41 @@ class DataViewer:
             print(f"Error getting candles for {symbol}: {e}")
             return pd.DataFrame()
     
+    def refresh_recent_candles(self, symbol: str, count: int = 20) -> pd.DataFrame:
+        """
+        Recent candles, reading only rows at or after the newest cached one
+        (which may have been rewritten) after the first call.
+        """
+        cached = self._recent.get(symbol)
+        if cached is None or cached.empty:
+            df = self.get_recent_candles(symbol, count)
+        else:
+            delta = self.db.candles_store.read_frame(
+                'SELECT timestamp, open, high, low, close, volume FROM candles '
+                'WHERE symbol = ? AND timestamp >= ? ORDER BY timestamp', (symbol, int(cached['timestamp'].iloc[-1])))
+            delta['datetime'] = pd.to_datetime(delta['timestamp'], unit='ms')
+            df = (pd.concat([cached, delta], ignore_index=True)
+                  .drop_duplicates('timestamp', keep='last')
+                  .tail(count).reset_index(drop=True))
+        self._recent[symbol] = df
+        return df
+    
     def get_candle_stats(self, symbol: str) -> dict:
-        """Get statistics for a symbol."""
+        """Get statistics for a symbol from the writer-maintained candle_stats row."""
         try:
-            conn = sqlite3.connect(self.db.candles_db_path)
-            cursor = conn.cursor()
-            
-            # Count total candles
-            cursor.execute("SELECT COUNT(*) FROM candles WHERE symbol = ?", (symbol,))
-            total_candles = cursor.fetchone()[0]
-            
-            # Get time range
-            cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM candles WHERE symbol = ?", (symbol,))
-            min_time, max_time = cursor.fetchone()
-            
-            # Get recent activity (last hour)
             hour_ago = int((datetime.now() - timedelta(hours=1)).timestamp() * 1000)
-            cursor.execute("SELECT COUNT(*) FROM candles WHERE timestamp > ? AND symbol = ?", (hour_ago, symbol))
-            recent_candles = cursor.fetchone()[0]
-            
-            # Get price stats
-            cursor.execute("SELECT AVG(close), MIN(low), MAX(high), SUM(volume) FROM candles WHERE symbol = ?", (symbol,))
-            avg_price, min_price, max_price, total_volume = cursor.fetchone()
-            
-            conn.close()
+            rows = self.db.candles_store.query(STATS_QUERY, (hour_ago, symbol))
+            if not rows:
+                rows = self.db.candles_store.query(AGGREGATE_QUERY, (hour_ago, symbol))
+            total_candles, min_time, max_time, sum_close, min_price, max_price, total_volume, recent_candles = rows[0]
             
             return {
                 'symbol': symbol,
-                'total_candles': total_candles,
-                'recent_candles': recent_candles,
+                'total_candles': total_candles or 0,
+                'recent_candles': recent_candles or 0,
                 'min_time': datetime.fromtimestamp(min_time/1000) if min_time else None,
                 'max_time': datetime.fromtimestamp(max_time/1000) if max_time else None,
-                'avg_price': avg_price,
+                'avg_price': sum_close / total_candles if total_candles else None,
                 'min_price': min_price,
                 'max_price': max_price,
                 'total_volume': total_volume
@@ -101,29 +119,27 @@ class DataViewer:
         print(tabulate(stats_data, headers=headers, tablefmt='grid'))
         print()
     
-    def show_recent_candles(self, symbol: str, count: int = 20):
+    def show_recent_candles(self, symbol: str, count: int = 20, df: pd.DataFrame = None):
         """Show recent candle data for a symbol."""
         print(f"=== Last {count} Candles for {symbol} ===\n")
         
-        df = self.get_recent_candles(symbol, count)
+        if df is None:
+            df = self.get_recent_candles(symbol, count)
         
         if df.empty:
             print(f"No data found for {symbol}")
             return
         
-        display_data = []
-        for _, row in df.iterrows():
-            display_data.append([
-                row['datetime'].strftime('%H:%M:%S'),
-                f"${row['open']:.4f}",
-                f"${row['high']:.4f}",
-                f"${row['low']:.4f}",
-                f"${row['close']:.4f}",
-                f"{row['volume']:.2f}"
-            ])
-        
-        headers = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume']
-        print(tabulate(display_data, headers=headers, tablefmt='grid'))
+        # Format whole columns at once instead of row by row
+        display = pd.DataFrame({
+            'Time': df['datetime'].dt.strftime('%H:%M:%S'),
+            'Open': df['open'].map('${:.4f}'.format),
+            'High': df['high'].map('${:.4f}'.format),
+            'Low': df['low'].map('${:.4f}'.format),
+            'Close': df['close'].map('${:.4f}'.format),
+            'Volume': df['volume'].map('{:.2f}'.format),
+        })
+        print(tabulate(display.values.tolist(), headers=list(display.columns), tablefmt='grid'))
         
         # Show summary
         print(f"\nSummary:")
@@ -132,17 +148,41 @@ class DataViewer:
         print(f"  Total Volume: {df['volume'].sum():.2f}")
         print(f"  Avg Volume/Candle: {df['volume'].mean():.2f}")
         print()
+    
+    def live(self, interval: float = 2.0, count: int = 20):
+        """Redraw the overview and recent candles every interval seconds until Ctrl+C."""
+        try:
+            while True:
+                frames = {symbol: self.refresh_recent_candles(symbol, count) for symbol in SYMBOLS}
+                sys.stdout.write("\033[2J\033[H")  # clear screen, cursor home
+                print(f"Updated {datetime.now():%H:%M:%S} (every {interval:g}s, Ctrl+C to exit)\n")
+                self.show_overview()
+                for symbol, df in frames.items():
+                    self.show_recent_candles(symbol, count, df)
+                sys.stdout.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
 
 def main():
+    parser = argparse.ArgumentParser(description='View collected 5s candles')
+    parser.add_argument('--live', action='store_true', help='Keep refreshing the view')
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between live refreshes (default: 2)')
+    parser.add_argument('--count', type=int, default=20, help='Recent candles per symbol (default: 20)')
+    args = parser.parse_args()
+    
     viewer = DataViewer()
+    if args.live:
+        viewer.live(args.interval, args.count)
+        return
     
     # Show overview first
     viewer.show_overview()
     
-    # Show last 20 candles for each symbol
+    # Show last candles for each symbol
     for symbol in SYMBOLS:
-        viewer.show_recent_candles(symbol, 20)
+        viewer.show_recent_candles(symbol, args.count)
         print("-" * 80)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Background maintenance for the collector SQLite databases.
+
+Shared by the ccxt and TradingView collectors. Retention deletes, incremental
+vacuum, WAL checkpoints and PRAGMA optimize run on a worker thread in small,
+time-budgeted steps so the ingestion path never waits on a full VACUUM.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+@dataclass
+class RetentionRule:
+    """
+    Delete rows of `table` whose `column` is older than `cutoff()` (ms, or None
+    to keep all). `where` (with `params`) limits the rule to matching rows, so
+    one table can hold series with different retention.
+    """
+    table: str
+    cutoff: Callable[[], Optional[int]]
+    column: str = "timestamp"
+    where: str = ""
+    params: tuple = ()
+
+    def condition(self, cutoff):
+        """WHERE clause and params selecting the expired rows."""
+        where = f'{self.column} < ?' + (f' AND {self.where}' if self.where else '')
+        return where, (cutoff, *self.params)
+
+
+@dataclass
+class _Target:
+    path: str
+    rules: List[RetentionRule]
+    store: object = None
+    last_checkpoint: float = 0.0
+    last_optimize: float = 0.0
+    behind: bool = False  # the last pass ran out of budget with expired rows left
+    stats: dict = field(default_factory=lambda: {'deleted': 0, 'vacuumed_pages': 0, 'checkpoints': 0,
+                                                 'backlog_passes': 0, 'behind': False})
+
+
+def prepare_database(conn):
+    """
+    Put a database into WAL mode with auto_vacuum=INCREMENTAL.
+
+    Switching auto_vacuum on an existing file needs one full VACUUM, so this
+    runs once at startup before ingestion begins; afterwards free pages are
+    reclaimed incrementally by the scheduler.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        logger.info("Enabled incremental auto_vacuum")
+    conn.execute('PRAGMA journal_mode = WAL')
+
+
+class MaintenanceScheduler:
+    """
+    Runs bounded maintenance steps for registered databases on a daemon thread.
+
+    Every `interval` seconds each database gets:
+      - retention deletes in batches of `delete_batch` rows, pausing between batches
+      - `PRAGMA incremental_vacuum` in steps of `vacuum_pages` pages
+      - a PASSIVE WAL checkpoint every `checkpoint_interval` seconds
+      - `PRAGMA optimize` (with a bounded analysis_limit) every `optimize_interval` seconds
+    Each step stops as soon as it exceeds `time_budget` seconds. A pass that
+    ran out of budget with expired rows left is followed by the next one after
+    `backlog_interval` seconds instead of `interval`, so retention keeps up
+    with a fast-growing table; stats() reports such a database as behind.
+    """
+
+    def __init__(self, interval=60, time_budget=0.2, delete_batch=500, vacuum_pages=256,
+                 checkpoint_interval=300, optimize_interval=3600, batch_pause=0.05, backlog_interval=1.0):
+        self.interval = interval
+        self.backlog_interval = backlog_interval
+        self.time_budget = time_budget
+        self.delete_batch = delete_batch
+        self.vacuum_pages = vacuum_pages
+        self.checkpoint_interval = checkpoint_interval
+        self.optimize_interval = optimize_interval
+        self.batch_pause = batch_pause
+        self._targets: List[_Target] = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, path, rules=()):
+        """Add a SQLite database file and its retention rules."""
+        self._targets.append(_Target(path=path, rules=list(rules)))
+        return self
+
+    def register_store(self, store, rules=()):
+        """
+        Add a storage.Store. SQLite stores get the full pragma-based upkeep;
+        other engines only get retention deletes and periodic CHECKPOINTs.
+        """
+        if store.name == 'sqlite':
+            return self.register(store.path, rules)
+        self._targets.append(_Target(path=store.path, rules=list(rules), store=store))
+        return self
+
+    def start(self):
+        """Start the background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+        logger.info(f"Maintenance scheduler started for {len(self._targets)} database(s)")
+
+    def stop(self, timeout=5):
+        """Signal the thread to stop and wait for the current step to finish."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.backlog_interval if any(t.behind for t in self._targets) else self.interval)
+
+    def run_once(self):
+        """Run one maintenance pass over every registered database."""
+        for target in self._targets:
+            if self._stop.is_set():
+                break
+            try:
+                self._maintain(target)
+            except Exception as e:
+                logger.error(f"Maintenance error on {target.path}: {e}")
+
+    def _maintain(self, target):
+        if target.store is not None:
+            return self._maintain_store(target)
+
+        # Short busy timeout: if ingestion holds the write lock, skip rather than queue behind it
+        conn = sqlite3.connect(target.path, timeout=self.time_budget)
+        try:
+            pruned = [self._prune(conn, rule) for rule in target.rules]
+            deleted = sum(count for count, _ in pruned)
+            self._set_behind(target, any(left for _, left in pruned))
+            pages = self._incremental_vacuum(conn)
+
+            now = time.monotonic()
+            if now - target.last_checkpoint >= self.checkpoint_interval:
+                conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+                target.last_checkpoint = now
+                target.stats['checkpoints'] += 1
+            if now - target.last_optimize >= self.optimize_interval:
+                conn.execute('PRAGMA analysis_limit = 400')
+                conn.execute('PRAGMA optimize')
+                target.last_optimize = now
+
+            target.stats['deleted'] += deleted
+            target.stats['vacuumed_pages'] += pages
+            if deleted or pages:
+                logger.info(f"Maintenance {target.path}: deleted {deleted} rows, reclaimed {pages} pages")
+        except sqlite3.OperationalError as e:
+            # Database busy: try again next pass
+            logger.debug(f"Maintenance deferred on {target.path}: {e}")
+        finally:
+            conn.close()
+
+    def _maintain_store(self, target):
+        """Upkeep for non-SQLite engines, which compact and checkpoint on their own."""
+        deleted = 0
+        for rule in target.rules:
+            cutoff = rule.cutoff()
+            if cutoff is not None:
+                where, params = rule.condition(cutoff)
+                deleted += target.store.execute(f'DELETE FROM {rule.table} WHERE {where}', params)
+
+        now = time.monotonic()
+        if now - target.last_checkpoint >= self.checkpoint_interval:
+            target.store.execute('CHECKPOINT')
+            target.last_checkpoint = now
+            target.stats['checkpoints'] += 1
+
+        target.stats['deleted'] += deleted
+        if deleted:
+            logger.info(f"Maintenance {target.path}: deleted {deleted} rows")
+
+    def _set_behind(self, target, behind):
+        if behind and not target.behind:
+            logger.warning(f"Maintenance {target.path}: retention is behind, pruning again in {self.backlog_interval}s")
+        elif target.behind and not behind:
+            logger.info(f"Maintenance {target.path}: retention caught up")
+        target.behind = target.stats['behind'] = behind
+        target.stats['backlog_passes'] += behind
+
+    def _prune(self, conn, rule):
+        """
+        Delete expired rows in small committed batches until done or out of
+        budget. Returns (rows deleted, whether expired rows may be left).
+        """
+        cutoff = rule.cutoff()
+        if cutoff is None:
+            return 0, False
+
+        where, params = rule.condition(cutoff)
+        query = f'DELETE FROM {rule.table} WHERE rowid IN (SELECT rowid FROM {rule.table} WHERE {where} LIMIT ?)'
+        deadline = time.monotonic() + self.time_budget
+        total = 0
+        while not self._stop.is_set():
+            deleted = conn.execute(query, (*params, self.delete_batch)).rowcount
+            conn.commit()
+            total += deleted
+            if deleted < self.delete_batch:
+                return total, False
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(self.batch_pause)
+        return total, True
+
+    def _incremental_vacuum(self, conn):
+        """Return free pages to the OS a few at a time."""
+        deadline = time.monotonic() + self.time_budget
+        reclaimed = 0
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        while free and time.monotonic() < deadline and not self._stop.is_set():
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages})')
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            reclaimed += free - remaining
+            free = remaining
+        return reclaimed
+
+    def stats(self):
+        """Cumulative maintenance counters per database path, and whether its retention is behind."""
+        return {target.path: dict(target.stats) for target in self._targets}
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Reconcile 5s candles from the ccxt (trade-built) and TradingView collectors.
+
+Both stores are read chunk by chunk over the requested range and aligned on
+timestamp with a vectorized outer merge. For each run this reports:
+  - coverage: candles present in each source and in both
+  - missing intervals: runs of 5s slots one source has and the other lacks
+  - per-field deviations on the overlap (OHLC in bps, volume in %)
+and can stream a merged "best" series to Parquet, taking each candle from
+the first source in --priority that has it.
+
+Usage:
+    python reconcile.py --start 2025-08-01 --end 2025-08-02 --output merged.parquet
+    python reconcile.py --priority tradingview ccxt --chunk-hours 1
+"""
+
+import argparse
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from storage import open_store
+
+CANDLE_INTERVAL_MS = 5000
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+FIELDS = PRICE_FIELDS + ('volume',)
+# Empty reads come back as object columns; every chunk is cast to these
+DTYPES = {'timestamp': 'int64', **{field: 'float64' for field in FIELDS}}
+
+# Defaults mirror ccxt_collector/settings.py and tradingview_collector/config.py
+CCXT_DB_PATH = "/allah/data/candles_5s.db"
+TRADINGVIEW_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "tradingview_collector", "data", "candles.db")
+
+
+def tradingview_symbol(symbol, exchange="BINANCE"):
+    """ETH/USDT:USDT -> BINANCE:ETHUSDT.P (perpetual), ETH/USDT -> BINANCE:ETHUSDT."""
+    base, _, settle = symbol.partition(':')
+    return f"{exchange}:{base.replace('/', '')}{'.P' if settle else ''}"
+
+
+class CandleSource:
+    """One collector's 5s candles for one symbol."""
+
+    def __init__(self, name, store, symbol):
+        self.name = name
+        self.store = store
+        self.symbol = symbol
+        # The TradingView collector may run in ring mode (see its database.py)
+        tables = {row[0] for row in store.query(
+            "SELECT table_name FROM information_schema.tables" if store.name == 'duckdb'
+            else "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'candles' in tables:
+            self.table = 'candles'
+        elif 'candle_ring' in tables:
+            self.table = '(SELECT * FROM candle_ring WHERE timestamp >= 0) AS candles'
+        else:
+            raise ValueError(f"{name}: no candle table in {store.path}")
+
+    def bounds(self):
+        """(first, last) timestamp for the symbol, or (None, None)."""
+        row = self.store.query(f'SELECT MIN(timestamp), MAX(timestamp) FROM {self.table} WHERE symbol = ?',
+                               (self.symbol,))[0]
+        return row[0], row[1]
+
+    def read(self, start, end):
+        """Candles with start <= timestamp < end, indexed by timestamp."""
+        df = self.store.read_frame(
+            f'SELECT timestamp, open, high, low, close, volume FROM {self.table} '
+            f'WHERE symbol = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+            (self.symbol, start, end))
+        return df.astype(DTYPES).drop_duplicates('timestamp').set_index('timestamp')
+
+
+def missing_runs(timestamps, interval=CANDLE_INTERVAL_MS):
+    """Collapse sorted slot timestamps into [(start, end, count)] runs of consecutive slots."""
+    if len(timestamps) == 0:
+        return []
+    ts = np.asarray(timestamps, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(ts) != interval)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(ts) - 1]))
+    return [(int(ts[s]), int(ts[e]), int(e - s + 1)) for s, e in zip(starts, ends)]
+
+
+class Reconciler:
+    """Chunked comparison of two CandleSources over a time range."""
+
+    def __init__(self, a, b, tolerance_bps=1.0):
+        self.sources = {a.name: a, b.name: b}
+        self.a, self.b = a, b
+        self.tolerance_bps = tolerance_bps
+        self.reset()
+
+    def reset(self):
+        self.slots = 0
+        self.present = {name: 0 for name in self.sources}
+        self.both = 0
+        self.missing = {name: [] for name in self.sources}
+        # Running per-field sums so no chunk has to be kept around
+        self.dev = {field: {'sum': 0.0, 'sq': 0.0, 'max': 0.0, 'over': 0} for field in FIELDS}
+
+    def overlap(self):
+        """Range where both sources have data, as (start, end) with end exclusive."""
+        (a_lo, a_hi), (b_lo, b_hi) = self.a.bounds(), self.b.bounds()
+        if None in (a_lo, a_hi, b_lo, b_hi):
+            return None, None
+        return max(a_lo, b_lo), min(a_hi, b_hi) + CANDLE_INTERVAL_MS
+
+    def _add_missing(self, name, runs):
+        """Append runs, joining one that continues the previous chunk's last run."""
+        existing = self.missing[name]
+        for start, end, count in runs:
+            if existing and existing[-1][1] + CANDLE_INTERVAL_MS == start:
+                prev = existing[-1]
+                existing[-1] = (prev[0], end, prev[2] + count)
+            else:
+                existing.append((start, end, count))
+
+    def compare_chunk(self, start, end):
+        """Merge one chunk of both sources and fold it into the running report; returns the merged frame."""
+        a, b = self.a.read(start, end), self.b.read(start, end)
+        grid = pd.RangeIndex(start, end, CANDLE_INTERVAL_MS, name='timestamp')
+        merged = a.add_suffix(f'_{self.a.name}').join(b.add_suffix(f'_{self.b.name}'), how='outer')
+        merged = merged.reindex(grid)
+
+        has = {name: merged[f'close_{name}'].notna().to_numpy() for name in self.sources}
+        both = has[self.a.name] & has[self.b.name]
+        self.slots += len(grid)
+        self.both += int(both.sum())
+        for name in self.sources:
+            self.present[name] += int(has[name].sum())
+            self._add_missing(name, missing_runs(grid.to_numpy()[~has[name]]))
+
+        if both.any():
+            for field in FIELDS:
+                x = merged[f'{field}_{self.a.name}'].to_numpy()[both]
+                y = merged[f'{field}_{self.b.name}'].to_numpy()[both]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    if field == 'volume':
+                        dev = np.abs(x - y) / np.maximum(np.abs(x), np.abs(y)) * 100
+                    else:
+                        dev = np.abs(x - y) / np.abs(x) * 10000
+                dev = np.nan_to_num(dev)
+                stats = self.dev[field]
+                stats['sum'] += float(dev.sum())
+                stats['sq'] += float((dev ** 2).sum())
+                stats['max'] = max(stats['max'], float(dev.max()))
+                if field != 'volume':
+                    stats['over'] += int((dev > self.tolerance_bps).sum())
+        return merged
+
+    def best(self, merged, priority):
+        """Per timestamp, the candle of the first source in priority that has one."""
+        out = pd.DataFrame(index=merged.index)
+        out['source'] = None
+        for field in FIELDS:
+            out[field] = np.nan
+        for name in reversed(priority):
+            has = merged[f'close_{name}'].notna()
+            for field in FIELDS:
+                out.loc[has, field] = merged.loc[has, f'{field}_{name}']
+            out.loc[has, 'source'] = name
+        return out.dropna(subset=['close']).reset_index()
+
+    def run(self, start=None, end=None, chunk_ms=6 * 3600 * 1000, priority=None, output=None):
+        """
+        Reconcile [start, end) (default: where both sources overlap), chunk_ms
+        at a time. With output, the merged best series is streamed to Parquet.
+        """
+        self.reset()
+        if start is None or end is None:
+            lo, hi = self.overlap()
+            start = lo if start is None else start
+            end = hi if end is None else end
+        if start is None or end is None or start >= end:
+            return self.report()
+        start -= start % CANDLE_INTERVAL_MS
+
+        writer = None
+        try:
+            for chunk_start in range(start, end, chunk_ms):
+                merged = self.compare_chunk(chunk_start, min(chunk_start + chunk_ms, end))
+                if output:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    if writer is None:
+                        # Fixed up front: a chunk where neither source has rows would infer null columns
+                        schema = pa.schema([('timestamp', pa.int64()), ('source', pa.string())]
+                                           + [(field, pa.float64()) for field in FIELDS])
+                        writer = pq.ParquetWriter(output, schema, compression='zstd')
+                    writer.write_table(pa.Table.from_pandas(self.best(merged, priority or list(self.sources)),
+                                                            schema=schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+        return self.report(start, end)
+
+    def report(self, start=None, end=None):
+        both = self.both or 1
+        deviations = {}
+        for field, stats in self.dev.items():
+            mean = stats['sum'] / both
+            deviations[field] = {
+                'mean': mean,
+                'std': max(stats['sq'] / both - mean ** 2, 0) ** 0.5,
+                'max': stats['max'],
+                'over_tolerance': stats['over'] if field != 'volume' else None,
+            }
+        return {
+            'start': start,
+            'end': end,
+            'slots': self.slots,
+            'present': dict(self.present),
+            'both': self.both,
+            'missing': {name: list(runs) for name, runs in self.missing.items()},
+            'deviations': deviations,
+        }
+
+
+def parse_time(value):
+    """ISO date/datetime (UTC) or epoch milliseconds."""
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def fmt_ts(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def print_report(report, max_runs):
+    if not report['slots']:
+        print("No overlapping data")
+        return
+    print(f"Range: {fmt_ts(report['start'])} - {fmt_ts(report['end'])} UTC, {report['slots']:,} slots\n")
+
+    coverage = [[name, f"{count:,}", f"{count / report['slots'] * 100:.2f}%"]
+                for name, count in report['present'].items()]
+    coverage.append(['both', f"{report['both']:,}", f"{report['both'] / report['slots'] * 100:.2f}%"])
+    print(tabulate(coverage, headers=['Source', 'Candles', 'Coverage'], tablefmt='simple'))
+    print()
+
+    rows = [[field, 'bps' if field != 'volume' else '%', f"{d['mean']:.3f}", f"{d['std']:.3f}", f"{d['max']:.3f}",
+             f"{d['over_tolerance']:,}" if d['over_tolerance'] is not None else '-']
+            for field, d in report['deviations'].items()]
+    print(tabulate(rows, headers=['Field', 'Unit', 'Mean', 'Std', 'Max', 'Over tol.'], tablefmt='simple'))
+    print()
+
+    for name, runs in report['missing'].items():
+        total = sum(count for _, _, count in runs)
+        print(f"Missing in {name}: {total:,} candles in {len(runs):,} intervals")
+        longest = sorted(runs, key=lambda run: run[2], reverse=True)[:max_runs]
+        if longest:
+            print(tabulate([[fmt_ts(s), fmt_ts(e), f"{c:,}"] for s, e, c in longest],
+                           headers=['From', 'To', 'Candles'], tablefmt='simple'))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ccxt and TradingView 5s candles')
+    parser.add_argument('--symbol', default='ETH/USDT:USDT', help='ccxt symbol (default: ETH/USDT:USDT)')
+    parser.add_argument('--tv-symbol', help='TradingView symbol (default: derived, e.g. BINANCE:ETHUSDT.P)')
+    parser.add_argument('--ccxt-db', default=CCXT_DB_PATH)
+    parser.add_argument('--tv-db', default=TRADINGVIEW_DB_PATH)
+    parser.add_argument('--ccxt-backend', default='sqlite')
+    parser.add_argument('--tv-backend', default='sqlite')
+    parser.add_argument('--start', help='UTC ISO time or epoch ms (default: start of overlap)')
+    parser.add_argument('--end', help='UTC ISO time or epoch ms, exclusive (default: end of overlap)')
+    parser.add_argument('--chunk-hours', type=float, default=6, help='Hours per merge chunk (default: 6)')
+    parser.add_argument('--tolerance-bps', type=float, default=1.0,
+                        help='Price deviation counted as a mismatch (default: 1 bps)')
+    parser.add_argument('--priority', nargs=2, default=['ccxt', 'tradingview'], choices=['ccxt', 'tradingview'],
+                        help='Source order for the merged series (default: ccxt tradingview)')
+    parser.add_argument('--output', help='Write the merged best series to this Parquet file')
+    parser.add_argument('--max-runs', type=int, default=10, help='Longest missing intervals to list per source')
+    args = parser.parse_args()
+    if args.priority[0] == args.priority[1]:
+        parser.error('--priority takes each source once, e.g. --priority tradingview ccxt')
+    chunk_ms = int(args.chunk_hours * 3600 * 1000)
+    if chunk_ms < CANDLE_INTERVAL_MS:
+        parser.error('--chunk-hours must cover at least one candle')
+
+    ccxt = CandleSource('ccxt', open_store(args.ccxt_backend, args.ccxt_db, read_only=True), args.symbol)
+    tv = CandleSource('tradingview', open_store(args.tv_backend, args.tv_db, read_only=True),
+                      args.tv_symbol or tradingview_symbol(args.symbol))
+    reconciler = Reconciler(ccxt, tv, tolerance_bps=args.tolerance_bps)
+    report = reconciler.run(parse_time(args.start), parse_time(args.end),
+                            chunk_ms=chunk_ms, priority=args.priority,
+                            output=args.output)
+    print_report(report, args.max_runs)
+    if args.output and report['slots']:
+        print(f"Merged series written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
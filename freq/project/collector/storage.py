@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+Storage backends for the collector databases.
+
+MarketDatabase and the TradingView Database talk to a Store instead of
+sqlite3 directly. The engine is picked by STORAGE_BACKEND in each
+collector's settings:
+
+  sqlite  - row store, WAL + incremental vacuum; readers never block the writer
+  duckdb  - embedded columnar engine; one read-write process per file at a time
+
+Both accept the same SQL for everything the collectors issue (qmark
+parameters, INSERT OR REPLACE/IGNORE against the key, window functions);
+only the DDL below differs.
+
+Stores open short-lived connections per call unless persistent=True, and
+read_only=True for tools that only read (viewers, reconcile.py), so they
+can run next to a collector. Calls made inside `with store.transaction():`
+share one connection and commit (or roll back) together.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from maintenance import prepare_database
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS = {
+    'candles': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS candles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                datetime TEXT NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                UNIQUE(timestamp, symbol)
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_candles_ts_symbol ON candles (timestamp, symbol)',
+            # Covering (symbol, timestamp) order for per-symbol window scans
+            'CREATE INDEX IF NOT EXISTS idx_candles_symbol_ts ON candles (symbol, timestamp)',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS candles (
+                symbol VARCHAR NOT NULL,
+                timestamp BIGINT NOT NULL,
+                datetime VARCHAR NOT NULL,
+                open DOUBLE NOT NULL,
+                high DOUBLE NOT NULL,
+                low DOUBLE NOT NULL,
+                close DOUBLE NOT NULL,
+                volume DOUBLE NOT NULL,
+                PRIMARY KEY (symbol, timestamp)
+            )
+            ''',
+        ],
+    },
+    'candle_gaps': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_gaps (
+                symbol TEXT NOT NULL,
+                gap_start INTEGER NOT NULL,
+                gap_end INTEGER NOT NULL,
+                PRIMARY KEY (symbol, gap_start)
+            )
+            ''',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_gaps (
+                symbol VARCHAR NOT NULL,
+                gap_start BIGINT NOT NULL,
+                gap_end BIGINT NOT NULL,
+                PRIMARY KEY (symbol, gap_start)
+            )
+            ''',
+        ],
+    },
+    'candle_pyramid': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_pyramid (
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                PRIMARY KEY (symbol, timeframe, timestamp)
+            )
+            ''',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_pyramid (
+                symbol VARCHAR NOT NULL,
+                timeframe VARCHAR NOT NULL,
+                timestamp BIGINT NOT NULL,
+                open DOUBLE NOT NULL,
+                high DOUBLE NOT NULL,
+                low DOUBLE NOT NULL,
+                close DOUBLE NOT NULL,
+                volume DOUBLE NOT NULL,
+                PRIMARY KEY (symbol, timeframe, timestamp)
+            )
+            ''',
+        ],
+    },
+    # Running per-symbol aggregates over candles with timestamp >= floor_ts
+    'candle_stats': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_stats (
+                symbol TEXT PRIMARY KEY,
+                candles INTEGER NOT NULL,
+                floor_ts INTEGER,
+                first_ts INTEGER,
+                last_ts INTEGER,
+                sum_close REAL NOT NULL,
+                min_low REAL,
+                max_high REAL,
+                volume REAL NOT NULL,
+                updated_ms INTEGER NOT NULL
+            )
+            ''',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_stats (
+                symbol VARCHAR PRIMARY KEY,
+                candles BIGINT NOT NULL,
+                floor_ts BIGINT,
+                first_ts BIGINT,
+                last_ts BIGINT,
+                sum_close DOUBLE NOT NULL,
+                min_low DOUBLE,
+                max_high DOUBLE,
+                volume DOUBLE NOT NULL,
+                updated_ms BIGINT NOT NULL
+            )
+            ''',
+        ],
+    },
+    # Fixed slots per symbol (timestamp // 5000 % N), preallocated and overwritten in place
+    'candle_ring': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_ring (
+                symbol TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                timestamp INTEGER NOT NULL,
+                datetime TEXT NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                PRIMARY KEY (symbol, slot)
+            ) WITHOUT ROWID
+            ''',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS candle_ring (
+                symbol VARCHAR NOT NULL,
+                slot INTEGER NOT NULL,
+                timestamp BIGINT NOT NULL,
+                datetime VARCHAR NOT NULL,
+                open DOUBLE NOT NULL,
+                high DOUBLE NOT NULL,
+                low DOUBLE NOT NULL,
+                close DOUBLE NOT NULL,
+                volume DOUBLE NOT NULL,
+                PRIMARY KEY (symbol, slot)
+            )
+            ''',
+        ],
+    },
+    'trades': {
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS trades (
+                id TEXT PRIMARY KEY,
+                symbol TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                datetime TEXT NOT NULL,
+                price REAL NOT NULL,
+                amount REAL NOT NULL,
+                side TEXT NOT NULL,
+                info TEXT,
+                UNIQUE(id, symbol)
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_trades_ts_symbol ON trades (timestamp, symbol)',
+        ],
+        'duckdb': [
+            '''
+            CREATE TABLE IF NOT EXISTS trades (
+                id VARCHAR NOT NULL,
+                symbol VARCHAR NOT NULL,
+                timestamp BIGINT NOT NULL,
+                datetime VARCHAR NOT NULL,
+                price DOUBLE NOT NULL,
+                amount DOUBLE NOT NULL,
+                side VARCHAR NOT NULL,
+                info VARCHAR,
+                PRIMARY KEY (id, symbol)
+            )
+            ''',
+        ],
+    },
+}
+
+# Conflict keys, used where an engine needs batches deduplicated up front
+KEYS = {
+    'candles': ('symbol', 'timestamp'),
+    'trades': ('id', 'symbol'),
+    'candle_gaps': ('symbol', 'gap_start'),
+    'candle_pyramid': ('symbol', 'timeframe', 'timestamp'),
+    'candle_ring': ('symbol', 'slot'),
+    'candle_stats': ('symbol',),
+}
+
+CANDLE_COLUMNS = ('symbol', 'timestamp', 'datetime', 'open', 'high', 'low', 'close', 'volume')
+PYRAMID_COLUMNS = ('symbol', 'timeframe', 'timestamp', 'open', 'high', 'low', 'close', 'volume')
+GAP_COLUMNS = ('symbol', 'gap_start', 'gap_end')
+STATS_COLUMNS = ('symbol', 'candles', 'floor_ts', 'first_ts', 'last_ts', 'sum_close', 'min_low', 'max_high',
+                 'volume', 'updated_ms')
+RING_COLUMNS = ('symbol', 'slot', 'timestamp', 'datetime', 'open', 'high', 'low', 'close', 'volume')
+TRADE_COLUMNS = ('id', 'symbol', 'timestamp', 'datetime', 'price', 'amount', 'side', 'info')
+
+# Seconds a DuckDB connect keeps retrying while another process holds the file
+DUCKDB_LOCK_TIMEOUT = 10
+
+
+class SQLiteStore:
+    """
+    SQLite file accessed through short-lived connections, or through one
+    lock-guarded connection kept open for the store's lifetime when
+    persistent=True (for dedicated writers). read_only opens the file with
+    mode=ro, so a reader can never write to (or set up) a live database.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, persistent=False, read_only=False):
+        self.path = path
+        self.persistent = persistent
+        self.read_only = read_only
+        self._conn = None
+        self._lock = threading.RLock()
+        self._local = threading.local()  # the connection of this thread's open transaction()
+
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"{Path(self.path).absolute().as_uri()}?mode=ro", uri=True,
+                                   check_same_thread=not self.persistent)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=not self.persistent)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Raw sqlite3 connection (rows as sqlite3.Row); inside transaction() the transaction's."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        if self.persistent:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+                yield self._conn
+            return
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run every call this thread makes on the store inside the block on one
+        connection, and commit them together; an exception rolls all of them
+        back. The write lock is taken up front, so reads in the block see
+        exactly what its writes change. Nested blocks join the outer one.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield self
+            return
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._local.conn = conn
+            try:
+                yield self
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.conn = None
+
+    def _commit(self, conn):
+        # A transaction() commits once, when its block ends
+        if getattr(self._local, 'conn', None) is None:
+            conn.commit()
+
+    def create_tables(self, *tables, extra=(), prepare=False):
+        """
+        Create the named tables from SCHEMAS plus any extra DDL statements.
+
+        prepare switches the file to WAL and incremental auto_vacuum first
+        (maintenance.prepare_database, a full VACUUM the first time). Only a
+        collector should pass it, at startup, before it starts writing.
+        """
+        with self.connection() as conn:
+            if prepare:
+                prepare_database(conn)
+            for table in tables:
+                for statement in SCHEMAS[table][self.name]:
+                    conn.execute(statement)
+            for statement in extra:
+                conn.execute(statement)
+            self._commit(conn)
+
+    def execute(self, sql, params=()):
+        """Run one write statement and return the affected row count."""
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            self._commit(conn)
+            return cursor.rowcount
+
+    def executemany(self, sql, rows):
+        """Run one write statement per row in a single transaction; returns rows changed."""
+        if not rows:
+            return 0
+        with self.connection() as conn:
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            self._commit(conn)
+            return conn.total_changes - before
+
+    def query(self, sql, params=()):
+        """Run a read query and return all rows."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def read_frame(self, sql, params=()):
+        """Run a read query into a DataFrame."""
+        with self.connection() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def upsert(self, table, columns, rows, on_conflict='replace'):
+        """Bulk insert rows in one transaction; on_conflict is 'replace' or 'ignore'."""
+        if not rows:
+            return 0
+        sql = (f"INSERT OR {on_conflict.upper()} INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))})")
+        with self.connection() as conn:
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            self._commit(conn)
+            return conn.total_changes - before
+
+    def upsert_many(self, batches, on_conflict='replace'):
+        """Upsert several (table, columns, rows) batches in a single transaction."""
+        with self.transaction(), self.connection() as conn:
+            before = conn.total_changes
+            for table, columns, rows in batches:
+                if rows:
+                    conn.executemany(f"INSERT OR {on_conflict.upper()} INTO {table} ({', '.join(columns)}) "
+                                     f"VALUES ({', '.join('?' * len(columns))})", rows)
+            return conn.total_changes - before
+
+    def size_bytes(self):
+        """On-disk size including the WAL and shared-memory files."""
+        return sum(os.path.getsize(p) for p in (self.path, self.path + '-wal', self.path + '-shm')
+                   if os.path.exists(p))
+
+    def close(self):
+        # Non-persistent connections are closed after every call
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class DuckDBStore:
+    """
+    DuckDB file behind short-lived connections, or one persistent,
+    lock-guarded connection when persistent=True.
+
+    DuckDB lets a single process open a file read-write, or any number of
+    processes open it read_only, never both at once. A persistent writer
+    therefore locks every other process out for as long as it runs. With
+    short-lived connections the file is only held for one call, and opening
+    it retries for up to DUCKDB_LOCK_TIMEOUT seconds while another process
+    holds it (each open costs a few ms more than with SQLite).
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, path, persistent=False, read_only=False):
+        import duckdb  # optional dependency, only needed for this backend
+        self._duckdb = duckdb
+        self.path = path
+        self.persistent = persistent
+        self.read_only = read_only
+        self._conn = None
+        self._lock = threading.RLock()
+        self._local = threading.local()  # the connection of this thread's open transaction()
+
+    def _connect(self):
+        deadline = time.monotonic() + DUCKDB_LOCK_TIMEOUT
+        while True:
+            try:
+                return self._duckdb.connect(self.path, read_only=self.read_only)
+            except self._duckdb.IOException as e:
+                if 'lock' not in str(e) or time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    @contextmanager
+    def connection(self):
+        """Raw duckdb connection; the shared one is held exclusively for the block."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        if self.persistent:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+                yield self._conn
+            return
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """One connection and one transaction for every call in the block, as SQLiteStore.transaction."""
+        if getattr(self._local, 'conn', None) is not None:
+            yield self
+            return
+        with self.connection() as conn:
+            conn.execute('BEGIN TRANSACTION')
+            self._local.conn = conn
+            try:
+                yield self
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            finally:
+                self._local.conn = None
+
+    def create_tables(self, *tables, extra=(), prepare=False):
+        # prepare is SQLite upkeep setup; DuckDB checkpoints and compacts on its own
+        with self.connection() as conn:
+            for table in tables:
+                for statement in SCHEMAS[table][self.name]:
+                    conn.execute(statement)
+            for statement in extra:
+                conn.execute(statement)
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        # DML returns a single count row
+        return rows[0][0] if rows and isinstance(rows[0][0], int) else 0
+
+    def executemany(self, sql, rows):
+        if not rows:
+            return 0
+        with self.transaction(), self.connection() as conn:
+            conn.executemany(sql, rows)
+        return len(rows)
+
+    def query(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def read_frame(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).df()
+
+    @staticmethod
+    def _insert(conn, table, columns, rows, on_conflict):
+        """Bulk insert via a registered DataFrame (executemany is row-at-a-time in DuckDB)."""
+        batch = pd.DataFrame(rows, columns=list(columns))
+        if table in KEYS:
+            # Match SQLite semantics: the last duplicate in a batch wins on replace, the first on ignore
+            batch = batch.drop_duplicates(subset=list(KEYS[table]),
+                                          keep='last' if on_conflict == 'replace' else 'first')
+        column_list = ', '.join(columns)
+        conn.register('_upsert_batch', batch)
+        try:
+            conn.execute(f"INSERT OR {on_conflict.upper()} INTO {table} ({column_list}) "
+                         f"SELECT {column_list} FROM _upsert_batch")
+        finally:
+            conn.unregister('_upsert_batch')
+        return len(rows)
+
+    def upsert(self, table, columns, rows, on_conflict='replace'):
+        if not rows:
+            return 0
+        with self.connection() as conn:
+            return self._insert(conn, table, columns, rows, on_conflict)
+
+    def upsert_many(self, batches, on_conflict='replace'):
+        """Upsert several (table, columns, rows) batches in a single transaction."""
+        with self.transaction(), self.connection() as conn:
+            return sum(self._insert(conn, table, columns, rows, on_conflict)
+                       for table, columns, rows in batches if rows)
+
+    def size_bytes(self):
+        return sum(os.path.getsize(p) for p in (self.path, self.path + '.wal') if os.path.exists(p))
+
+    def close(self):
+        # Short-lived connections are closed after every call
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+BACKENDS = {
+    'sqlite': SQLiteStore,
+    'duckdb': DuckDBStore,
+}
+
+
+def open_store(backend, path, persistent=False, read_only=False):
+    """
+    Open a store for the given backend name.
+
+    Non-SQLite backends get their own file extension next to the configured
+    path so switching engines never touches an existing SQLite file.
+    persistent keeps one connection open; read_only is for tools that only
+    read a database a collector may be writing.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    if backend != 'sqlite':
+        path = os.path.splitext(path)[0] + f'.{backend}'
+    store = BACKENDS[backend](path, persistent=persistent, read_only=read_only)
+    logger.debug(f"Opened {backend} store at {path}")
+    return store
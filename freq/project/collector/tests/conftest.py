@@ -0,0 +1,29 @@
+"""
+The collectors run as scripts with bare sibling imports, so their
+directories go on sys.path the same way. Both collectors have a
+database.py: `database` is the ccxt one, the TradingView one is loaded
+under its own name with tradingview_module().
+"""
+
+import importlib.util
+import os
+import sys
+
+COLLECTOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CCXT_DIR = os.path.join(COLLECTOR_DIR, 'ccxt_collector')
+TRADINGVIEW_DIR = os.path.join(COLLECTOR_DIR, 'tradingview_collector')
+
+for directory in (TRADINGVIEW_DIR, CCXT_DIR, COLLECTOR_DIR):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+def tradingview_module(name):
+    """Import tradingview_collector/<name>.py as tradingview_<name>."""
+    module_name = f'tradingview_{name}'
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(TRADINGVIEW_DIR, f'{name}.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from compact import DAY_MS, CandleCompactor, load_archive
+from database import CANDLE_INTERVAL_MS, MarketDatabase
+
+SYMBOL = 'ETH/USDT:USDT'
+DAY = datetime(2025, 8, 1, tzinfo=timezone.utc)
+START = int(DAY.timestamp() * 1000)
+
+
+@pytest.fixture
+def compactor(tmp_path):
+    db = MarketDatabase(str(tmp_path / 'trades.db'), str(tmp_path / 'candles.db'), backend='sqlite')
+    # Two candles a minute across the day, plus one on the next day which must stay
+    slots = list(range(0, DAY_MS // CANDLE_INTERVAL_MS, 6))
+    db.insert_candles([[START + s * CANDLE_INTERVAL_MS, 100, 101, 99, 100, 1] for s in slots], SYMBOL)
+    db.insert_candles([[START + DAY_MS, 100, 101, 99, 100, 1]], SYMBOL)
+    return CandleCompactor(db=db, archive_dir=str(tmp_path / 'archive'))
+
+
+def day_rows(db):
+    return db.candles_store.query('SELECT COUNT(*) FROM candles WHERE timestamp < ?', (START + DAY_MS,))[0][0]
+
+
+def test_compact_day_moves_rows(compactor):
+    assert compactor.compact_day('candles', SYMBOL, DAY) == 2880
+    assert day_rows(compactor.db) == 0
+    assert len(load_archive('candles', SYMBOL, archive_dir=compactor.archive_dir)) == 2880
+    assert len(compactor.db.get_candles(SYMBOL)) == 1
+
+
+@pytest.mark.parametrize('late', [
+    [START + 3 * 3600 * 1000 + CANDLE_INTERVAL_MS, 100, 105, 99, 104, 7],  # backfilled into the day
+    [START + 20 * 3600 * 1000, 100, 110, 90, 95, 9],  # replaces an archived candle
+])
+def test_rows_written_while_archiving_are_not_lost(compactor, monkeypatch, late):
+    write_partition = compactor._write_partition
+    calls = []
+
+    def write_then_upsert(*args):
+        written = write_partition(*args)
+        if not calls:
+            compactor.db.insert_candles([late], SYMBOL)
+        calls.append(written)
+        return written
+    monkeypatch.setattr(compactor, '_write_partition', write_then_upsert)
+
+    compactor.compact_day('candles', SYMBOL, DAY)
+    assert len(calls) == 2
+    assert day_rows(compactor.db) == 0
+    archive = load_archive('candles', SYMBOL, archive_dir=compactor.archive_dir).set_index('timestamp')
+    assert archive.loc[late[0], ['high', 'close', 'volume']].tolist() == [late[2], late[4], late[5]]
+    assert archive.index.is_unique
+
+
+def test_day_that_keeps_changing_is_left_in_place(compactor, monkeypatch):
+    write_partition = compactor._write_partition
+    late = iter(range(1, 10))
+
+    def write_then_upsert(*args):
+        written = write_partition(*args)
+        compactor.db.insert_candles([[START + next(late) * CANDLE_INTERVAL_MS, 1, 1, 1, 1, 1]], SYMBOL)
+        return written
+    monkeypatch.setattr(compactor, '_write_partition', write_then_upsert)
+
+    with pytest.raises(IOError):
+        compactor.compact_day('candles', SYMBOL, DAY)
+    # The late candles are in the first hour, so the day stays whole in SQLite
+    assert day_rows(compactor.db) == 2880 + 3
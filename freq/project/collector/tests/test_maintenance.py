@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from maintenance import MaintenanceScheduler, RetentionRule
+from storage import PYRAMID_COLUMNS, open_store
+
+SYMBOL = 'ETH/USDT:USDT'
+CUTOFF = 1_000_000
+
+
+@pytest.fixture(params=['sqlite', 'duckdb'])
+def store(request, tmp_path):
+    store = open_store(request.param, str(tmp_path / f'candles.{request.param}'))
+    store.create_tables('candle_pyramid', prepare=request.param == 'sqlite')
+    # 300 expired and 50 live rows for each of two timeframes
+    store.upsert('candle_pyramid', PYRAMID_COLUMNS, [
+        (SYMBOL, timeframe, CUTOFF - 300 + i, 1.0, 2.0, 0.5, 1.5, 10.0) for timeframe in ('1h', '1d') for i in range(350)
+    ])
+    return store
+
+
+def remaining(store):
+    return dict(store.query('SELECT timeframe, COUNT(*) FROM candle_pyramid GROUP BY timeframe'))
+
+
+def test_retention_rules(store):
+    scheduler = MaintenanceScheduler(time_budget=5, delete_batch=40, batch_pause=0).register_store(store, [
+        RetentionRule('candle_pyramid', lambda: CUTOFF, where='timeframe = ?', params=('1h',)),
+        RetentionRule('candle_pyramid', lambda: None),  # keep everything
+    ])
+    scheduler.run_once()
+    assert remaining(store) == {'1h': 50, '1d': 350}
+    assert scheduler.stats()[store.path]['deleted'] == 300
+    assert scheduler.stats()[store.path]['checkpoints'] == 1
+
+
+def test_sqlite_pruning_stops_at_the_time_budget(store):
+    if store.name != 'sqlite':
+        pytest.skip('batched deletes are SQLite only')
+    scheduler = MaintenanceScheduler(time_budget=0, delete_batch=40, batch_pause=0)
+    scheduler.register_store(store, [RetentionRule('candle_pyramid', lambda: CUTOFF)])
+    scheduler.run_once()
+    # One batch per pass once out of budget; later passes finish the job
+    assert sum(remaining(store).values()) == 700 - 40
+    assert scheduler.stats()[store.path]['behind']
+    for _ in range(20):
+        scheduler.run_once()
+    assert remaining(store) == {'1h': 50, '1d': 50}
+    assert not scheduler.stats()[store.path]['behind']
+    assert scheduler.stats()[store.path]['backlog_passes'] == 15
+    assert scheduler.stats()[store.path]['vacuumed_pages'] == 0  # no budget left for it
+
+    scheduler.time_budget = 5
+    scheduler.run_once()
+    assert scheduler.stats()[store.path]['vacuumed_pages'] > 0
+    assert store.query('PRAGMA freelist_count')[0][0] == 0
+
+
+def test_backlog_is_pruned_without_waiting_a_full_interval(store):
+    if store.name != 'sqlite':
+        pytest.skip('batched deletes are SQLite only')
+    scheduler = MaintenanceScheduler(interval=3600, time_budget=0, delete_batch=40, batch_pause=0,
+                                     backlog_interval=0.01)
+    scheduler.register_store(store, [RetentionRule('candle_pyramid', lambda: CUTOFF)])
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 10
+        while scheduler.stats()[store.path]['deleted'] < 600 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        scheduler.stop()
+    assert remaining(store) == {'1h': 50, '1d': 50}
@@ -0,0 +1,195 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from database import CANDLE_INTERVAL_MS, MarketDatabase
+
+SYMBOL = 'ETH/USDT:USDT'
+START = 1_754_006_400_000  # 2025-08-01 00:00 UTC
+
+
+@pytest.fixture(params=['sqlite', 'duckdb'])
+def db(request, tmp_path):
+    db = MarketDatabase(str(tmp_path / 'trades.db'), str(tmp_path / 'candles.db'), backend=request.param)
+    yield db
+    db.close()
+
+
+def candles(*slots, close=100.0):
+    """5s candles at START + slot * 5s."""
+    return [[START + slot * CANDLE_INTERVAL_MS, close, close + 1, close - 1, close, 1.0] for slot in slots]
+
+
+def gaps(db):
+    return [tuple(map(int, row)) for row in db.get_gaps(SYMBOL)[['gap_start', 'gap_end', 'missing']].to_numpy()]
+
+
+def scanned(db):
+    return [tuple(map(int, row)) for row in db.scan_gaps(SYMBOL)[['gap_start', 'gap_end', 'missing']].to_numpy()]
+
+
+def test_gap_index_follows_live_and_backfilled_candles(db):
+    db.insert_candles(candles(0, 1, 2), SYMBOL)
+    db.insert_candles(candles(10, 11), SYMBOL)
+    db.insert_candles(candles(20), SYMBOL)
+    assert gaps(db) == [(START + 3 * CANDLE_INTERVAL_MS, START + 9 * CANDLE_INTERVAL_MS, 7),
+                        (START + 12 * CANDLE_INTERVAL_MS, START + 19 * CANDLE_INTERVAL_MS, 8)]
+
+    # Backfill splits one gap, closes the start of the other, and replaces a stored candle
+    db.insert_candles(candles(5, 12, 13, 2), SYMBOL)
+    assert gaps(db) == scanned(db)
+    assert [g[2] for g in gaps(db)] == [2, 4, 6]
+
+    db.insert_candles(candles(3, 4, 6, 7, 8, 9, *range(14, 20)), SYMBOL)
+    assert gaps(db) == scanned(db) == []
+
+
+def test_gap_index_backfill_before_first_candle(db):
+    db.insert_candles(candles(20, 21), SYMBOL)
+    db.insert_candles(candles(0), SYMBOL)
+    assert gaps(db) == scanned(db) == [(START + CANDLE_INTERVAL_MS, START + 19 * CANDLE_INTERVAL_MS, 19)]
+
+    # Older candles in one batch, one of them closing part of the new gap and one replacing a stored candle
+    db.insert_candles(candles(-10, -8, 5, 20), SYMBOL)
+    assert gaps(db) == scanned(db)
+    assert [g[2] for g in gaps(db)] == [1, 7, 4, 14]
+
+
+def test_gap_index_rolls_back_with_a_failed_update(db, monkeypatch):
+    db.insert_candles(candles(0, 10), SYMBOL)
+    before = gaps(db)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(db.candles_store, 'upsert', fail)
+    with pytest.raises(RuntimeError):
+        db._update_gap_index(SYMBOL, [START + 5 * CANDLE_INTERVAL_MS, START + 20 * CANDLE_INTERVAL_MS])
+    monkeypatch.undo()
+
+    # The split gap was neither deleted nor replaced, and the live edge did not move
+    assert gaps(db) == before
+    assert db._last_candle_ts[SYMBOL] == START + 10 * CANDLE_INTERVAL_MS
+
+
+def test_rebuild_gap_index_matches_scan(db):
+    db.insert_candles(candles(0, 4, 5, 9), SYMBOL)
+    db.candles_store.execute('DELETE FROM candle_gaps WHERE symbol = ?', (SYMBOL,))
+    assert db.rebuild_gap_index(SYMBOL) == 2
+    assert gaps(db) == scanned(db)
+
+
+def test_failed_derived_update_rolls_back_the_batch(db, monkeypatch):
+    db.insert_candles(candles(0, 1), SYMBOL)
+    stats, gap_rows = db.get_stats(SYMBOL), gaps(db)
+
+    def fail(*args):
+        raise RuntimeError('pyramid')
+    monkeypatch.setattr(db, '_update_pyramid', fail)
+    with pytest.raises(RuntimeError):
+        db.insert_candles(candles(1, 9, close=200.0), SYMBOL)
+    monkeypatch.undo()
+
+    assert db.get_candles(SYMBOL)['close'].tolist() == [100.0, 100.0]
+    assert {k: v for k, v in db.get_stats(SYMBOL).items() if k != 'updated_ms'} == \
+        {k: v for k, v in stats.items() if k != 'updated_ms'}
+    assert gaps(db) == gap_rows == []
+
+    # The next batch picks up from the stored state
+    db.insert_candles(candles(9), SYMBOL)
+    assert gaps(db) == scanned(db)
+
+
+def test_batch_uses_one_connection(db, monkeypatch):
+    db.insert_candles(candles(0), SYMBOL)
+    opened = []
+    connect = db.candles_store._connect
+    monkeypatch.setattr(db.candles_store, '_connect', lambda: opened.append(1) or connect())
+    db.insert_candles(candles(1, 2, 7), SYMBOL)
+    assert len(opened) == 1
+
+
+def assert_stats_match_table(db):
+    stats = db.get_stats(SYMBOL)
+    count, first, last, sum_close, volume = db.candles_store.query(
+        'SELECT COUNT(*), MIN(timestamp), MAX(timestamp), SUM(close), SUM(volume) FROM candles '
+        'WHERE symbol = ? AND timestamp >= ?', (SYMBOL, stats['floor_ts']))[0]
+    assert (stats['candles'], stats['first_ts'], stats['last_ts']) == (count, first, last)
+    assert stats['sum_close'] == pytest.approx(sum_close)
+    assert stats['volume'] == pytest.approx(volume)
+
+
+def test_stats_fold_replacements(db):
+    db.insert_candles(candles(0, 1, 2), SYMBOL)
+    db.insert_candles(candles(2, 3, close=110.0), SYMBOL)
+    assert db.get_stats(SYMBOL)['candles'] == 4
+    assert_stats_match_table(db)
+
+
+def test_stats_backfill_below_floor_before_retention_deletes(db):
+    db.insert_candles(candles(*range(10)), SYMBOL)
+    # Retention moved the floor but its batched deletes have not reached these rows yet
+    db.drop_stats_before(SYMBOL, START + 5 * CANDLE_INTERVAL_MS)
+    assert_stats_match_table(db)
+
+    db.insert_candles(candles(-3, 12, close=90.0), SYMBOL)
+    assert_stats_match_table(db)
+    db.drop_stats_before(SYMBOL, START + 7 * CANDLE_INTERVAL_MS)
+    assert_stats_match_table(db)
+    db.prune_old_data(SYMBOL, 'candles', START + 8 * CANDLE_INTERVAL_MS)
+    assert_stats_match_table(db)
+    assert db.get_stats(SYMBOL)['candles'] == 3
+
+
+def test_drop_stats_before_does_not_lose_a_concurrent_batch(tmp_path, monkeypatch):
+    # The compactor and the collector, as two processes would see the same files
+    paths = str(tmp_path / 'trades.db'), str(tmp_path / 'candles.db')
+    collector = MarketDatabase(*paths, backend='sqlite')
+    compactor = MarketDatabase(*paths, backend='sqlite')
+    collector.insert_candles(candles(*range(10)), SYMBOL)
+
+    writers = []
+    get_stats = compactor.get_stats
+
+    def get_stats_then_race(symbol):
+        stats = get_stats(symbol)
+        writers.append(threading.Thread(target=collector.insert_candles, args=(candles(10, 11), SYMBOL)))
+        writers[-1].start()
+        writers[-1].join(0.5)  # the collector's batch waits for the compactor's transaction
+        return stats
+
+    monkeypatch.setattr(compactor, 'get_stats', get_stats_then_race)
+    compactor.drop_stats_before(SYMBOL, START + 3 * CANDLE_INTERVAL_MS)
+    writers[0].join()
+    collector.candles_store.execute('DELETE FROM candles WHERE timestamp < ?', (START + 3 * CANDLE_INTERVAL_MS,))
+    assert collector.get_stats(SYMBOL)['candles'] == 9
+    assert_stats_match_table(collector)
+
+
+@pytest.mark.parametrize('timeframe, rule', [('1m', '1min'), ('15m', '15min'), ('1h', '1h'), ('2h', '2h')])
+def test_resampled_from_pyramid_matches_pandas(db, timeframe, rule):
+    rng = np.random.default_rng(7)
+    slots = [slot for slot in range(3 * 720) if not 400 <= slot < 460 and rng.random() > 0.05]
+    prices = 100 + np.cumsum(rng.normal(0, 0.1, len(slots)))
+    rows = [[START + slot * CANDLE_INTERVAL_MS, price, price + rng.random(), price - rng.random(), price + 0.01,
+             float(rng.integers(1, 50))] for slot, price in zip(slots, prices)]
+    for i in range(0, len(rows), 500):
+        db.insert_candles(rows[i:i + 500], SYMBOL)
+    # A late replacement has to reach every level above it
+    rows[100] = [rows[100][0], 1.0, 500.0, 0.5, 2.0, 1000.0]
+    db.insert_candles([rows[100]], SYMBOL)
+
+    # Ragged edges on both sides, so edges come from finer levels than the interior
+    start, end = START + 37 * CANDLE_INTERVAL_MS + 1234, START + 3 * 3600 * 1000 - 41 * CANDLE_INTERVAL_MS
+    raw = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    raw = raw[(raw.timestamp >= start - start % CANDLE_INTERVAL_MS) & (raw.timestamp < end)]
+    expected = (raw.set_index(pd.to_datetime(raw.timestamp, unit='ms'))
+                .resample(rule, origin='epoch')
+                .agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+                .dropna())
+
+    resampled = db.get_candles_resampled(SYMBOL, timeframe, start, end).set_index('datetime')
+    assert list(resampled.index) == list(expected.index)
+    for column in expected.columns:
+        np.testing.assert_allclose(resampled[column], expected[column])
@@ -0,0 +1,67 @@
+import pyarrow.parquet as pq
+import pytest
+
+from reconcile import CANDLE_INTERVAL_MS, CandleSource, Reconciler, main
+from storage import CANDLE_COLUMNS, open_store
+
+HOUR_MS = 3600 * 1000
+START = 1_754_006_400_000  # 2025-08-01 00:00 UTC
+
+
+def candle_store(path, first, count, close=100.0):
+    store = open_store('sqlite', str(path))
+    store.create_tables('candles')
+    store.upsert('candles', CANDLE_COLUMNS, [
+        ('ETH/USDT:USDT', first + i * CANDLE_INTERVAL_MS, '', close, close + 1, close - 1, close, 2.0)
+        for i in range(count)])
+    return store
+
+
+@pytest.fixture
+def sources(tmp_path):
+    # TradingView has the first hour only: the second hour is an outage
+    ccxt = candle_store(tmp_path / 'ccxt.db', START, 2 * HOUR_MS // CANDLE_INTERVAL_MS)
+    tv = candle_store(tmp_path / 'tv.db', START, HOUR_MS // CANDLE_INTERVAL_MS, close=100.01)
+    return CandleSource('ccxt', ccxt, 'ETH/USDT:USDT'), CandleSource('tradingview', tv, 'ETH/USDT:USDT')
+
+
+def test_outage_chunk_is_reported_and_merged(sources, tmp_path):
+    output = tmp_path / 'best.parquet'
+    report = Reconciler(*sources).run(START, START + 2 * HOUR_MS, chunk_ms=HOUR_MS,
+                                      priority=['tradingview', 'ccxt'], output=str(output))
+
+    assert report['present'] == {'ccxt': 1440, 'tradingview': 720}
+    assert report['both'] == 720
+    assert report['missing']['tradingview'] == [(START + HOUR_MS, START + 2 * HOUR_MS - CANDLE_INTERVAL_MS, 720)]
+    assert report['deviations']['close']['max'] == pytest.approx(1.0, rel=1e-3)
+
+    best = pq.read_table(output).to_pandas()
+    assert len(best) == 1440
+    assert best['timestamp'].is_monotonic_increasing
+    assert (best['source'][:720] == 'tradingview').all() and (best['source'][720:] == 'ccxt').all()
+    assert (best['close'][:720] == 100.01).all() and (best['close'][720:] == 100.0).all()
+
+
+def test_chunks_before_either_source(sources, tmp_path):
+    output = tmp_path / 'best.parquet'
+    report = Reconciler(*sources).run(START - 2 * HOUR_MS, START + HOUR_MS, chunk_ms=HOUR_MS, output=str(output))
+
+    assert report['slots'] == 3 * 720
+    assert report['present'] == {'ccxt': 720, 'tradingview': 720}
+    table = pq.read_table(output)
+    assert table.num_rows == 720
+    assert table.schema.field('source').type == 'string'
+    assert set(table.column('source').to_pylist()) == {'ccxt'}
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['--priority', 'ccxt', 'ccxt'], '--priority takes each source once'),
+    (['--chunk-hours', '0'], '--chunk-hours must cover at least one candle'),
+    (['--chunk-hours', '-1'], '--chunk-hours must cover at least one candle'),
+])
+def test_bad_arguments_are_rejected(monkeypatch, capsys, argv, message):
+    monkeypatch.setattr('sys.argv', ['reconcile.py'] + argv)
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err
@@ -0,0 +1,61 @@
+import pytest
+
+from storage import CANDLE_COLUMNS, PYRAMID_COLUMNS, open_store
+
+SYMBOL = 'ETH/USDT:USDT'
+START = 1_754_006_400_000  # 2025-08-01 00:00 UTC
+
+
+@pytest.fixture(params=['sqlite', 'duckdb'], ids=['sqlite', 'duckdb'])
+def store(request, tmp_path):
+    store = open_store(request.param, str(tmp_path / f'candles.{request.param}'), persistent=request.param == 'sqlite')
+    store.create_tables('candles', 'candle_pyramid')
+    yield store
+    store.close()
+
+
+def rows(*slots, close=1.5):
+    return [(SYMBOL, START + slot * 5000, '2025-08-01 00:00:00.000000', 1.0, 2.0, 0.5, close, 10.0) for slot in slots]
+
+
+def closes(store):
+    return [row[0] for row in store.query('SELECT close FROM candles ORDER BY timestamp')]
+
+
+@pytest.mark.parametrize('on_conflict, expected', [('replace', [1.5, 9.0, 9.0]), ('ignore', [1.5, 1.5, 9.0])])
+def test_upsert_conflicts(store, on_conflict, expected):
+    store.upsert('candles', CANDLE_COLUMNS, rows(0, 1))
+    store.upsert('candles', CANDLE_COLUMNS, rows(1, 2, close=9.0), on_conflict=on_conflict)
+    assert closes(store) == expected
+
+
+def test_upsert_many_is_all_or_nothing(store):
+    pyramid = [(SYMBOL, '1m', START, 1.0, 2.0, 0.5, 1.5, 10.0)]
+    assert store.upsert_many([('candles', CANDLE_COLUMNS, rows(0, 1)), ('candle_pyramid', PYRAMID_COLUMNS, pyramid)]) == 3
+
+    broken = [(SYMBOL, '1m', START + 60000, 1.0, 2.0, 0.5, None, 10.0)]  # close is NOT NULL
+    with pytest.raises(Exception):
+        store.upsert_many([('candles', CANDLE_COLUMNS, rows(2)), ('candle_pyramid', PYRAMID_COLUMNS, broken)])
+    assert closes(store) == [1.5, 1.5]
+
+
+def test_transaction_reads_its_own_writes_and_rolls_back(store):
+    store.upsert('candles', CANDLE_COLUMNS, rows(0))
+    with pytest.raises(RuntimeError):
+        with store.transaction() as tx:
+            tx.upsert('candles', CANDLE_COLUMNS, rows(1))
+            assert tx.execute('DELETE FROM candles WHERE timestamp = ?', (START,)) == 1
+            with tx.transaction():  # nested blocks join the outer one
+                assert closes(tx) == [1.5]
+            raise RuntimeError('abort')
+    assert [row[0] for row in store.query('SELECT timestamp FROM candles')] == [START]
+
+
+def test_read_only_store_cannot_write(store):
+    store.upsert('candles', CANDLE_COLUMNS, rows(0))
+    store.close()
+    reader = open_store(store.name, store.path, read_only=True)
+    assert len(reader.read_frame('SELECT * FROM candles WHERE symbol = ?', [SYMBOL])) == 1
+    with pytest.raises(Exception):
+        reader.upsert('candles', CANDLE_COLUMNS, rows(1))
+    reader.close()
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from conftest import tradingview_module
+
+client = tradingview_module('client')
+database = tradingview_module('database')
+
+BAR_TIME = 1_754_006_400  # 2025-08-01 00:00 UTC, in seconds
+
+
+@pytest.fixture
+def non_utc_host(monkeypatch):
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_candle_times_are_utc_on_any_host(non_utc_host, tmp_path):
+    tv = client.TradingViewClient(symbols=['BINANCE:ETHUSDT.P'], resolutions=['5S', '60'])
+    series = list(tv.series.values())
+    candles = [tv._candle(s, [BAR_TIME, 1.0, 2.0, 0.5, 1.5, 10.0]) for s in series]
+    assert candles[0]['time'].timestamp() == BAR_TIME
+
+    db = database.Database(str(tmp_path / 'candles.db'), backend='sqlite')
+    assert db.insert_candle_batch(candles) == 2
+    assert db.get_latest_timestamp('BINANCE:ETHUSDT.P') == BAR_TIME * 1000
+    assert db.get_latest_timestamp('BINANCE:ETHUSDT.P', '1h') == BAR_TIME * 1000
+
+
+def test_live_close_lag_ignores_host_timezone(non_utc_host):
+    tv = client.TradingViewClient(symbols=['BINANCE:ETHUSDT.P'], resolutions=['5S'])
+    now = int(time.time()) // 5 * 5
+    for bar_time in (now - 5, now):
+        payload = '{"m":"du","p":["cs",{"sds_1":{"s":[{"i":0,"v":[%d,1,2,0.5,1.5,10]}]}}]}' % bar_time
+        tv._handle_message(client.wrap_message(payload), time.perf_counter())
+    assert len(tv.close_lag) == 1
+    assert -1 < tv.close_lag[0] < 5
+
+
+class FailingSocket:
+    """Accepts the connection, fails every send and delivers nothing until closed."""
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send(self, data):
+        raise RuntimeError('send on a dead socket')
+
+    async def close(self):
+        self.closed.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.closed.wait()
+        raise StopAsyncIteration
+
+
+def test_failed_handshake_reconnects(monkeypatch, caplog):
+    sockets = []
+    monkeypatch.setattr(client, 'connect', lambda *args, **kwargs: sockets.append(FailingSocket()) or sockets[-1])
+    monkeypatch.setattr(client, 'RECONNECT_DELAY', 0)
+    tv = client.TradingViewClient(symbols=['BINANCE:ETHUSDT.P'], resolutions=['5S'])
+
+    async def run():
+        generator = tv.batch_generator()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(generator.__anext__(), timeout=0.2)
+        await generator.aclose()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+    # Each failed handshake closed its socket instead of leaving the loop waiting on it
+    assert len(sockets) > 2
+    assert all(socket.closed.is_set() for socket in sockets[:-1])
+    assert 'handshake failed' in caplog.text
+
+
+PAYLOADS = ['{"m":"du","p":[1]}', '~h~42', '', '{"m":"qsd","p":["~m~ inside a payload"]}']
+
+
+@pytest.mark.parametrize('cut', range(1, len(''.join(map(client.wrap_message, PAYLOADS)))))
+def test_frame_parser_joins_frames_split_anywhere(cut):
+    stream = ''.join(map(client.wrap_message, PAYLOADS))
+    parser = client.FrameParser()
+    assert parser.feed(stream[:cut]) + parser.feed(stream[cut:]) == PAYLOADS
+
+
+def test_frame_parser_resyncs_after_garbage():
+    parser = client.FrameParser()
+    assert parser.feed('garbage~m~x~m~' + client.wrap_message('ok')) == ['ok']
+    assert parser.feed(client.wrap_message('next')) == ['next']
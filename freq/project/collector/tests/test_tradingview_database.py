@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from conftest import tradingview_module
+from maintenance import MaintenanceScheduler
+
+database = tradingview_module('database')
+
+SYMBOL = 'BINANCE:ETHUSDT.P'
+HOUR_MS = 3600 * 1000
+
+
+@pytest.fixture(params=['sqlite', 'duckdb'])
+def db(request, tmp_path):
+    return database.Database(str(tmp_path / 'candles.db'), backend=request.param, mode='table')
+
+
+def bars(step_ms, count, now_ms):
+    """`count` bars `step_ms` apart ending at now_ms."""
+    return [[now_ms - i * step_ms, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(count)]
+
+
+def count(db, timeframe):
+    return len(db.get_candles(SYMBOL, timeframe=timeframe))
+
+
+def test_retention_per_timeframe(db):
+    now_ms = int(time.time() * 1000) // 5000 * 5000
+    db.insert_candles(bars(5000, 3 * 720, now_ms), SYMBOL, '5s')
+    for timeframe, hours in (('1h', 1), ('4h', 4), ('1d', 24)):
+        db.insert_candles(bars(hours * HOUR_MS, 10, now_ms), SYMBOL, timeframe)
+
+    scheduler = db.register_maintenance(
+        MaintenanceScheduler(batch_pause=0), retention_ms=HOUR_MS,
+        pyramid_retention_ms={'1h': 5 * HOUR_MS, '4h': 5 * 4 * HOUR_MS})
+    scheduler.run_once()
+
+    # The 5s window applies to 5s candles only; each pyramid level keeps its own bar count
+    assert count(db, '5s') in (720, 721)
+    assert count(db, '1h') == 5
+    assert count(db, '4h') == 5
+    assert count(db, '1d') == 10
+
+
+RING_START = 1_754_006_400_000  # 2025-08-01 00:00 UTC
+
+
+def ring_db(path, slots):
+    return database.Database(str(path), backend='sqlite', mode='ring', retention_hours=slots * 5 / 3600)
+
+
+def ring_candles(*slots, close=1.5):
+    return [[RING_START + slot * 5000, 1.0, 2.0, 0.5, close, 10.0] for slot in slots]
+
+
+def stored(db, start=None, end=None):
+    return [int(ts) for ts in db.get_candles(SYMBOL, start, end)['timestamp']]
+
+
+def test_ring_overwrites_oldest_slots(tmp_path):
+    db = ring_db(tmp_path / 'ring.db', 10)
+    db.insert_candles(ring_candles(*range(15)), SYMBOL)
+    assert stored(db) == [RING_START + slot * 5000 for slot in range(5, 15)]
+    # The window wraps past the last slot, yet comes back in time order
+    assert stored(db, RING_START + 7 * 5000, RING_START + 12 * 5000) == [RING_START + s * 5000 for s in range(7, 13)]
+
+    # A late candle never overwrites the newer one holding its slot
+    db.insert_candles(ring_candles(3, close=99.0), SYMBOL)
+    assert stored(db) == [RING_START + slot * 5000 for slot in range(5, 15)]
+    assert 99.0 not in set(db.get_candles(SYMBOL)['close'])
+
+
+@pytest.mark.parametrize('slots, kept', [(20, range(10)), (4, range(6, 10))])
+def test_ring_reslots_when_retention_changes(tmp_path, slots, kept):
+    ring_db(tmp_path / 'ring.db', 10).insert_candles(ring_candles(*range(10)), SYMBOL)
+    db = ring_db(tmp_path / 'ring.db', slots)
+    assert db.store.query('SELECT COUNT(*) FROM candle_ring WHERE symbol = ?', (SYMBOL,))[0][0] == slots
+    assert stored(db) == [RING_START + slot * 5000 for slot in kept]
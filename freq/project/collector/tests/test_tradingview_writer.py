@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+
+from conftest import tradingview_module
+
+writer = tradingview_module('writer')
+
+
+class StubDatabase:
+    """Records each committed batch; the first `failures` calls raise like a locked SQLite file."""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.calls = 0
+        self.failures = failures
+
+    def insert_candle_batch(self, candles):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise sqlite3.OperationalError('database is locked')
+        self.batches.append(list(candles))
+        return len(candles)
+
+
+def run(db, scenario, **kwargs):
+    async def main():
+        candle_writer = writer.CandleWriter(db, **kwargs).start()
+        await scenario(candle_writer)
+        await candle_writer.stop()
+        return candle_writer
+
+    return asyncio.run(main())
+
+
+def test_groups_fill_batches_and_stop_drains_the_queue():
+    async def scenario(candle_writer):
+        for i in range(12):
+            await candle_writer.put(i)
+
+    db = StubDatabase()
+    stats = run(db, scenario, batch_size=5, flush_ms=10_000).stats()
+    assert db.batches == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11]]
+    assert (stats['rows'], stats['batches'], stats['errors']) == (12, 3, 0)
+
+
+def test_put_batch_is_never_split():
+    async def scenario(candle_writer):
+        await candle_writer.put_batch([0, 1, 2])
+        await candle_writer.put_batch(list(range(3, 10)))
+        await candle_writer.put(10)
+
+    db = StubDatabase()
+    run(db, scenario, batch_size=5, flush_ms=10_000)
+    assert db.batches == [list(range(10)), [10]]
+
+
+def test_flush_deadline_commits_a_partial_batch():
+    db = StubDatabase()
+
+    async def scenario(candle_writer):
+        await candle_writer.put(0)
+        await asyncio.sleep(0.3)
+        assert db.batches == [[0]]  # committed before stop()
+        await candle_writer.put(1)
+
+    run(db, scenario, batch_size=100, flush_ms=50)
+    assert db.batches == [[0], [1]]
+
+
+def test_transient_errors_are_retried():
+    async def scenario(candle_writer):
+        await candle_writer.put_batch([0, 1, 2])
+
+    db = StubDatabase(failures=2)
+    stats = run(db, scenario, retries=3, retry_delay_ms=1).stats()
+    assert db.batches == [[0, 1, 2]]
+    assert (stats['rows'], stats['errors'], stats['retried']) == (3, 0, 2)
+
+
+def test_persistent_errors_drop_the_batch_after_the_retries():
+    async def scenario(candle_writer):
+        await candle_writer.put_batch([0, 1, 2])
+        await asyncio.sleep(0.1)
+        await candle_writer.put(3)
+
+    db = StubDatabase(failures=3)
+    stats = run(db, scenario, retries=2, retry_delay_ms=1, flush_ms=10).stats()
+    assert db.batches == [[3]]
+    assert (db.calls, stats['rows'], stats['errors'], stats['retried']) == (4, 1, 1, 2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the TradingView frame parser.
+
+Compares the old regex/re-slice splitter with the offset-based FrameParser
+on batches of websocket messages. Uses a capture file if given (one raw
+websocket message per line, JSON-encoded), otherwise synthetic batches of
+`du` updates and heartbeats at several frames-per-message sizes.
+
+Usage:
+    python bench_parser.py
+    python bench_parser.py --capture messages.jsonl
+"""
+
+import argparse
+import json
+import re
+import time
+
+from tabulate import tabulate
+
+from client import FrameParser, wrap_message, HEARTBEAT_PREFIX, DATA_PREFIXES
+
+def legacy_split(raw):
+    """The previous implementation: regex at the head, then re-slice the rest."""
+    messages = []
+    while raw:
+        match = re.match(r"~m~(\d+)~m~", raw)
+        if not match:
+            break
+        length = int(match.group(1))
+        start = match.end()
+        end = start + length
+        messages.append(raw[start:end])
+        raw = raw[end:]
+    return messages
+
+def legacy_handle(messages):
+    decoded = 0
+    for message in messages:
+        for msg in legacy_split(message):
+            if not msg.strip():
+                continue
+            if re.match(r"^~h~\d+$", msg):
+                continue
+            try:
+                json.loads(msg)
+                decoded += 1
+            except ValueError:
+                pass
+    return decoded
+
+def parser_handle(messages):
+    parser = FrameParser()
+    decoded = 0
+    for message in messages:
+        for frame in parser.feed(message):
+            if frame.startswith(HEARTBEAT_PREFIX):
+                continue
+            if frame.startswith(DATA_PREFIXES):
+                json.loads(frame)
+                decoded += 1
+    return decoded
+
+def synthetic_messages(frames_per_message, count):
+    """Websocket messages of `du` bar updates with a heartbeat and a quote frame mixed in."""
+    messages = []
+    ts = 1_754_000_000
+    for i in range(count):
+        frames = []
+        for j in range(frames_per_message):
+            ts += 5
+            if j % 50 == 49:
+                frames.append(f"~h~{i * frames_per_message + j}")
+            elif j % 10 == 9:
+                frames.append(json.dumps({"m": "qsd", "p": ["qs_x", {"n": "BINANCE:ETHUSDT.P", "v": {"lp": 3000.5}}]},
+                                         separators=(',', ':')))
+            else:
+                bar = {"i": j, "v": [ts, 3000.1, 3001.2, 2999.8, 3000.6, 12.5]}
+                frames.append(json.dumps({"m": "du", "p": ["cs_x", {"sds_1": {"s": [bar], "ns": {"d": ""}}}]},
+                                         separators=(',', ':')))
+        messages.append(''.join(wrap_message(f) for f in frames))
+    return messages
+
+def run(name, fn, messages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(messages)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TradingView frame parsing')
+    parser.add_argument('--capture', type=str, help='JSONL file of raw websocket messages')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='Frames per synthetic message (default: 1 10 100 1000)')
+    parser.add_argument('--frames', type=int, default=20000, help='Total synthetic frames per size')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions, best time is reported')
+    args = parser.parse_args()
+
+    batches = []
+    if args.capture:
+        with open(args.capture) as f:
+            batches.append((args.capture, [json.loads(line) for line in f if line.strip()]))
+    else:
+        for size in args.sizes:
+            batches.append((f"{size} frames/msg", synthetic_messages(size, max(1, args.frames // size))))
+
+    rows = []
+    for name, messages in batches:
+        frames = sum(len(legacy_split(m)) for m in messages)
+        legacy = run('legacy', legacy_handle, messages, args.repeat)
+        current = run('parser', parser_handle, messages, args.repeat)
+        rows.append([name, f"{frames:,}", f"{frames / legacy:,.0f}", f"{frames / current:,.0f}",
+                     f"{legacy / current:.1f}x"])
+
+    print(tabulate(rows, headers=['Batch', 'Frames', 'Legacy frames/s', 'Parser frames/s', 'Speedup'],
+                   tablefmt='simple'))
+
+if __name__ == "__main__":
+    main()
@@ -1,133 +1,358 @@
 """TradingView WebSocket client for 5-second candles."""
 
-import websocket
+import asyncio
 import json
+import logging
 import time
-import threading
-import asyncio
-import re
-from datetime import datetime
-from typing import AsyncGenerator, Dict, Any, Optional
-from config import AUTH_TOKEN, WS_URL, SESSION_ID, SYMBOLS
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncGenerator, Dict, Any, List
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from config import (AUTH_TOKEN, WS_URL, SESSION_ID, SYMBOLS, RESOLUTIONS, HANDSHAKE_DELAY, RECONNECT_DELAY,
+                    MAX_RECONNECT_DELAY, HISTORY_PAGE_BARS, HISTORY_MAX_PAGES)
+
+logger = logging.getLogger(__name__)
 
 HEADERS = {
     "Origin": "https://www.tradingview.com",
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 }
 
-def get_payloads(session_id, symbol, auth_token):
-    """Generate WebSocket payloads."""
+# TradingView resolution -> (timeframe label used in the DB, bar length in seconds)
+RESOLUTION_TIMEFRAMES = {
+    "5S": ("5s", 5), "15S": ("15s", 15), "30S": ("30s", 30),
+    "1": ("1m", 60), "5": ("5m", 300), "15": ("15m", 900),
+    "60": ("1h", 3600), "240": ("4h", 14400), "1D": ("1d", 86400),
+}
+
+class Series:
+    """One subscribed chart series and the bar it is currently building."""
+    
+    def __init__(self, series_id, symbol_id, symbol, resolution):
+        if resolution not in RESOLUTION_TIMEFRAMES:
+            raise ValueError(f"Unsupported resolution: {resolution} (expected one of {', '.join(RESOLUTION_TIMEFRAMES)})")
+        self.series_id = series_id
+        self.symbol_id = symbol_id
+        self.symbol = symbol
+        self.resolution = resolution
+        self.timeframe, self.seconds = RESOLUTION_TIMEFRAMES[resolution]
+        self.current = None
+        # Backfill state (bar times in s): newest bar stored before this connection,
+        # newest bar emitted, oldest bar received on this connection, pages requested
+        self.resume_from = None
+        self.last_bar = None
+        self.oldest = None
+        self.pages = 0
+    
+    def reset(self):
+        """Start a new connection; history is then backfilled up to the last emitted bar."""
+        self.current = None
+        self.oldest = None
+        self.pages = 0
+        if self.last_bar is not None:
+            self.resume_from = self.last_bar
+    
+    def needs_history(self):
+        """True while history received so far does not reach back to the last stored bar."""
+        return (self.resume_from is not None and self.oldest is not None
+                and self.oldest > self.resume_from + self.seconds and self.pages < HISTORY_MAX_PAGES)
+
+def build_series(symbols, resolutions):
+    """One Series per symbol/resolution pair, keyed by series id (sds_1, sds_2, ...)."""
+    series = {}
+    for i, symbol in enumerate(symbols, 1):
+        for resolution in resolutions:
+            series_id = f"sds_{len(series) + 1}"
+            series[series_id] = Series(series_id, f"sds_sym_{i}", symbol, resolution)
+    return series
+
+def get_payloads(session_id, series, auth_token):
+    """Generate WebSocket payloads, grouped by handshake step."""
+    resolved = {}
+    for s in series.values():
+        resolved.setdefault(s.symbol_id, s.symbol)
     return {
-        'auth': json.dumps({"m": "set_auth_token", "p": [auth_token]}),
-        'session': json.dumps({"m": "chart_create_session", "p": [session_id, ""]}),
-        'resolve': json.dumps({
+        'auth': [json.dumps({"m": "set_auth_token", "p": [auth_token]})],
+        'session': [json.dumps({"m": "chart_create_session", "p": [session_id, ""]})],
+        'resolve': [json.dumps({
             "m": "resolve_symbol",
-            "p": [session_id, "sds_sym_1", 
+            "p": [session_id, symbol_id, 
                  f'={{"adjustment":"splits","currency-id":"XTVCUSDT","session":"regular","symbol":"{symbol}"}}']
-        }),
-        'series': json.dumps({
+        }) for symbol_id, symbol in resolved.items()],
+        'series': [json.dumps({
             "m": "create_series",
-            "p": [session_id, "sds_1", "s1", "sds_sym_1", "5S", 300, ""]
-        })
+            "p": [session_id, s.series_id, f"s{s.series_id[4:]}", s.symbol_id, s.resolution, 300, ""]
+        }) for s in series.values()]
     }
 
+def request_more_data(session_id, series_id, bars):
+    """Ask for `bars` more history bars before the oldest one already sent."""
+    return json.dumps({"m": "request_more_data", "p": [session_id, series_id, bars]})
+
 def wrap_message(msg: str) -> str:
     return f"~m~{len(msg)}~m~{msg}"
 
+FRAME_MARKER = "~m~"
+HEARTBEAT_PREFIX = "~h~"
+# Only these frames are JSON-decoded; everything else is skipped undecoded
+DATA_PREFIXES = ('{"m":"du"', '{"m":"timescale_update"')
+
+class FrameParser:
+    """
+    Streaming splitter for TradingView's ~m~<len>~m~<payload> framing.
+
+    Walks the buffer once by offset instead of re-slicing after every frame,
+    and keeps an incomplete trailing frame until the next websocket message
+    completes it.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+    
+    def feed(self, data: str) -> List[str]:
+        """Add raw websocket data and return every complete frame payload."""
+        buf = self._buffer + data if self._buffer else data
+        frames = []
+        pos, size = 0, len(buf)
+        
+        while pos < size:
+            if not buf.startswith(FRAME_MARKER, pos):
+                if FRAME_MARKER.startswith(buf[pos:]):
+                    break  # marker split across messages
+                # Out of sync: resume at the next marker
+                pos = buf.find(FRAME_MARKER, pos + 1)
+                if pos < 0:
+                    pos = size
+                continue
+            
+            header_end = buf.find(FRAME_MARKER, pos + 3)
+            if header_end < 0:
+                break
+            try:
+                length = int(buf[pos + 3:header_end])
+            except ValueError:
+                pos += 3
+                continue
+            
+            start = header_end + 3
+            end = start + length
+            if end > size:
+                break
+            frames.append(buf[start:end])
+            pos = end
+        
+        self._buffer = buf[pos:]
+        return frames
+    
+    def reset(self):
+        """Drop any partial frame (e.g. after a reconnect)."""
+        self._buffer = ""
+
 def split_tradingview_messages(raw):
-    messages = []
-    while raw:
-        match = re.match(r"~m~(\d+)~m~", raw)
-        if not match:
-            break
-        length = int(match.group(1))
-        start = match.end()
-        end = start + length
-        json_part = raw[start:end]
-        messages.append(json_part)
-        raw = raw[end:]
-    return messages
+    """Split one complete websocket message into frame payloads."""
+    return FrameParser().feed(raw)
 
 class TradingViewClient:
-    """TradingView WebSocket client for 5s candles."""
+    """
+    TradingView WebSocket client streaming every symbol/resolution pair over one chart session.
     
-    def __init__(self):
-        self.ws = None
-        self._queue: Optional[asyncio.Queue] = None
-        self._loop = None
-        self._current_candle = None
-        self.payloads = get_payloads(SESSION_ID, SYMBOLS[0], AUTH_TOKEN)
-
-    def _on_open(self, ws):
-        """Initialize WebSocket connection sequence."""
-        def send_sequence():
-            for delay, payload in [(0, 'auth'), (1, 'session'), (2, 'resolve'), (3, 'series')]:
-                time.sleep(delay)
-                ws.send(wrap_message(self.payloads[payload]))
-        threading.Thread(target=send_sequence, daemon=True).start()
-
-    def _on_message(self, ws, message):
-        """Process incoming WebSocket messages."""
-        for msg in split_tradingview_messages(message):
+    Connection, handshake, heartbeats and candle emission all run on the
+    caller's event loop; the connection is re-established and the series
+    re-subscribed automatically when it drops.
+    """
+    
+    def __init__(self, symbols=SYMBOLS, resolutions=RESOLUTIONS):
+        self._parser = FrameParser()
+        self.series = build_series(symbols, resolutions)
+        self.payloads = get_payloads(SESSION_ID, self.series, AUTH_TOKEN)
+        # Seconds from bar close to emission, and from frame receipt to emission
+        self.close_lag = deque(maxlen=1000)
+        self.process_lag = deque(maxlen=1000)
+
+    async def _handshake(self, ws):
+        """Send the auth/session/resolve/series sequence, pausing between steps."""
+        for step in ('auth', 'session', 'resolve', 'series'):
+            for payload in self.payloads[step]:
+                await ws.send(wrap_message(payload))
+            await asyncio.sleep(HANDSHAKE_DELAY)
+
+    @staticmethod
+    def _handshake_error(handshake):
+        """The exception a finished handshake task raised, or None (also marks it retrieved)."""
+        if handshake is None or not handshake.done() or handshake.cancelled():
+            return None
+        return handshake.exception()
+
+    def _handle_message(self, message, received):
+        """
+        Split one websocket message into completed live candles, history
+        candles, and payloads to send back (heartbeat echoes and history
+        page requests).
+        """
+        live, history, replies = [], [], []
+        for frame in self._parser.feed(message):
             try:
-                if not msg.strip():
-                    continue
-                    
                 # Handle heartbeat
-                if re.match(r"^~h~\d+$", msg):
-                    ws.send(f"~m~{len(msg)}~m~{msg}")
+                if frame.startswith(HEARTBEAT_PREFIX):
+                    replies.append(frame)
                     continue
                 
                 # Process candle data
-                data = json.loads(msg)
-                if data.get("m") == "du" and len(data.get("p", [])) > 1:
-                    self._process_candle_data(data["p"][1])
-            except Exception:
-                pass
+                if frame.startswith(DATA_PREFIXES):
+                    data = json.loads(frame)
+                    if len(data.get("p", [])) < 2:
+                        continue
+                    if data.get("m") == "du":
+                        live.extend(self._process_candle_data(data["p"][1]))
+                    elif data.get("m") == "timescale_update":
+                        history.extend(self._process_history(data["p"][1], replies))
+            except Exception as e:
+                logger.debug(f"Bad frame skipped: {e}")
+        
+        now = time.time()
+        for candle in live:
+            self.close_lag.append(now - candle["time"].timestamp() - self.series[candle["series"]].seconds)
+            self.process_lag.append(time.perf_counter() - received)
+        return live, history, replies
+
+    def _candle(self, series, ohlcv, history=False):
+        candle = {
+            "series": series.series_id,
+            "symbol": series.symbol,
+            "timeframe": series.timeframe,
+            "time": datetime.fromtimestamp(ohlcv[0], timezone.utc),
+            "open": ohlcv[1],
+            "high": ohlcv[2],
+            "low": ohlcv[3],
+            "close": ohlcv[4],
+            "volume": ohlcv[5]
+        }
+        if history:
+            candle["history"] = True
+        if series.last_bar is None or ohlcv[0] > series.last_bar:
+            series.last_bar = int(ohlcv[0])
+        return candle
 
     def _process_candle_data(self, data):
-        """Extract and queue candle data."""
-        sds_data = data.get("sds_1", {}).get("s", [])
-        for bar in sds_data:
-            ohlcv = bar["v"]
-            candle_time = int(ohlcv[0])
+        """Extract completed candles for every subscribed series in a du payload."""
+        completed = []
+        for series_id, update in data.items():
+            series = self.series.get(series_id)
+            if series is None:
+                continue
+            for bar in update.get("s", []):
+                ohlcv = bar["v"]
+                candle_time = int(ohlcv[0])
+                
+                # Emit previous candle when new one arrives
+                if series.current and candle_time != series.current[0]:
+                    completed.append(self._candle(series, series.current))
+                
+                series.current = ohlcv
+        return completed
+
+    def _process_history(self, data, replies):
+        """
+        Extract closed bars from a timescale_update (the snapshot sent after
+        create_series, or a page answering request_more_data).
+        
+        The newest snapshot bar is still forming and becomes the series'
+        current bar. While the history does not reach back to the last stored
+        bar, another page request is appended to replies.
+        """
+        candles = []
+        for series_id, update in data.items():
+            series = self.series.get(series_id)
+            if series is None:
+                continue
+            bars = sorted((bar["v"] for bar in update.get("s", [])), key=lambda v: v[0])
+            if not bars:
+                # Nothing older is available
+                series.pages = HISTORY_MAX_PAGES
+                continue
+            if series.current is None:
+                series.current = bars.pop()
             
-            # Emit previous candle when new one arrives
-            if self._current_candle and candle_time != self._current_candle[0]:
-                candle = {
-                    "time": datetime.utcfromtimestamp(self._current_candle[0]),
-                    "open": self._current_candle[1],
-                    "high": self._current_candle[2],
-                    "low": self._current_candle[3],
-                    "close": self._current_candle[4],
-                    "volume": self._current_candle[5]
-                }
-                if self._queue:
-                    asyncio.run_coroutine_threadsafe(self._queue.put(candle), self._loop)
+            oldest = int(bars[0][0]) if bars else series.current[0]
+            if series.oldest is not None and oldest >= series.oldest:
+                series.pages = HISTORY_MAX_PAGES  # page added nothing older
+            series.oldest = oldest if series.oldest is None else min(series.oldest, oldest)
             
-            self._current_candle = ohlcv
-
-    def _run_ws(self):
-        """Run WebSocket connection."""
-        self.ws = websocket.WebSocketApp(
-            WS_URL,
-            header=[f"{k}: {v}" for k, v in HEADERS.items()],
-            on_open=self._on_open,
-            on_message=self._on_message,
-            on_error=lambda ws, error: None,
-            on_close=lambda ws, status, msg: None
-        )
-        self.ws.run_forever()
+            candles.extend(self._candle(series, bar, history=True) for bar in bars
+                           if bar[0] < series.current[0])
+            if series.needs_history():
+                series.pages += 1
+                replies.append(request_more_data(SESSION_ID, series_id, HISTORY_PAGE_BARS))
+                logger.info(f"{series.symbol} {series.timeframe}: requesting {HISTORY_PAGE_BARS} more bars "
+                            f"(history starts {datetime.fromtimestamp(series.oldest, timezone.utc)}, "
+                            f"last stored {datetime.fromtimestamp(series.resume_from, timezone.utc)})")
+        return candles
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Median and p99 of bar-close-to-emit and receive-to-emit latency, in ms."""
+        stats = {}
+        for name, samples in (('close', self.close_lag), ('process', self.process_lag)):
+            if samples:
+                ordered = sorted(samples)
+                stats[f'{name}_p50_ms'] = ordered[len(ordered) // 2] * 1000
+                stats[f'{name}_p99_ms'] = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        return stats
+
+    def set_resume_point(self, symbol, timeframe, timestamp_ms):
+        """Newest bar already stored for a series; history is paged back until it is reached."""
+        for series in self.series.values():
+            if series.symbol == symbol and series.timeframe == timeframe and timestamp_ms:
+                series.resume_from = timestamp_ms // 1000
 
     async def candle_generator(self) -> AsyncGenerator[Dict[str, Any], None]:
-        """Async generator yielding 5s candles."""
-        self._queue = asyncio.Queue()
-        self._loop = asyncio.get_event_loop()
-        threading.Thread(target=self._run_ws, daemon=True).start()
+        """Async generator yielding completed candles one at a time, history included."""
+        async for candles in self.batch_generator():
+            for candle in candles:
+                yield candle
+
+    async def batch_generator(self) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """
+        Async generator yielding lists of completed candles, reconnecting as needed.
         
-        try:
-            while True:
-                yield await self._queue.get()
-        finally:
-            if self.ws:
-                self.ws.close() 
\ No newline at end of file
+        Each history snapshot or page arrives as one list with "history": True
+        on every candle; live candles arrive as the list completed by one message.
+        """
+        attempt = 0
+        while True:
+            handshake = None
+            try:
+                async with connect(WS_URL, origin=HEADERS["Origin"], user_agent_header=HEADERS["User-Agent"],
+                                   ping_interval=None, max_size=None) as ws:
+                    logger.info(f"Connected to {WS_URL}")
+                    self._parser.reset()
+                    for series in self.series.values():
+                        series.reset()
+                    handshake = asyncio.create_task(self._handshake(ws))
+                    # Without a session nothing arrives: a failed handshake closes the socket to end the loop
+                    handshake.add_done_callback(
+                        lambda task: self._handshake_error(task) and asyncio.ensure_future(ws.close()))
+                    
+                    async for message in ws:
+                        attempt = 0
+                        live, history, replies = self._handle_message(message, time.perf_counter())
+                        # Candles first, so a send failing on a closed socket never drops them
+                        if history:
+                            yield history
+                        if live:
+                            yield live
+                        for payload in replies:
+                            await ws.send(wrap_message(payload))
+                error = self._handshake_error(handshake)
+                reason = f"handshake failed: {error!r}" if error else "closed by server"
+            except (ConnectionClosed, InvalidHandshake, OSError, asyncio.TimeoutError) as e:
+                error = self._handshake_error(handshake)
+                reason = f"handshake failed: {error!r}" if error else str(e)
+            finally:
+                if handshake:
+                    handshake.cancel()
+            
+            attempt += 1
+            delay = min(RECONNECT_DELAY * attempt, MAX_RECONNECT_DELAY)
+            logger.warning(f"Connection lost ({reason}); reconnecting in {delay}s")
+            await asyncio.sleep(delay)
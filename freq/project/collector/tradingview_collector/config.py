@@ -12,17 +12,40 @@ os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
 # Database
+STORAGE_BACKEND = "sqlite"  # "sqlite" or "duckdb" (see ../storage.py)
+# duckdb allows one read-write process per file: the collector opens it per write batch and
+# viewer.py / reconcile.py open it read-only per query, each waiting while the other holds it
 DB_PATH = os.path.join(DATA_DIR, "candles.db")
+# "table": rows + background retention deletes; "ring": fixed RETENTION_HOURS of 5s slots
+# per symbol, overwritten in place (no deletes, no vacuum, constant file size)
+STORAGE_MODE = "table"
 
 # Collection settings
 SYMBOLS = ["BINANCE:ETHUSDT.P"]
-RETENTION_HOURS = 3
-PRUNE_INTERVAL_MINUTES = 10
+RESOLUTIONS = ["5S"]  # Series per symbol ("5S", "1", "60", "1D", ...); 5S goes to candles, others to candle_pyramid
+RETENTION_HOURS = 3  # 5s candles
+PYRAMID_RETENTION_BARS = 5000  # Newest bars kept per symbol for each other resolution (1h: ~7 months, 1D: ~13 years)
+PRUNE_INTERVAL_MINUTES = 10  # Background maintenance pass interval
+MAINTENANCE_TIME_BUDGET = 0.2  # Max seconds per maintenance step
+
+# Background writer
+WRITE_BATCH_SIZE = 100  # Commit once this many candles are queued...
+WRITE_FLUSH_MS = 500  # ...or this long after the oldest queued candle
+WRITE_QUEUE_SIZE = 10000  # Consumer waits only when this many put_batch groups (a live candle or one
+                          # history snapshot) are pending
+WRITE_RETRIES = 3  # Extra attempts for a failed commit (e.g. "database is locked") before dropping it
+WRITE_RETRY_DELAY_MS = 200  # Before the first retry, multiplied by the attempt number
+STATS_LOG_INTERVAL = 300  # Seconds between writer/latency stats log lines
 
 # TradingView WebSocket
 AUTH_TOKEN = "eyJhbGciOiJSUzUxMiIsImtpZCI6IkdaeFUiLCJ0eXAiOiJKV1QifQ.eyJ1c2VyX2lkIjoxMTI1NzU4MTIsImV4cCI6MTc1NDc1OTE5NywiaWF0IjoxNzU0NzQ0Nzk3LCJwbGFuIjoicHJvX3ByZW1pdW1fdHJpYWwiLCJwcm9zdGF0dXMiOiJub25fcHJvIiwiZXh0X2hvdXJzIjoxLCJwZXJtIjoiIiwic3R1ZHlfcGVybSI6InR2LWNoYXJ0cGF0dGVybnMsdHYtcHJvc3R1ZGllcyx0di1jaGFydF9wYXR0ZXJucyx0di12b2x1bWVieXByaWNlIiwibWF4X3N0dWRpZXMiOjI1LCJtYXhfZnVuZGFtZW50YWxzIjoxMCwibWF4X2NoYXJ0cyI6OCwibWF4X2FjdGl2ZV9hbGVydHMiOjQwMCwibWF4X3N0dWR5X29uX3N0dWR5IjoyNCwiZmllbGRzX3Blcm1pc3Npb25zIjpbInJlZmJvbmRzIl0sIm1heF9hbGVydF9jb25kaXRpb25zIjo1LCJtYXhfb3ZlcmFsbF9hbGVydHMiOjIwMDAsIm1heF9vdmVyYWxsX3dhdGNobGlzdF9hbGVydHMiOjUsIm1heF9hY3RpdmVfcHJpbWl0aXZlX2FsZXJ0cyI6NDAwLCJtYXhfYWN0aXZlX2NvbXBsZXhfYWxlcnRzIjo0MDAsIm1heF9hY3RpdmVfd2F0Y2hsaXN0X2FsZXJ0cyI6MiwibWF4X2Nvbm5lY3Rpb25zIjo1MH0.A-gA-YrLgEoIFSqdBj_bzCRlaxH2XPQ7UdAu0kpg5Sl_NJc-X4JWKbDcUiTijP0ex0h_BwAcA1t2YOhy8A0blzolzXJCU1XaO0OxHrLYtCK1U_NASf_pIujk1MdZzaY3BlFbK7DqYxhi_8Xlyds_z9zz8WcAf00zSJCgF801628"
 WS_URL = "wss://prodata.tradingview.com/socket.io/websocket"
 SESSION_ID = "cs_UnjWX3itlj5J"
+HANDSHAKE_DELAY = 1  # Seconds between handshake messages
+RECONNECT_DELAY = 5  # Seconds, multiplied by the attempt number
+MAX_RECONNECT_DELAY = 60
+HISTORY_PAGE_BARS = 1000  # Bars per request_more_data when backfilling a gap
+HISTORY_MAX_PAGES = 20  # Per series and connection
 
 # Logging
 LOG_LEVEL = "INFO"
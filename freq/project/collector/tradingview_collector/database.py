@@ -2,61 +2,112 @@
 """Database module for TradingView 5s candle storage."""
 
 import logging
-import sqlite3
 import pandas as pd
 from datetime import datetime
 import os
-from contextlib import contextmanager
-from config import DB_PATH, DATA_DIR
+import sys
+import time
+from config import DB_PATH, DATA_DIR, STORAGE_BACKEND, STORAGE_MODE, RETENTION_HOURS
+
+# Shared collector modules live one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from maintenance import RetentionRule
+from storage import open_store, CANDLE_COLUMNS, PYRAMID_COLUMNS, RING_COLUMNS
 
 logger = logging.getLogger(__name__)
 os.makedirs(DATA_DIR, exist_ok=True)
 
+BASE_TIMEFRAME = "5s"
+CANDLE_INTERVAL_MS = 5000
+
+# Only overwrite a slot with a candle at least as new as the one it holds
+RING_UPDATE = (
+    'UPDATE candle_ring SET timestamp = ?, datetime = ?, open = ?, high = ?, low = ?, close = ?, volume = ? '
+    'WHERE symbol = ? AND slot = ? AND timestamp <= ?'
+)
+# Same width as a real datetime string so overwrites never change the row size
+EMPTY_SLOT = (-1, '1970-01-01 00:00:00.000000', 0.0, 0.0, 0.0, 0.0, 0.0)
+
 class Database:
-    """Lightweight database manager for 5-second candles."""
+    """
+    Lightweight database manager for 5-second candles.
+    
+    5s bars live in `candles`; bars streamed at any other resolution go to
+    `candle_pyramid` keyed by (symbol, timeframe, timestamp).
+    
+    With mode="ring" the 5s bars instead go to `candle_ring`: a fixed block of
+    retention / 5s slots per symbol, preallocated once, where a candle
+    overwrites slot `timestamp // 5000 % N` in place. The file never grows,
+    needs no retention deletes, and a time window maps to one slot range.
+    
+    read_only and prepare are as for the ccxt MarketDatabase: readers
+    (viewer.py) never write, only the collector's startup prepares the file.
+    """
+    
+    def __init__(self, db_path=DB_PATH, backend=STORAGE_BACKEND, persistent=False, mode=STORAGE_MODE,
+                 retention_hours=RETENTION_HOURS, read_only=False, prepare=False):
+        if mode not in ('table', 'ring'):
+            raise ValueError(f"Unknown storage mode: {mode} (expected 'table' or 'ring')")
+        self.store = open_store(backend, db_path, persistent=persistent, read_only=read_only)
+        self.db_path = self.store.path
+        self.ring = mode == 'ring'
+        self.ring_slots = int(retention_hours * 3600 * 1000 // CANDLE_INTERVAL_MS)
+        self._ring_symbols = set()
+        if not read_only:
+            self.store.create_tables('candle_ring' if self.ring else 'candles', 'candle_pyramid', prepare=prepare)
+            if self.ring:
+                self._check_ring_sizes()
+        logger.info(f"Database initialized: {self.db_path} ({backend}, {mode})")
+    
+    @property
+    def candle_source(self):
+        """FROM clause for 5s candles with the storage mode's columns (symbol, timestamp, OHLCV...)."""
+        if self.ring:
+            return '(SELECT * FROM candle_ring WHERE timestamp >= 0) AS candles'
+        return 'candles'
+    
+    def _check_ring_sizes(self):
+        """Re-slot symbols whose ring was allocated for a different retention."""
+        for symbol, count in self.store.query('SELECT symbol, COUNT(*) FROM candle_ring GROUP BY symbol'):
+            if count == self.ring_slots:
+                self._ring_symbols.add(symbol)
+                continue
+            logger.info(f"Resizing ring for {symbol}: {count} -> {self.ring_slots} slots")
+            live = self.store.query('SELECT timestamp, datetime, open, high, low, close, volume FROM candle_ring '
+                                    'WHERE symbol = ? AND timestamp >= 0 ORDER BY timestamp', (symbol,))
+            self.store.execute('DELETE FROM candle_ring WHERE symbol = ?', (symbol,))
+            self._ensure_ring([symbol])
+            self._write_ring([(symbol, *row) for row in live])
     
-    def __init__(self, db_path=DB_PATH):
-        self.db_path = db_path
-        self._create_tables()
-        logger.info(f"Database initialized: {self.db_path}")
+    def _ensure_ring(self, symbols):
+        """Preallocate the slot block for symbols seen for the first time."""
+        for symbol in set(symbols) - self._ring_symbols:
+            self.store.upsert('candle_ring', RING_COLUMNS,
+                              [(symbol, slot, *EMPTY_SLOT) for slot in range(self.ring_slots)],
+                              on_conflict='ignore')
+            self._ring_symbols.add(symbol)
+    
+    def _write_ring(self, rows):
+        """Overwrite the slots for (symbol, timestamp, datetime, o, h, l, c, v) rows."""
+        self._ensure_ring(row[0] for row in rows)
+        return self.store.executemany(RING_UPDATE, [
+            (*row[1:], row[0], row[1] // CANDLE_INTERVAL_MS % self.ring_slots, row[1]) for row in rows
+        ])
 
-    @contextmanager
     def get_connection(self):
-        """Database connection context manager."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
-
-    def _create_tables(self):
-        """Create candles table and index."""
-        with self.get_connection() as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS candles (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    timestamp INTEGER NOT NULL,
-                    datetime TEXT NOT NULL,
-                    open REAL NOT NULL,
-                    high REAL NOT NULL,
-                    low REAL NOT NULL,
-                    close REAL NOT NULL,
-                    volume REAL NOT NULL,
-                    UNIQUE(timestamp, symbol)
-                )
-            ''')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_candles_ts_symbol ON candles (timestamp, symbol)')
-    
-    def _format_candle_data(self, candle, symbol):
+        """Raw connection context manager for the configured backend."""
+        return self.store.connection()
+    
+    def _format_candle_data(self, candle, symbol, timeframe=BASE_TIMEFRAME):
         """Convert candle array to database format."""
         timestamp = int(candle[0])
+        if timeframe != BASE_TIMEFRAME:
+            return (symbol, timeframe, timestamp, *[float(x) for x in candle[1:6]])
         datetime_str = pd.to_datetime(timestamp, unit='ms').strftime('%Y-%m-%d %H:%M:%S.%f')
         return (symbol, timestamp, datetime_str, *[float(x) for x in candle[1:6]])
     
-    def insert_candles(self, candles, symbol):
-        """Insert candles (single candle or list)."""
+    def insert_candles(self, candles, symbol, timeframe=BASE_TIMEFRAME):
+        """Insert candles (single candle or list) for one symbol and timeframe."""
         if not candles:
             return 0
         
@@ -64,33 +115,64 @@ class Database:
         if not isinstance(candles[0], (list, tuple)):
             candles = [candles]
             
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            inserted = 0
-            for candle in candles:
-                try:
-                    data = self._format_candle_data(candle, symbol)
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO candles 
-                        (symbol, timestamp, datetime, open, high, low, close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', data)
-                    inserted += cursor.rowcount
-                except Exception as e:
-                    logger.error(f"Error inserting candle for {symbol}: {e}")
-            conn.commit()
-            return inserted
-    
-    def get_latest_timestamp(self, symbol):
+        rows = []
+        for candle in candles:
+            try:
+                rows.append(self._format_candle_data(candle, symbol, timeframe))
+            except Exception as e:
+                logger.error(f"Error inserting candle for {symbol} {timeframe}: {e}")
+        if timeframe != BASE_TIMEFRAME:
+            return self.store.upsert('candle_pyramid', PYRAMID_COLUMNS, rows)
+        if self.ring:
+            return self._write_ring(rows)
+        return self.store.upsert('candles', CANDLE_COLUMNS, rows)
+    
+    def insert_candle_batch(self, candles):
+        """
+        Insert candle dicts from TradingViewClient (any mix of symbols and
+        timeframes) in one transaction; returns rows written. In ring mode the
+        5s candles are written in their own transaction.
+        """
+        batches = {}
+        for candle in candles:
+            timeframe = candle["timeframe"]
+            row = [int(candle["time"].timestamp() * 1000), candle["open"], candle["high"],
+                   candle["low"], candle["close"], candle["volume"]]
+            batches.setdefault(timeframe, []).append(self._format_candle_data(row, candle["symbol"], timeframe))
+        written = 0
+        if self.ring and BASE_TIMEFRAME in batches:
+            written += self._write_ring(batches.pop(BASE_TIMEFRAME))
+        return written + self.store.upsert_many([
+            ('candles', CANDLE_COLUMNS, rows) if timeframe == BASE_TIMEFRAME
+            else ('candle_pyramid', PYRAMID_COLUMNS, rows)
+            for timeframe, rows in batches.items()
+        ])
+    
+    def _table_filter(self, symbol, timeframe):
+        """Table name, WHERE clause and params selecting one symbol/timeframe."""
+        if timeframe != BASE_TIMEFRAME:
+            return 'candle_pyramid', 'symbol = ? AND timeframe = ?', [symbol, timeframe]
+        if self.ring:
+            return 'candle_ring', 'symbol = ? AND timestamp >= 0', [symbol]
+        return 'candles', 'symbol = ?', [symbol]
+    
+    def get_latest_timestamp(self, symbol, timeframe=BASE_TIMEFRAME):
         """Get latest candle timestamp."""
-        with self.get_connection() as conn:
-            result = conn.execute('SELECT MAX(timestamp) FROM candles WHERE symbol = ?', (symbol,)).fetchone()
-            return result[0] or 0
+        table, where, params = self._table_filter(symbol, timeframe)
+        rows = self.store.query(f'SELECT MAX(timestamp) FROM {table} WHERE {where}', params)
+        return rows[0][0] or 0
     
-    def get_candles(self, symbol, start_time=None, end_time=None, limit=None):
+    def get_candles(self, symbol, start_time=None, end_time=None, limit=None, timeframe=BASE_TIMEFRAME):
         """Get candles with optional filtering."""
-        query = 'SELECT * FROM candles WHERE symbol = ?'
-        params = [symbol]
+        table, where, params = self._table_filter(symbol, timeframe)
+        query = f'SELECT * FROM {table} WHERE {where}'
+        if self.ring and table == 'candle_ring' and start_time and end_time \
+                and end_time - start_time < self.ring_slots * CANDLE_INTERVAL_MS:
+            # The window is one slot range, or two when it wraps past slot N-1
+            first = start_time // CANDLE_INTERVAL_MS % self.ring_slots
+            last = end_time // CANDLE_INTERVAL_MS % self.ring_slots
+            query += ' AND slot BETWEEN ? AND ?' if first <= last else ' AND (slot >= ? OR slot <= ?)'
+            params += [first, last]
         if start_time:
             query += ' AND timestamp >= ?'
             params.append(start_time)
@@ -101,27 +183,39 @@ class Database:
         if limit:
             query += ' LIMIT ?'
             params.append(limit)
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn, params=params)
+        return self.store.read_frame(query, params)
     
     def prune_old_data(self, symbol, cutoff_timestamp):
-        """Remove old candle data, return deleted count."""
+        """Remove old candle data, return deleted count (ring slots are simply overwritten)."""
+        if self.ring:
+            return 0
         try:
-            with self.get_connection() as conn:
-                cursor = conn.execute('DELETE FROM candles WHERE symbol = ? AND timestamp < ?',
-                                    (symbol, cutoff_timestamp))
-                return cursor.rowcount
+            return self.store.execute('DELETE FROM candles WHERE symbol = ? AND timestamp < ?',
+                                      (symbol, cutoff_timestamp))
         except Exception as e:
             logger.error(f"Pruning error for {symbol}: {e}")
             return 0
     
+    def register_maintenance(self, scheduler, retention_ms, pyramid_retention_ms=None):
+        """
+        Register with a MaintenanceScheduler, keeping 5s candles newer than
+        retention_ms and candle_pyramid bars of each timeframe newer than
+        pyramid_retention_ms[timeframe]. Timeframes not listed are kept.
+        """
+        rules = []
+        if not self.ring:
+            rules.append(RetentionRule('candles', lambda: int(time.time() * 1000) - retention_ms))
+        for timeframe, keep_ms in (pyramid_retention_ms or {}).items():
+            rules.append(RetentionRule('candle_pyramid', lambda keep_ms=keep_ms: int(time.time() * 1000) - keep_ms,
+                                       where='timeframe = ?', params=(timeframe,)))
+        return scheduler.register_store(self.store, rules)
+    
     def optimize_database(self):
-        """Optimize database and return stats."""
+        """Full VACUUM/ANALYZE (blocks writers; offline use only) and return stats."""
         try:
-            with self.get_connection() as conn:
-                conn.execute('VACUUM')
-                conn.execute('ANALYZE')
-                count = conn.execute("SELECT COUNT(*) FROM candles").fetchone()[0]
+            self.store.execute('VACUUM')
+            self.store.execute('ANALYZE')
+            count = self.store.query(f"SELECT COUNT(*) FROM {self.candle_source}")[0][0]
             logger.info(f"Database optimized: {count:,} candles")
             return True
         except Exception as e:
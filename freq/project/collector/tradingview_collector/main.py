@@ -3,10 +3,13 @@
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import time
 from client import TradingViewClient
-from database import Database
-from config import SYMBOLS, LOG_LEVEL, LOG_FILE, RETENTION_HOURS, PRUNE_INTERVAL_MINUTES
+from database import Database, BASE_TIMEFRAME
+from writer import CandleWriter
+from maintenance import MaintenanceScheduler
+from config import (SYMBOLS, RESOLUTIONS, LOG_LEVEL, LOG_FILE, RETENTION_HOURS, PYRAMID_RETENTION_BARS,
+                    PRUNE_INTERVAL_MINUTES, MAINTENANCE_TIME_BUDGET, STATS_LOG_INTERVAL, STORAGE_BACKEND)
 
 # Setup logging
 logging.basicConfig(level=getattr(logging, LOG_LEVEL), 
@@ -15,44 +18,61 @@ logging.basicConfig(level=getattr(logging, LOG_LEVEL),
 logger = logging.getLogger('collector')
 
 class Collector:
-    """Manages candle collection and data retention."""
+    """
+    Manages candle collection. Candles are handed to a background CandleWriter;
+    retention runs in the background maintenance scheduler.
+    """
     
     def __init__(self):
-        self.db = Database()
+        # A persistent DuckDB connection would lock viewer.py and reconcile.py out of the file
+        self.db = Database(persistent=STORAGE_BACKEND == 'sqlite', prepare=True)
         self.client = TradingViewClient()
-        self.last_prune = datetime.now()
-        
-    async def prune_if_needed(self, symbol):
-        """Prune old data if interval elapsed."""
-        if (datetime.now() - self.last_prune).seconds < PRUNE_INTERVAL_MINUTES * 60:
-            return
-            
-        cutoff_ms = int((datetime.now() - timedelta(hours=RETENTION_HOURS)).timestamp() * 1000)
-        deleted = self.db.prune_old_data(symbol, cutoff_ms)
-        
-        if deleted > 0:
-            logger.info(f"Pruned {deleted} candles older than {RETENTION_HOURS}h")
-        self.db.optimize_database()
-        self.last_prune = datetime.now()
+        self.maintenance = self.db.register_maintenance(
+            MaintenanceScheduler(interval=PRUNE_INTERVAL_MINUTES * 60, time_budget=MAINTENANCE_TIME_BUDGET),
+            retention_ms=RETENTION_HOURS * 3600 * 1000,
+            pyramid_retention_ms={series.timeframe: PYRAMID_RETENTION_BARS * series.seconds * 1000
+                                  for series in self.client.series.values() if series.timeframe != BASE_TIMEFRAME}
+        )
+        # Page history back to where the last run stopped
+        for series in self.client.series.values():
+            self.client.set_resume_point(series.symbol, series.timeframe,
+                                         self.db.get_latest_timestamp(series.symbol, series.timeframe))
     
     async def collect(self):
         """Main collection loop."""
-        symbol = SYMBOLS[0]
-        logger.info(f"Starting collection for {symbol} (retention: {RETENTION_HOURS}h)")
+        logger.info(f"Starting collection for {', '.join(SYMBOLS)} at {', '.join(RESOLUTIONS)} "
+                    f"({len(self.client.series)} series, retention: {RETENTION_HOURS}h)")
+        self.maintenance.start()
+        writer = CandleWriter(self.db).start()
+        last_stats = time.monotonic()
         
-        async for candle in self.client.candle_generator():
-            # Convert to DB format
-            ts_ms = int(candle["time"].timestamp() * 1000)
-            db_row = [ts_ms, candle["open"], candle["high"], candle["low"], 
-                     candle["close"], candle["volume"]]
-            
-            # Save and log
-            self.db.insert_candles(db_row, symbol)
-            logger.info(f"{candle['time'].strftime('%H:%M:%S')} "
-                       f"OHLCV: {candle['open']:.4f}/{candle['high']:.4f}/"
-                       f"{candle['low']:.4f}/{candle['close']:.4f}/{candle['volume']:.2f}")
-            
-            await self.prune_if_needed(symbol)
+        try:
+            async for candles in self.client.batch_generator():
+                # Queue and log
+                await writer.put_batch(candles)
+                if candles[0].get("history"):
+                    times = [candle['time'] for candle in candles]
+                    logger.info(f"History: {len(candles)} candles {min(times):%Y-%m-%d %H:%M:%S} - "
+                                f"{max(times):%Y-%m-%d %H:%M:%S}")
+                else:
+                    for candle in candles:
+                        logger.info(f"{candle['symbol']} {candle['timeframe']} {candle['time'].strftime('%H:%M:%S')} "
+                                   f"OHLCV: {candle['open']:.4f}/{candle['high']:.4f}/"
+                                   f"{candle['low']:.4f}/{candle['close']:.4f}/{candle['volume']:.2f}")
+                
+                if time.monotonic() - last_stats >= STATS_LOG_INTERVAL:
+                    last_stats = time.monotonic()
+                    self.log_stats(writer)
+        finally:
+            await writer.stop()
+            self.log_stats(writer)
+            self.maintenance.stop()
+            self.db.store.close()
+    
+    def log_stats(self, writer):
+        stats = {**writer.stats(), **self.client.latency_stats()}
+        logger.info("Stats: " + ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                          for k, v in stats.items()))
 
 async def main():
     collector = Collector()
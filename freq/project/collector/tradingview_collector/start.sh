@@ -6,8 +6,8 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 SESSION="collector"
 
 # Install deps if needed
-$PYTHON -c "import websocket, pandas, tabulate" 2>/dev/null || \
-    $PYTHON -m pip install -q websocket-client pandas tabulate
+$PYTHON -c "import websockets, pandas, tabulate" 2>/dev/null || \
+    $PYTHON -m pip install -q websockets pandas tabulate
 
 # Start collector
 mkdir -p "$SCRIPT_DIR/data/logs"
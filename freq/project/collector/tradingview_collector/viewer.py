@@ -11,52 +11,46 @@ class Viewer:
     """Candle data viewer."""
     
     def __init__(self):
-        self.db = Database()
+        self.db = Database(read_only=True)
     
     def get_stats(self, symbol: str) -> dict:
         """Get comprehensive symbol statistics."""
         try:
-            with self.db.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Single query for all stats
-                hour_ago = int((datetime.now() - timedelta(hours=1)).timestamp() * 1000)
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN timestamp > ? THEN 1 ELSE 0 END) as recent,
-                        MIN(timestamp) as min_ts, MAX(timestamp) as max_ts,
-                        AVG(close) as avg_price, MIN(low) as min_price, 
-                        MAX(high) as max_price, SUM(volume) as total_vol
-                    FROM candles WHERE symbol = ?
-                """, (hour_ago, symbol))
-                
-                row = cursor.fetchone()
-                return {
-                    'symbol': symbol,
-                    'total': row[0],
-                    'recent': row[1], 
-                    'last_time': datetime.fromtimestamp(row[3]/1000) if row[3] else None,
-                    'avg_price': row[4],
-                    'price_range': f"{row[5]:.4f}-{row[6]:.4f}" if row[5] else "N/A",
-                    'total_volume': row[7]
-                }
+            # Single query for all stats
+            hour_ago = int((datetime.now() - timedelta(hours=1)).timestamp() * 1000)
+            row = self.db.store.query(f"""
+                SELECT 
+                    COUNT(*) as total,
+                    SUM(CASE WHEN timestamp > ? THEN 1 ELSE 0 END) as recent,
+                    MIN(timestamp) as min_ts, MAX(timestamp) as max_ts,
+                    AVG(close) as avg_price, MIN(low) as min_price, 
+                    MAX(high) as max_price, SUM(volume) as total_vol
+                FROM {self.db.candle_source} WHERE symbol = ?
+            """, (hour_ago, symbol))[0]
+            return {
+                'symbol': symbol,
+                'total': row[0],
+                'recent': row[1], 
+                'last_time': datetime.fromtimestamp(row[3]/1000) if row[3] else None,
+                'avg_price': row[4],
+                'price_range': f"{row[5]:.4f}-{row[6]:.4f}" if row[5] else "N/A",
+                'total_volume': row[7]
+            }
         except Exception as e:
             return {'symbol': symbol, 'error': str(e)}
     
     def get_recent_candles(self, symbol: str, count: int = 20) -> pd.DataFrame:
         """Get recent candles."""
         try:
-            with self.db.get_connection() as conn:
-                df = pd.read_sql_query("""
-                    SELECT timestamp, open, high, low, close, volume 
-                    FROM candles WHERE symbol = ? ORDER BY timestamp DESC LIMIT ?
-                """, conn, params=(symbol, count))
-                
-                if not df.empty:
-                    df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-                    df = df.sort_values('timestamp').reset_index(drop=True)
-                return df
+            df = self.db.store.read_frame(f"""
+                SELECT timestamp, open, high, low, close, volume 
+                FROM {self.db.candle_source} WHERE symbol = ? ORDER BY timestamp DESC LIMIT ?
+            """, (symbol, count))
+            
+            if not df.empty:
+                df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+                df = df.sort_values('timestamp').reset_index(drop=True)
+            return df
         except Exception:
             return pd.DataFrame()
     
@@ -91,12 +85,10 @@ class Viewer:
             print(f"No data for {symbol}\n")
             return
         
-        # Show only essential columns
-        data = [[
-            row['datetime'].strftime('%H:%M:%S'),
-            f"{row['close']:.4f}",
-            f"{row['volume']:.1f}"
-        ] for _, row in df.iterrows()]
+        # Show only essential columns, formatted column-wise
+        data = list(zip(df['datetime'].dt.strftime('%H:%M:%S'),
+                        df['close'].map('{:.4f}'.format),
+                        df['volume'].map('{:.1f}'.format)))
         
         print(f"=== {symbol} - Last {count} Candles ===")
         print(tabulate(data, headers=['Time', 'Close', 'Vol'], tablefmt='simple'))
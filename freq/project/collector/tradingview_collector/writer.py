@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Background candle writer with group commit."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import WRITE_BATCH_SIZE, WRITE_FLUSH_MS, WRITE_QUEUE_SIZE, WRITE_RETRIES, WRITE_RETRY_DELAY_MS
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+class CandleWriter:
+    """
+    Buffers candles from the websocket consumer in a bounded queue and
+    commits them in groups of up to batch_size, or every flush_ms, whichever
+    comes first. A list queued with put_batch is never split across commits.
+    queue_size bounds the number of queued groups, not candles.
+    
+    A failed commit is retried up to `retries` times, waiting retry_delay_ms
+    times the attempt number in between, before the group is counted as an
+    error and dropped.
+    
+    Writes run on one dedicated thread so the event loop never waits on disk
+    and the Database can keep a single persistent connection.
+    """
+    
+    def __init__(self, db, batch_size=WRITE_BATCH_SIZE, flush_ms=WRITE_FLUSH_MS, queue_size=WRITE_QUEUE_SIZE,
+                 retries=WRITE_RETRIES, retry_delay_ms=WRITE_RETRY_DELAY_MS):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.retries = retries
+        self.retry_delay = retry_delay_ms / 1000
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='candle-writer')
+        self._task = None
+        
+        # Metrics
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.retried = 0  # commits that failed and were attempted again
+        self.backpressure = 0  # put() calls that found the queue full
+        self.max_depth = 0
+        self.commit_ms = deque(maxlen=1000)
+        self.wait_ms = deque(maxlen=1000)  # enqueue-to-commit time of each batch's oldest candle
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+    
+    async def put(self, candle):
+        """Queue a candle for writing; only waits when the queue is full."""
+        await self.put_batch([candle])
+    
+    async def put_batch(self, candles):
+        """Queue candles that must be committed together (e.g. a history snapshot)."""
+        if self.queue.full():
+            self.backpressure += 1
+        await self.queue.put((time.perf_counter(), candles))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+    
+    async def _next_batch(self):
+        """
+        Wait for one candle, then gather more until the batch is full or the
+        flush interval passes. Returns (batch, stopping).
+        """
+        item = await self.queue.get()
+        if item is STOP:
+            return [], True
+        batch = [item]
+        count = len(item[1])
+        deadline = time.perf_counter() + self.flush_interval
+        while count < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is STOP:
+                return batch, True
+            batch.append(item)
+            count += len(item[1])
+        return batch, False
+    
+    async def _flush(self, batch):
+        loop = asyncio.get_running_loop()
+        candles = [candle for _, group in batch for candle in group]
+        start = time.perf_counter()
+        for attempt in range(1, self.retries + 2):
+            try:
+                await loop.run_in_executor(self._executor, self.db.insert_candle_batch, candles)
+                self.rows += len(candles)
+                self.batches += 1
+                break
+            except Exception as e:
+                if attempt > self.retries:
+                    self.errors += 1
+                    logger.error(f"Failed to write {len(candles)} candles after {attempt} attempts: {e}")
+                    break
+                self.retried += 1
+                logger.warning(f"Write of {len(candles)} candles failed ({attempt}/{self.retries + 1}), retrying: {e}")
+                await asyncio.sleep(self.retry_delay * attempt)
+        done = time.perf_counter()
+        self.commit_ms.append((done - start) * 1000)
+        self.wait_ms.append((done - batch[0][0]) * 1000)
+    
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+    
+    async def stop(self):
+        """Commit everything queued so far, then stop the writer task and release the thread."""
+        if self._task:
+            # A sentinel rather than cancel(), so queued candles are always flushed
+            await self.queue.put(STOP)
+            await self._task
+            self._task = None
+        self._executor.shutdown(wait=True)
+    
+    def stats(self):
+        """Counters plus p50/p99 commit and enqueue-to-commit latency in ms."""
+        stats = {
+            'rows': self.rows,
+            'batches': self.batches,
+            'avg_batch': self.rows / self.batches if self.batches else 0,
+            'errors': self.errors,
+            'retried': self.retried,
+            'queue_depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'backpressure': self.backpressure,
+        }
+        for name, samples in (('commit', self.commit_ms), ('wait', self.wait_ms)):
+            if samples:
+                ordered = sorted(samples)
+                stats[f'{name}_p50_ms'] = ordered[len(ordered) // 2]
+                stats[f'{name}_p99_ms'] = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return stats
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Out-of-core bar aggregation over the trade lake.
+
+Trades are streamed day file by day file in batches sized from a memory
+budget, so the full history is never in memory. Each batch is reduced to
+bars with a pyarrow group-by and fed to a BarStream, which holds back the
+last (possibly partial) bar until the next batch shows whether it
+continues. Days are aggregated in parallel by a process pool, each into its
+own part file; the parts are then streamed, in order, through another
+BarStream that stitches together bars split across day boundaries.
+
+Bars are either
+  - time bars: fixed intervals, anything pandas.Timedelta parses ('5s', '1h')
+  - volume bars: a new bar every `volume` of base quantity. qty is summed as
+    integers of QTY_SCALE, so bar boundaries do not depend on how the days
+    were split across workers or batches
+
+Usage:
+    python aggregator.py 2024-01 --end 2025-05 --interval 5s --output bars.parquet
+    python aggregator.py 2025-05 --volume 1000 --workers 8 --memory_mb 4096
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from tabulate import tabulate
+from tqdm import tqdm
+
+import lake
+from trade_store import TradeStore
+
+SYMBOL = "ETHUSDT"
+QTY_SCALE = 10 ** 8
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_MEMORY_MB = 2048
+# Rough peak bytes per trade in a batch: the decoded columns plus bucket,
+# volume and group-by intermediates
+BYTES_PER_ROW = 200
+MIN_BATCH_ROWS = 10_000
+OUTPUT_ROW_GROUP_ROWS = 100_000
+COLUMNS = ['id', 'price', 'qty', 'quote_qty', 'time', 'is_buyer_maker']
+
+# Bars as carried between batches, days and workers
+BAR_SCHEMA = pa.schema([
+    ('bucket', pa.int64()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('quote_volume', pa.float64()),
+    ('buy_volume', pa.float64()),
+    ('trades', pa.int64()),
+    ('first_id', pa.int64()),
+    ('last_id', pa.int64()),
+    ('first_time', pa.int64()),
+    ('last_time', pa.int64()),
+])
+
+
+@dataclass(frozen=True)
+class BarSpec:
+    """Time bars of interval_ms, or volume bars of volume_units (qty * QTY_SCALE)."""
+    interval_ms: int = None
+    volume_units: int = None
+
+    @classmethod
+    def parse(cls, interval=None, volume=None):
+        if (interval is None) == (volume is None):
+            raise ValueError("Give exactly one of interval or volume")
+        if interval is not None:
+            return cls(interval_ms=int(pd.Timedelta(interval).total_seconds() * 1000))
+        return cls(volume_units=int(round(volume * QTY_SCALE)))
+
+    def label(self):
+        if self.interval_ms is not None:
+            return f"{self.interval_ms}ms time bars"
+        return f"{self.volume_units / QTY_SCALE:g} volume bars"
+
+
+def qty_units(qty):
+    return pc.cast(pc.round(pc.multiply(qty, QTY_SCALE)), pa.int64())
+
+
+def merge_bars(a, b):
+    """One bar from two one-row tables of the same bucket, a before b."""
+    a, b = a.to_pylist()[0], b.to_pylist()[0]
+    merged = dict(a, high=max(a['high'], b['high']), low=min(a['low'], b['low']), close=b['close'],
+                  volume=a['volume'] + b['volume'], quote_volume=a['quote_volume'] + b['quote_volume'],
+                  buy_volume=a['buy_volume'] + b['buy_volume'], trades=a['trades'] + b['trades'],
+                  last_id=b['last_id'], last_time=b['last_time'])
+    return pa.Table.from_pylist([merged], schema=BAR_SCHEMA)
+
+
+class BarStream:
+    """
+    Ordered bars in, complete bars out to sink(table).
+
+    The last bar pushed may still grow, so it is held back and merged with
+    the first bar of the next push when both share a bucket. Output is
+    buffered into tables of at least flush_rows bars.
+    """
+
+    def __init__(self, sink, flush_rows=OUTPUT_ROW_GROUP_ROWS):
+        self.sink = sink
+        self.flush_rows = flush_rows
+        self.pending = None
+        self.buffer, self.buffer_rows = [], 0
+
+    def push(self, bars):
+        if bars.num_rows == 0:
+            return
+        if self.pending is not None:
+            if bars.column('bucket')[0].as_py() == self.pending.column('bucket')[0].as_py():
+                bars = pa.concat_tables([merge_bars(self.pending, bars.slice(0, 1)), bars.slice(1)])
+            else:
+                self._emit(self.pending)
+        self.pending = bars.slice(bars.num_rows - 1)
+        self._emit(bars.slice(0, bars.num_rows - 1))
+
+    def _emit(self, bars):
+        if bars.num_rows == 0:
+            return
+        self.buffer.append(bars)
+        self.buffer_rows += bars.num_rows
+        if self.buffer_rows >= self.flush_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer_rows:
+            self.sink(pa.concat_tables(self.buffer).combine_chunks())
+        self.buffer, self.buffer_rows = [], 0
+
+    def finish(self):
+        if self.pending is not None:
+            self._emit(self.pending)
+            self.pending = None
+        self._flush()
+
+
+def reduce_batch(batch, buckets):
+    """Bars of one time-ordered batch of trades, given each trade's bucket."""
+    table = pa.table({
+        'bucket': buckets,
+        'price': batch.column('price'),
+        'qty': batch.column('qty'),
+        'quote_qty': batch.column('quote_qty'),
+        'buy_qty': pc.if_else(batch.column('is_buyer_maker'), 0.0, batch.column('qty')),
+        'id': batch.column('id'),
+        'time': batch.column('time'),
+    })
+    grouped = table.group_by('bucket', use_threads=False).aggregate([
+        ('price', 'first'), ('price', 'max'), ('price', 'min'), ('price', 'last'),
+        ('qty', 'sum'), ('quote_qty', 'sum'), ('buy_qty', 'sum'), ('id', 'count'),
+        ('id', 'min'), ('id', 'max'), ('time', 'min'), ('time', 'max'),
+    ])
+    columns = ['bucket', 'price_first', 'price_max', 'price_min', 'price_last', 'qty_sum', 'quote_qty_sum',
+               'buy_qty_sum', 'id_count', 'id_min', 'id_max', 'time_min', 'time_max']
+    bars = pa.Table.from_arrays([grouped.column(name) for name in columns], schema=BAR_SCHEMA)
+    return bars.sort_by('bucket')
+
+
+def scan_window(lake_dir, symbol, start_ms, end_ms, columns, batch_rows):
+    """Trades of [start_ms, end_ms) as time-ordered batches of at most batch_rows."""
+    data = lake.dataset(lake_dir)
+    fragments = sorted(data.get_fragments(filter=lake.trade_filter(symbol, start_ms, end_ms)), key=lambda f: f.path)
+    time_filter = (ds.field('time') >= start_ms) & (ds.field('time') < end_ms)
+    for fragment in fragments:
+        for batch in fragment.to_batches(columns=columns, filter=time_filter, batch_size=batch_rows, use_threads=False):
+            if batch.num_rows:
+                yield batch
+
+
+def window_volume(lake_dir, symbol, start_ms, end_ms, batch_rows):
+    """Total qty of a window in QTY_SCALE units (first pass of volume bars)."""
+    return sum(pc.sum(qty_units(batch.column('qty'))).as_py() or 0
+               for batch in scan_window(lake_dir, symbol, start_ms, end_ms, ['qty'], batch_rows))
+
+
+def aggregate_window(lake_dir, symbol, start_ms, end_ms, spec, batch_rows, part_path, offset=0):
+    """
+    Bars of the trades in [start_ms, end_ms) written to part_path (process
+    pool entry). offset is the volume, in QTY_SCALE units, traded before
+    start_ms. Returns bars written.
+    """
+    written = 0
+    writer = None
+
+    def sink(bars):
+        nonlocal writer, written
+        if writer is None:
+            writer = pq.ParquetWriter(part_path, BAR_SCHEMA)
+        writer.write_table(bars)
+        written += bars.num_rows
+
+    stream = BarStream(sink)
+    for batch in scan_window(lake_dir, symbol, start_ms, end_ms, COLUMNS, batch_rows):
+        if spec.interval_ms is not None:
+            buckets = pc.divide(batch.column('time'), spec.interval_ms)
+        else:
+            units = qty_units(batch.column('qty'))
+            # A trade belongs to the bar in which it starts
+            before = pc.add(pc.subtract(pc.cumulative_sum(units), units), offset)
+            buckets = pc.divide(before, spec.volume_units)
+            offset += pc.sum(units).as_py()
+        stream.push(reduce_batch(batch, buckets))
+    stream.finish()
+    if writer is not None:
+        writer.close()
+    return written
+
+
+def finish_bars(bars, spec):
+    """Final output columns: bar start date for time bars, and vwap."""
+    if spec.interval_ms is not None:
+        start = pc.multiply(bars.column('bucket'), spec.interval_ms)
+        bars = bars.append_column('date', pc.cast(start, pa.timestamp('ms', tz='UTC')))
+    return bars.append_column('vwap', pc.divide(bars.column('quote_volume'), bars.column('volume')))
+
+
+def day_windows(lake_dir, symbol, start_ms, end_ms):
+    """[start, end) ms of every stored day overlapping the range, clipped to it."""
+    windows = []
+    for key in sorted(TradeStore(lake_dir).days(symbol)):
+        day_start = lake.period_bounds(key)[0]
+        window = (max(start_ms, day_start), min(end_ms, day_start + lake.DAY_MS))
+        if window[0] < window[1]:
+            windows.append(window)
+    return windows
+
+
+def aggregate(lake_dir, symbol, start, end=None, interval=None, volume=None, workers=DEFAULT_WORKERS,
+              memory_mb=DEFAULT_MEMORY_MB, output=None, verbose=True):
+    """
+    Bars of symbol from the start of period start to the end of period end
+    (see lake.period_bounds).
+
+    Either interval (time bars) or volume (volume bars) is given. Each of
+    the workers processes uses about memory_mb / workers for trade batches.
+    With output set, bars are streamed to that Parquet file and the number
+    of bars is returned; otherwise a pandas DataFrame is returned.
+    """
+    spec = BarSpec.parse(interval, volume)
+    start_ms = lake.period_bounds(start)[0]
+    end_ms = lake.period_bounds(end if end is not None else start)[1]
+    windows = day_windows(lake_dir, symbol, start_ms, end_ms)
+    batch_rows = max(MIN_BATCH_ROWS, memory_mb * 2 ** 20 // workers // BYTES_PER_ROW)
+    if verbose:
+        print(f"Aggregating {len(windows)} days of {symbol} into {spec.label()} "
+              f"({workers} workers, {batch_rows:,} trades per batch)")
+
+    collected = []
+    writer = None
+    if output:
+        writer = pq.ParquetWriter(output + '.tmp', finish_bars(BAR_SCHEMA.empty_table(), spec).schema)
+
+    def sink(bars):
+        bars = finish_bars(bars, spec)
+        if writer is not None:
+            writer.write_table(bars)
+        else:
+            collected.append(bars)
+
+    workdir = tempfile.mkdtemp(prefix='aggregate_', dir=os.path.dirname(os.path.abspath(output)) if output else None)
+    stream = BarStream(sink)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            offsets = [0] * len(windows)
+            if spec.volume_units is not None:
+                totals = list(pool.map(window_volume, *zip(*[(lake_dir, symbol, s, e, batch_rows) for s, e in windows])))
+                for i in range(1, len(windows)):
+                    offsets[i] = offsets[i - 1] + totals[i - 1]
+            futures = []
+            for i, (window_start, window_end) in enumerate(windows):
+                part_path = os.path.join(workdir, f"part-{i:05d}.parquet")
+                futures.append((part_path, pool.submit(aggregate_window, lake_dir, symbol, window_start, window_end,
+                                                       spec, batch_rows, part_path, offsets[i])))
+            # Stitch the parts in order as they complete
+            for part_path, future in tqdm(futures, desc="Aggregating days", disable=not verbose):
+                if future.result():
+                    for batch in pq.ParquetFile(part_path).iter_batches(batch_size=OUTPUT_ROW_GROUP_ROWS):
+                        stream.push(pa.Table.from_batches([batch]))
+                    os.remove(part_path)
+        stream.finish()
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(output + '.tmp', output)
+            return pq.ParquetFile(output).metadata.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(output + '.tmp')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    schema = finish_bars(BAR_SCHEMA.empty_table(), spec).schema
+    return pa.concat_tables(collected or [schema.empty_table()]).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate trades from the lake into time or volume bars')
+    parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    bar_type = parser.add_mutually_exclusive_group(required=True)
+    bar_type.add_argument('--interval', type=str, help='Time bars of this interval, e.g. 5s, 1min, 1h')
+    bar_type.add_argument('--volume', type=float, help='Volume bars of this much base quantity')
+    parser.add_argument('--symbol', type=str, default=SYMBOL, help=f'Symbol (default: {SYMBOL})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Worker processes (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--memory_mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'Memory budget for trade batches across workers (default: {DEFAULT_MEMORY_MB})')
+    parser.add_argument('--output', type=str, help='Parquet file to stream bars to (optional)')
+    parser.add_argument('--lake_dir', type=str, default=lake.DEFAULT_LAKE_DIR, help='Trade lake directory')
+    args = parser.parse_args()
+
+    result = aggregate(args.lake_dir, args.symbol, args.start_date, args.end_date, args.interval, args.volume,
+                       args.workers, args.memory_mb, args.output)
+    if args.output:
+        print(f"Wrote {result:,} bars to {args.output}")
+    else:
+        print(f"\n{len(result):,} bars")
+        print(tabulate(result.head(20), headers='keys', tablefmt='psql', showindex=False))
+
+
+if __name__ == '__main__':
+    main()
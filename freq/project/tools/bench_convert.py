@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Compare zip -> Parquet conversion paths on one Binance trades dump.
+
+  - legacy: extract the CSV to disk, read it in 500k-row pandas chunks and
+    append each chunk with fastparquet (what the managers used to do)
+  - stream: converter.zip_to_parquet, Arrow CSV reader straight out of the zip
+    into a single ParquetWriter
+
+Each path runs in a fresh subprocess so peak RSS is measured in isolation.
+Reported: wall time, peak RSS, extra disk used while converting, output size.
+
+Usage:
+    python bench_convert.py ETHUSDT-trades-2025-05.zip
+    python bench_convert.py --synthetic-rows 20000000
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from tabulate import tabulate
+
+PATHS = ('legacy', 'stream')
+
+
+def legacy_convert(zip_path, output_dir):
+    import pandas as pd
+
+    rows = 0
+    temp_bytes = 0
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for member in zip_ref.namelist():
+            if not member.endswith('.csv'):
+                continue
+            zip_ref.extract(member, output_dir)
+            csv_path = os.path.join(output_dir, member)
+            temp_bytes = max(temp_bytes, os.path.getsize(csv_path))
+            parquet_path = csv_path.replace('.csv', '.parquet')
+            first_chunk = pd.read_csv(csv_path, nrows=1)
+            schema = {column: first_chunk[column].dtype for column in first_chunk.columns}
+            first = True
+            for chunk in pd.read_csv(csv_path, chunksize=500000, dtype=schema):
+                chunk.to_parquet(parquet_path, compression='snappy', index=False,
+                                 engine='fastparquet', append=not first)
+                first = False
+                rows += len(chunk)
+            os.remove(csv_path)
+    return rows, temp_bytes
+
+
+def stream_convert(zip_path, output_dir):
+    from converter import zip_to_parquet
+
+    return sum(rows for _, rows in zip_to_parquet(zip_path, output_dir)), 0
+
+
+def run_one(path, zip_path, output_dir):
+    """Child process entry: convert once and print a JSON result line."""
+    convert = legacy_convert if path == 'legacy' else stream_convert
+    t0 = time.perf_counter()
+    rows, temp_bytes = convert(zip_path, output_dir)
+    wall = time.perf_counter() - t0
+    output_bytes = sum(os.path.getsize(os.path.join(output_dir, f))
+                       for f in os.listdir(output_dir) if f.endswith('.parquet'))
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'path': path, 'rows': rows, 'wall_s': wall, 'peak_rss': peak_rss,
+                      'temp_bytes': temp_bytes, 'output_bytes': output_bytes}))
+
+
+def synthetic_zip(path, rows, seed=0):
+    """A trades dump shaped like data.binance.vision, written without holding it in memory."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    name = os.path.basename(path).replace('.zip', '.csv')
+    price = 3000.0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf, zf.open(name, 'w') as out:
+        out.write(b"id,price,qty,quote_qty,time,is_buyer_maker\n")
+        for start in range(0, rows, 1_000_000):
+            n = min(1_000_000, rows - start)
+            prices = price + np.cumsum(rng.normal(0, 0.05, n))
+            price = prices[-1]
+            qty = rng.exponential(0.5, n).round(3)
+            times = 1_746_057_600_000 + (start + np.arange(n)) * 130
+            maker = rng.random(n) < 0.5
+            lines = [f"{start + i},{p:.2f},{q:.3f},{p * q:.5f},{t},{'true' if m else 'false'}"
+                     for i, (p, q, t, m) in enumerate(zip(prices, qty, times, maker))]
+            out.write(('\n'.join(lines) + '\n').encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare zip -> Parquet conversion paths')
+    parser.add_argument('zip', nargs='?', help='Binance trades zip (default: generate one)')
+    parser.add_argument('--synthetic-rows', type=int, default=5_000_000,
+                        help='Rows in the generated dump when no zip is given (default: 5000000)')
+    parser.add_argument('--paths', nargs='+', default=list(PATHS), choices=PATHS)
+    parser.add_argument('--workdir', type=str, default=None, help='Directory for benchmark files (default: temp)')
+    parser.add_argument('--run', choices=PATHS, help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run, args.zip, args.out)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_convert_')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        zip_path = args.zip
+        if zip_path is None:
+            zip_path = os.path.join(workdir, 'ETHUSDT-trades-synthetic.zip')
+            print(f"Generating {args.synthetic_rows:,} synthetic trades...")
+            synthetic_zip(zip_path, args.synthetic_rows)
+        print(f"Input: {zip_path} ({os.path.getsize(zip_path) / 1e6:.1f} MB)\n")
+
+        results = []
+        for path in args.paths:
+            out = os.path.join(workdir, path)
+            os.makedirs(out, exist_ok=True)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), zip_path, '--run', path, '--out', out],
+                                  capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode != 0:
+                print(f"{path} failed:\n{proc.stderr}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            shutil.rmtree(out)
+
+        table = [[r['path'], f"{r['rows']:,}", f"{r['wall_s']:.1f}", f"{r['peak_rss'] / 1e6:.0f}",
+                  f"{r['temp_bytes'] / 1e6:.0f}", f"{r['output_bytes'] / 1e6:.1f}"] for r in results]
+        print(tabulate(table, headers=['path', 'rows', 'wall s', 'peak RSS MB', 'temp disk MB', 'output MB'],
+                       tablefmt='grid'))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Compare Parquet layouts for the trade lake on one month of trades.
+
+Starting from a base layout (the lake's current one unless overridden), each
+group varies a single setting:
+  - codec: snappy, lz4, zstd at several levels, gzip
+  - encoding: dictionary, plain or delta (DELTA_BINARY_PACKED) for id/time
+  - qty: float64 vs float32
+  - row_group: rows per row group
+
+Every variant writes the month as day files through lake.write_day into a
+scratch lake and reads it back through lake.load_trades, so the numbers are
+the ones the real lake would see. Reported: size on disk, best-of-N write
+time, full-month scan time, one-hour scan time, and the largest qty error a
+variant introduces. Apply the chosen layout with `monthly_trades.py rewrite`.
+
+Usage:
+    python bench_format.py --month 2025-05
+    python bench_format.py --zip ETHUSDT-trades-2025-05.zip
+    python bench_format.py --synthetic-rows 5000000 --groups codec encoding
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+import pyarrow.compute as pc
+from tabulate import tabulate
+
+import lake
+from converter import open_member
+from trade_store import TradeStore
+
+GROUPS = {
+    'codec': [
+        {'compression': 'snappy', 'compression_level': None},
+        {'compression': 'lz4', 'compression_level': None},
+        {'compression': 'zstd', 'compression_level': 1},
+        {'compression': 'zstd', 'compression_level': 3},
+        {'compression': 'zstd', 'compression_level': 9},
+        {'compression': 'zstd', 'compression_level': 19},
+        {'compression': 'gzip', 'compression_level': None},
+    ],
+    'encoding': [{'id_time_encoding': encoding} for encoding in lake.ID_TIME_ENCODINGS],
+    'qty': [{'qty_type': qty_type} for qty_type in ('float64', 'float32')],
+    'row_group': [{'row_group_rows': rows} for rows in (50_000, 250_000, 1_000_000)],
+}
+SYMBOL = "ETHUSDT"
+
+
+def load_month(args):
+    """The benchmark input as one Arrow table of TRADES_SCHEMA."""
+    if args.zip:
+        with zipfile.ZipFile(args.zip, 'r') as zip_ref:
+            member = next(name for name in zip_ref.namelist() if name.endswith('.csv'))
+            return open_member(zip_ref, member).read_all()
+    if args.month:
+        return lake.load_trades(args.lake_dir, args.symbol, args.month)
+    from bench_convert import synthetic_zip
+
+    with tempfile.TemporaryDirectory(prefix='bench_format_') as workdir:
+        zip_path = os.path.join(workdir, f'{SYMBOL}-trades-synthetic.zip')
+        print(f"Generating {args.synthetic_rows:,} synthetic trades...")
+        synthetic_zip(zip_path, args.synthetic_rows)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            return open_member(zip_ref, zip_ref.namelist()[0]).read_all()
+
+
+def split_days(table):
+    days = pc.divide(table.column('time'), lake.DAY_MS)
+    return [(lake.day_of(day), table.filter(pc.equal(days, day))) for day in pc.unique(days).to_pylist()]
+
+
+def label(change):
+    return ', '.join(f"{key}={value}" for key, value in change.items() if value is not None) or 'base'
+
+
+def run_variant(days, layout, lake_dir, repeat):
+    """Write the days in layout (best of repeat) and scan them back."""
+    write_s = float('inf')
+    for _ in range(repeat):
+        shutil.rmtree(lake_dir, ignore_errors=True)
+        t0 = time.perf_counter()
+        for day, table in days:
+            directory = lake.partition_dir(lake_dir, SYMBOL, day)
+            os.makedirs(directory, exist_ok=True)
+            lake.write_day(table, os.path.join(directory, lake.DAY_FILE), layout)
+        write_s = min(write_s, time.perf_counter() - t0)
+    size = sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(lake_dir) for name in names)
+
+    first, last = days[0][0].isoformat(), days[-1][0].isoformat()
+    t0 = time.perf_counter()
+    scanned = lake.load_trades(lake_dir, SYMBOL, first, last)
+    scan_s = time.perf_counter() - t0
+
+    # One hour from the middle of the range: what row-group pruning buys
+    middle = (scanned.column('time')[0].as_py() + scanned.column('time')[-1].as_py()) // 2
+    hour_start = middle - middle % 3_600_000
+    t0 = time.perf_counter()
+    lake.load_trades(lake_dir, SYMBOL, hour_start, hour_start + 3_600_000 - 1)
+    hour_s = time.perf_counter() - t0
+    return size, write_s, scan_s, hour_s, scanned
+
+
+def max_error(original, scanned, column):
+    """Largest absolute difference in column after a round trip (tables are both time/id ordered)."""
+    ordered = original.sort_by([('time', 'ascending'), ('id', 'ascending')])
+    diff = pc.abs(pc.subtract(scanned.column(column), ordered.column(column)))
+    return pc.max(diff).as_py()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Parquet layouts for the trade lake')
+    parser.add_argument('--month', type=str, help='Month (YYYY-MM) to read from the lake')
+    parser.add_argument('--zip', type=str, help='Binance trades zip to use instead of the lake')
+    parser.add_argument('--synthetic-rows', type=int, default=5_000_000,
+                        help='Rows to generate when neither --month nor --zip is given (default: 5000000)')
+    parser.add_argument('--lake_dir', type=str, default=lake.DEFAULT_LAKE_DIR, help='Trade lake directory')
+    parser.add_argument('--symbol', type=str, default=SYMBOL, help=f'Symbol to read from the lake (default: {SYMBOL})')
+    parser.add_argument('--groups', nargs='+', default=list(GROUPS), choices=list(GROUPS))
+    parser.add_argument('--repeat', type=int, default=3, help='Writes per variant, best kept (default: 3)')
+    parser.add_argument('--compression', type=str, help='Base layout codec (default: the lake\'s)')
+    parser.add_argument('--compression_level', type=int, help='Base layout codec level')
+    parser.add_argument('--workdir', type=str, default=None, help='Directory for scratch lakes (default: temp)')
+    args = parser.parse_args()
+
+    base = TradeStore(args.lake_dir).layout if os.path.isdir(args.lake_dir) else dict(lake.DEFAULT_LAYOUT)
+    if args.compression:
+        base.update(compression=args.compression, compression_level=args.compression_level)
+
+    table = load_month(args)
+    if table is None or table.num_rows == 0:
+        print("No trades to benchmark")
+        return
+    table = table.select(lake.TRADES_SCHEMA.names).cast(lake.TRADES_SCHEMA)
+    days = split_days(table)
+    print(f"Input: {table.num_rows:,} trades over {len(days)} days, {table.nbytes / 1e6:.0f} MB in memory")
+    print(f"Base layout: {base}\n")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_format_')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        scratch = os.path.join(workdir, 'lake')
+        base_size, write_s, scan_s, hour_s, _ = run_variant(days, base, scratch, args.repeat)
+        rows = [['base', label({}), f"{base_size / 1e6:.1f}", "1.00", f"{table.nbytes / base_size:.1f}",
+                 f"{write_s:.2f}", f"{scan_s:.2f}", f"{hour_s * 1000:.0f}", "0"]]
+        for group in args.groups:
+            for change in GROUPS[group]:
+                size, write_s, scan_s, hour_s, scanned = run_variant(days, dict(base, **change), scratch, args.repeat)
+                rows.append([group, label(change), f"{size / 1e6:.1f}", f"{size / base_size:.2f}",
+                             f"{table.nbytes / size:.1f}", f"{write_s:.2f}", f"{scan_s:.2f}", f"{hour_s * 1000:.0f}",
+                             f"{max_error(table, scanned, 'qty'):.2g}"])
+                print(f"  {group}: {label(change)} done")
+        print()
+        print(tabulate(rows, headers=['group', 'variant', 'size MB', 'vs base', 'ratio', 'write s', 'scan s',
+                                   'hour ms', 'qty err'], tablefmt='grid'))
+        print("\nApply a layout with: python monthly_trades.py rewrite --compression ... --id_time_encoding ...")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
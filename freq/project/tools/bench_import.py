@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Measure what monthly_trades.py and daily_trades.py commands import at startup.
+
+Each command runs in a fresh interpreter under `python -X importtime`:
+  - help: `--help`
+  - download: one synthetic monthly dump served from a local HTTP server
+    into a new lake
+  - load: `aggregate` of one day from a scratch lake
+  - visualize: one month from the same lake, saved to a PNG
+  - daily help, daily download (one synthetic daily dump, the other days of
+    the month missing), daily list: the same for daily_trades.py
+
+Reported per command: best-of-N wall time, the time spent in imports
+(cumulative time of the top-level imports, interpreter startup included),
+how many modules were imported, and which of the heavy packages were
+loaded. With --baseline the same commands also run on the tools as of that
+git ref (extracted with git archive), e.g. the commit before a change.
+
+Usage:
+    python bench_import.py
+    python bench_import.py --baseline HEAD~1 --repeat 5
+"""
+
+import argparse
+import functools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ('pyarrow', 'pandas', 'numpy', 'matplotlib', 'requests')
+SYMBOL = "ETHUSDT"
+# bench_convert.synthetic_zip writes trades from 2025-05-01 on
+DAY = '2025-05-01'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory):
+    """A local HTTP server for directory, in a daemon thread. Returns its base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def parse_importtime(stderr):
+    """(import ms, modules imported, heavy packages loaded) from -X importtime output."""
+    total_us, modules, heavy = 0, 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules += 1
+        package = name.strip().split('.')[0]
+        if package in HEAVY:
+            heavy.add(package)
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1000, modules, sorted(heavy, key=HEAVY.index)
+
+
+def has_parser(script_path):
+    """Whether script_path takes a command line (build_parser), so its commands can be benchmarked."""
+    with open(script_path) as f:
+        return 'def build_parser' in f.read()
+
+
+def run(tools_dir, script, command, repeat, fresh=None):
+    """Best-of-repeat wall time plus the import figures of that run. fresh(i) prepares run i."""
+    best = None
+    for i in range(repeat):
+        args = command(i) if callable(command) else command
+        if fresh:
+            fresh(i)
+        env = dict(os.environ, MPLBACKEND='Agg')
+        t0 = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', script, *args], cwd=tools_dir,
+                                env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - t0
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed in {tools_dir}:\n{result.stderr[-2000:]}")
+        if best is None or wall < best[0]:
+            best = (wall, *parse_importtime(result.stderr))
+    return best
+
+
+def commands(workdir, base_url, lake_dir):
+    """{name: (script, args or args(i), fresh(i) or None)}"""
+    last_month = date.today().replace(day=1) - timedelta(days=1)
+
+    def download(kind):
+        def args(i):
+            return ['download', '--start_year', str(last_month.year), '--start_month', str(last_month.month),
+                    '--base_url', f'{base_url}/{kind}', '--lake_dir', os.path.join(workdir, f'{kind}_lake_{i}'),
+                    '--output_dir', os.path.join(workdir, f'{kind}_zips_{i}')]
+        return args
+
+    def clean(kind):
+        return lambda i: shutil.rmtree(os.path.join(workdir, f'{kind}_lake_{i}'), ignore_errors=True)
+
+    return {
+        'help': ('monthly_trades.py', ['--help'], None),
+        'download': ('monthly_trades.py', download('monthly'), clean('monthly')),
+        'load': ('monthly_trades.py', ['aggregate', DAY, '--lake_dir', lake_dir], None),
+        'visualize': ('monthly_trades.py', ['visualize', DAY[:7], '--save', os.path.join(workdir, 'visualize.png'),
+                                            '--lake_dir', lake_dir], None),
+        'daily help': ('daily_trades.py', ['--help'], None),
+        'daily download': ('daily_trades.py', download('daily'), clean('daily')),
+        'daily list': ('daily_trades.py', ['list', '--lake_dir', lake_dir], None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup imports of monthly_trades.py and daily_trades.py commands')
+    parser.add_argument('--baseline', type=str, help='Git ref to compare with, e.g. HEAD~1')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per command, best kept (default: 3)')
+    parser.add_argument('--synthetic-rows', type=int, default=200_000, help='Trades in the synthetic dump (default: 200000)')
+    parser.add_argument('--workdir', type=str, default=None, help='Directory for scratch files (default: temp)')
+    args = parser.parse_args()
+
+    from bench_convert import synthetic_zip
+    from trade_store import TradeStore
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_import_')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        trees = {'current': TOOLS_DIR}
+        if args.baseline:
+            root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=TOOLS_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+            prefix = os.path.relpath(TOOLS_DIR, root)
+            archive = subprocess.run(['git', 'archive', args.baseline, prefix], cwd=root, capture_output=True, check=True)
+            subprocess.run(['tar', '-x', '-C', workdir], input=archive.stdout, check=True)
+            trees = {args.baseline: os.path.join(workdir, prefix), **trees}
+
+        # A monthly and a daily dump to download, and a lake to load and plot
+        dumps = os.path.join(workdir, 'dumps')
+        os.makedirs(os.path.join(dumps, 'monthly'), exist_ok=True)
+        os.makedirs(os.path.join(dumps, 'daily'), exist_ok=True)
+        last_month = date.today().replace(day=1) - timedelta(days=1)
+        zip_path = os.path.join(dumps, 'monthly', f"{SYMBOL}-trades-{last_month:%Y-%m}.zip")
+        print(f"Generating {args.synthetic_rows:,} synthetic trades...")
+        synthetic_zip(zip_path, args.synthetic_rows)
+        shutil.copy(zip_path, os.path.join(dumps, 'daily', f"{SYMBOL}-trades-{last_month:%Y-%m}-01.zip"))
+        lake_dir = os.path.join(workdir, 'lake')
+        TradeStore(lake_dir).ingest_zip(zip_path, SYMBOL)
+        base_url = serve(dumps)
+
+        rows, results = [], {}
+        for name, (script, command, fresh) in commands(workdir, base_url, lake_dir).items():
+            for tree, tools_dir in trees.items():
+                if not has_parser(os.path.join(tools_dir, script)):
+                    # Older daily_trades.py ignores its arguments and downloads from Binance
+                    print(f"  {name} ({tree}) skipped: {script} has no command line there")
+                    continue
+                wall, import_ms, modules, heavy = run(tools_dir, script, command, args.repeat, fresh)
+                results[name, tree] = import_ms
+                rows.append([name, tree, f"{wall:.2f}", f"{import_ms:.0f}", modules, ', '.join(heavy) or '-'])
+                print(f"  {name} ({tree}) done")
+        print()
+        print(tabulate(rows, headers=['command', 'tree', 'wall s', 'imports ms', 'modules', 'heavy packages'],
+                       tablefmt='psql'))
+        if args.baseline:
+            print()
+            for name in commands(workdir, base_url, lake_dir):
+                if (name, args.baseline) not in results:
+                    continue
+                before, after = results[name, args.baseline], results[name, 'current']
+                print(f"{name}: imports {before:.0f} ms -> {after:.0f} ms ({after / before - 1:+.0%})")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
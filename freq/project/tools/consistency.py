@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Cross-check the aggTrades and 1s kline lakes against the raw trades lake.
+
+Every dataset is read as bars of one OHLC pyramid level (1s unless asked
+otherwise) over the same span, and each candidate is compared with the
+trades bars:
+  - bars present on one side only
+  - share of common bars agreeing on open/high/low/close and volume
+  - largest open/high/low/close and per-bar volume differences
+  - total volume difference
+  - trade count ratio: klines count fills like the trades lake, aggTrades
+    count taker orders per price, so theirs is expected to be below 1
+
+aggTrades merge fills of one taker order at one price, so their bars should
+match the trades bars exactly; klines come from Binance's own aggregation
+and should too, up to float rounding.
+
+Usage:
+    python consistency.py ETHUSDT 2025-05-03
+    python consistency.py ETHUSDT 2025-05-01 --end_date 2025-05-07 --timeframe 1min
+"""
+
+import argparse
+
+import numpy as np
+from tabulate import tabulate
+
+import markets
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+# Relative tolerance for prices and volumes (float32 qty layouts, kline rounding)
+RTOL = 1e-6
+
+
+def compare(reference, candidate):
+    """Agreement of candidate bars with reference bars (DataFrames as returned by TradeStore.ohlc)."""
+    joined = reference.join(candidate, how='inner', rsuffix='_candidate')
+    agree = np.isclose(joined['volume'], joined['volume_candidate'], rtol=RTOL)
+    result = {
+        'bars': len(candidate),
+        'only_reference': len(reference.index.difference(candidate.index)),
+        'only_candidate': len(candidate.index.difference(reference.index)),
+    }
+    for column in PRICE_COLUMNS:
+        agree &= np.isclose(joined[column], joined[f'{column}_candidate'], rtol=RTOL)
+        result[f'max_{column}_diff'] = (joined[column] - joined[f'{column}_candidate']).abs().max()
+    result['matching'] = agree.mean() if len(joined) else float('nan')
+    result['max_volume_diff'] = (joined['volume'] - joined['volume_candidate']).abs().max()
+    result['volume_diff'] = candidate['volume'].sum() / reference['volume'].sum() - 1 if len(reference) else float('nan')
+    result['trades_ratio'] = candidate['trades'].sum() / reference['trades'].sum() if len(reference) else float('nan')
+    return result
+
+
+def check(symbol, start, end=None, market=markets.DEFAULT_MARKET, datasets=('aggTrades', 'klines_1s'),
+          timeframe='1s', lake_root=None):
+    """
+    Compare each dataset lake of symbol with its trades lake from the start
+    of period start to the end of period end. Returns {dataset: compare()}.
+    """
+    def bars(dataset):
+        store = markets.open_store(markets.lake_dir(market, lake_root, dataset), dataset)
+        return store.ohlc(symbol, start, end, timeframe=timeframe)[0]
+
+    reference = bars('trades')
+    return {dataset: compare(reference, bars(dataset)) for dataset in datasets}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check aggTrades and 1s kline lakes against the trades lake')
+    parser.add_argument('symbol', type=str, help='Symbol, e.g. ETHUSDT')
+    parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    parser.add_argument('--market', type=str, default=markets.DEFAULT_MARKET, choices=list(markets.MARKETS))
+    parser.add_argument('--datasets', nargs='+', default=['aggTrades', 'klines_1s'],
+                        choices=[dataset for dataset in markets.DATASETS if dataset != 'trades'])
+    parser.add_argument('--timeframe', type=str, default='1s', help='Bars to compare (default: 1s)')
+    parser.add_argument('--lake_root', type=str, help='Lakes are in <lake_root>/<market><dataset suffix> (default: per-market lakes)')
+    args = parser.parse_args()
+
+    results = check(args.symbol.upper(), args.start_date, args.end_date, args.market, args.datasets, args.timeframe,
+                    args.lake_root)
+    table = [[dataset, f"{r['bars']:,}", r['only_reference'], r['only_candidate'],
+              f"{r['matching']:.4%}", *(f"{r[f'max_{column}_diff']:.6g}" for column in PRICE_COLUMNS),
+              f"{r['max_volume_diff']:.6g}", f"{r['volume_diff']:+.2e}", f"{r['trades_ratio']:.3f}"]
+             for dataset, r in results.items()]
+    print(tabulate(table, headers=['dataset', 'bars', 'trades only', 'dataset only', 'matching',
+                                   'open diff', 'high diff', 'low diff', 'close diff', 'volume diff', 'total volume',
+                                   'trade ratio'], tablefmt='psql'))
+
+
+if __name__ == '__main__':
+    main()
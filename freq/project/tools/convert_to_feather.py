@@ -7,8 +7,12 @@ import pytz
 from datetime import datetime
 from tqdm import tqdm
 
+import lake
+from trade_store import TradeStore
+
 # Define paths
-TRADES_DIR = "/allah/data/trades/eth_usdt_daily_trades"
+LAKE_DIR = lake.DEFAULT_LAKE_DIR
+SYMBOL = "ETHUSDT"
 OUTPUT_FEATHER = "/allah/freqtrade/user_data/data/binance/futures/ETH_USDT_USDT-5s-futures.feather"
 
 def load_existing_feather():
@@ -29,11 +33,9 @@ def load_existing_feather():
         print(f"Feather file does not exist: {OUTPUT_FEATHER}")
         return None, None
 
-def get_parquet_files():
-    """Get all parquet files in the trades directory"""
-    files = glob.glob(os.path.join(TRADES_DIR, "ETHUSDT-trades-*.parquet"))
-    files.sort()  # Sort files by date
-    return files
+def get_trade_days():
+    """Get all days in the trade store (monthly and daily dumps, each trade once)"""
+    return sorted(TradeStore(LAKE_DIR).days(SYMBOL))
 
 def process_trades_to_ohlcv(df, timeframe='5s'):
     """Process trade data to OHLCV format with 5-second intervals"""
@@ -70,31 +72,28 @@ def main():
     # Load existing feather file
     existing_df, latest_date = load_existing_feather()
     
-    # Get parquet files
-    parquet_files = get_parquet_files()
-    print(f"Found {len(parquet_files)} parquet files")
+    # Get stored days
+    trade_days = get_trade_days()
+    print(f"Found {len(trade_days)} days in the trade store")
     
-    if not parquet_files:
-        print("No parquet files found. Exiting.")
+    if not trade_days:
+        print("No trade data found. Exiting.")
         return
     
     # List of new dataframes to be added
     new_dfs = []
     
-    for file_path in tqdm(parquet_files, desc="Processing files"):
-        # Extract date from filename (format: ETHUSDT-trades-YYYY-MM-DD.parquet)
-        file_name = os.path.basename(file_path)
+    for date_str in tqdm(trade_days, desc="Processing days"):
         try:
-            date_str = file_name.split('-trades-')[1].split('.')[0]
             file_date = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=pytz.UTC)
             
-            # Skip files with dates already in the feather file
+            # Skip days already in the feather file
             if latest_date is not None and file_date.date() < latest_date.date():
-                print(f"Skipping {file_name} - data already in feather file")
+                print(f"Skipping {date_str} - data already in feather file")
                 continue
                 
-            # Load parquet file
-            trades_df = pd.read_parquet(file_path)
+            # Load the day's trades
+            trades_df = lake.load_trades(LAKE_DIR, SYMBOL, date_str, columns=['time', 'price', 'qty']).to_pandas()
             
             # Add datetime column
             trades_df['datetime'] = pd.to_datetime(trades_df['time'], unit='ms')
@@ -103,10 +102,10 @@ def main():
             ohlcv_df = process_trades_to_ohlcv(trades_df)
             
             new_dfs.append(ohlcv_df)
-            print(f"Processed {file_name}: {len(ohlcv_df)} rows")
+            print(f"Processed {date_str}: {len(ohlcv_df)} rows")
             
         except Exception as e:
-            print(f"Error processing {file_name}: {e}")
+            print(f"Error processing {date_str}: {e}")
             continue
     
     if not new_dfs:
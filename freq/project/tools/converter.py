@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Stream Binance CSV dumps straight out of their zip into Parquet.
+
+The zip member is decompressed on the fly into pyarrow's CSV reader with an
+explicit column schema, and batches go into a single ParquetWriter in row
+groups of ROW_GROUP_ROWS. The CSV never touches the disk and only one row
+group is held in memory at a time.
+"""
+
+import os
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# Columns of data.binance.vision futures trade dumps
+TRADES_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('price', pa.float64()),
+    ('qty', pa.float64()),
+    ('quote_qty', pa.float64()),
+    ('time', pa.int64()),
+    ('is_buyer_maker', pa.bool_()),
+])
+
+# Spot dumps add is_best_match; COIN-M dumps carry base_qty (the coin amount)
+# where USD-M dumps have quote_qty
+SPOT_TRADES_SCHEMA = TRADES_SCHEMA.append(pa.field('is_best_match', pa.bool_()))
+CM_TRADES_SCHEMA = TRADES_SCHEMA.set(TRADES_SCHEMA.get_field_index('quote_qty'), pa.field('base_qty', pa.float64()))
+# aggTrades dumps: one row per taker order and price level, covering trade ids
+# first_trade_id..last_trade_id
+AGG_TRADES_SCHEMA = pa.schema([
+    ('agg_trade_id', pa.int64()),
+    ('price', pa.float64()),
+    ('quantity', pa.float64()),
+    ('first_trade_id', pa.int64()),
+    ('last_trade_id', pa.int64()),
+    ('transact_time', pa.int64()),
+    ('is_buyer_maker', pa.bool_()),
+])
+SPOT_AGG_TRADES_SCHEMA = AGG_TRADES_SCHEMA.append(pa.field('is_best_match', pa.bool_()))
+# COIN-M aggTrades have the same columns, but quantity counts contracts, whose
+# value in coin or USD depends on the contract size
+CM_AGG_TRADES_SCHEMA = AGG_TRADES_SCHEMA.with_metadata({'quantity': 'contracts'})
+# klines dumps (1s and up), the same columns in every market
+KLINES_SCHEMA = pa.schema([
+    ('open_time', pa.int64()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('close_time', pa.int64()),
+    ('quote_volume', pa.float64()),
+    ('count', pa.int64()),
+    ('taker_buy_volume', pa.float64()),
+    ('taker_buy_quote_volume', pa.float64()),
+    ('ignore', pa.float64()),
+])
+# Later spot dumps give times in microseconds; no millisecond time gets this big
+MICROSECOND_TIMES = 10 ** 14
+
+ROW_GROUP_ROWS = 1_000_000
+READ_BLOCK_BYTES = 4 << 20
+COMPRESSION = 'snappy'
+
+
+def csv_options(first_line, schema=TRADES_SCHEMA):
+    """
+    Arrow read/convert options for a dump whose first line is first_line.
+
+    Older dumps have no header row; newer ones start with the column names.
+    """
+    if first_line.strip()[:1].isdigit():
+        read_options = pacsv.ReadOptions(column_names=schema.names, block_size=READ_BLOCK_BYTES)
+    else:
+        read_options = pacsv.ReadOptions(block_size=READ_BLOCK_BYTES)
+    return read_options, pacsv.ConvertOptions(column_types=schema)
+
+
+def open_member(zip_ref, member, schema=TRADES_SCHEMA):
+    """Streaming Arrow CSV reader over one zip member."""
+    with zip_ref.open(member) as f:
+        read_options, convert_options = csv_options(f.readline(), schema)
+    return pacsv.open_csv(zip_ref.open(member), read_options=read_options, convert_options=convert_options)
+
+
+def to_millis(times):
+    """Epoch times in milliseconds, whether the dump gave milliseconds or microseconds."""
+    if len(times) and pc.max(times).as_py() > MICROSECOND_TIMES:
+        return pc.divide(times, 1000)
+    return times
+
+
+def to_trades(batch, schema=None):
+    """
+    A batch of any trade or aggTrades schema above as TRADES_SCHEMA: extra
+    columns dropped, COIN-M base_qty stored as quote_qty, microsecond times
+    cut to milliseconds. An aggregate trade becomes one trade whose id is its
+    agg_trade_id and whose quote_qty is price * quantity, or NULL when the
+    dump's CSV schema (CM_AGG_TRADES_SCHEMA) says quantity counts contracts.
+    """
+    if 'agg_trade_id' in batch.schema.names:
+        price, qty = batch.column('price'), batch.column('quantity')
+        if schema is not None and (schema.metadata or {}).get(b'quantity') == b'contracts':
+            quote_qty = pa.nulls(batch.num_rows, pa.float64())
+        else:
+            quote_qty = pc.multiply(price, qty)
+        return pa.RecordBatch.from_arrays([
+            batch.column('agg_trade_id'), price, qty, quote_qty,
+            to_millis(batch.column('transact_time')), batch.column('is_buyer_maker'),
+        ], schema=TRADES_SCHEMA)
+    if 'base_qty' in batch.schema.names:
+        batch = batch.rename_columns(['quote_qty' if name == 'base_qty' else name for name in batch.schema.names])
+    columns = [batch.column(name) for name in TRADES_SCHEMA.names]
+    time_index = TRADES_SCHEMA.get_field_index('time')
+    columns[time_index] = to_millis(columns[time_index])
+    return pa.RecordBatch.from_arrays(columns, schema=TRADES_SCHEMA)
+
+
+def write_batches(reader, parquet_path, row_group_rows=ROW_GROUP_ROWS, compression=COMPRESSION):
+    """
+    Write a RecordBatchReader to parquet_path in row groups of row_group_rows.
+
+    Output goes to a temporary file that is renamed on success, so a failed
+    conversion never leaves a half-written .parquet behind. Returns rows written.
+    """
+    tmp_path = parquet_path + '.tmp'
+    rows = 0
+    pending, pending_rows = [], 0
+    try:
+        with pq.ParquetWriter(tmp_path, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                while pending_rows >= row_group_rows:
+                    table = pa.Table.from_batches(pending)
+                    writer.write_table(table.slice(0, row_group_rows), row_group_size=row_group_rows)
+                    rest = table.slice(row_group_rows)
+                    pending, pending_rows = rest.to_batches(), rest.num_rows
+                    rows += row_group_rows
+            if pending_rows:
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+                rows += pending_rows
+        os.replace(tmp_path, parquet_path)
+        return rows
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        reader.close()
+
+
+def zip_to_parquet(zip_path, output_dir, schema=TRADES_SCHEMA, row_group_rows=ROW_GROUP_ROWS):
+    """
+    Convert every CSV member of zip_path into <member>.parquet in output_dir.
+
+    Returns [(parquet_path, rows)].
+    """
+    written = []
+    os.makedirs(output_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for member in zip_ref.namelist():
+            if not member.endswith('.csv'):
+                continue
+            parquet_path = os.path.join(output_dir, os.path.basename(member)[:-len('.csv')] + '.parquet')
+            reader = open_member(zip_ref, member, schema)
+            written.append((parquet_path, write_batches(reader, parquet_path, row_group_rows)))
+    return written
+
+
+def csv_to_parquet(csv_path, parquet_path, schema=TRADES_SCHEMA, row_group_rows=ROW_GROUP_ROWS):
+    """Same streaming conversion for a loose CSV file. Returns rows written."""
+    with open(csv_path, 'rb') as f:
+        read_options, convert_options = csv_options(f.readline(), schema)
+    reader = pacsv.open_csv(csv_path, read_options=read_options, convert_options=convert_options)
+    return write_batches(reader, parquet_path, row_group_rows)
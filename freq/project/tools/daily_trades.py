@@ -1,29 +1,31 @@
 #!/usr/bin/env python
-import requests
+# Heavy imports happen in the methods that use them (see monthly_trades.py)
 import os
-import time
 import sys
 import glob
-import zipfile
 import shutil
-import io
-from datetime import datetime, timedelta
-from tqdm import tqdm
-import humanize
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from matplotlib.dates import DateFormatter
-import matplotlib.dates as mdates
-from tabulate import tabulate
+import argparse
+from datetime import datetime, timedelta, timezone
 
-BASE_URL = "https://data.binance.vision/data/futures/um/daily/trades/ETHUSDT"
+import markets
+
+SYMBOL = "ETHUSDT"
+BASE_URL = markets.base_url(markets.DEFAULT_MARKET, 'daily', SYMBOL)
 DEFAULT_OUTPUT_DIR = "/allah/data/trades"
 DEFAULT_DATA_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "eth_usdt_daily_trades")
 
 class BinanceDailyTradesManager:
     
-    def __init__(self, trades_dir=None):
+    def __init__(self, trades_dir=None, workers=None, base_url=None, lake_dir=None,
+                 symbol=SYMBOL, market=markets.DEFAULT_MARKET, dataset=markets.DEFAULT_DATASET):
+        self.symbol = symbol
+        self.market = market
+        self.dataset = dataset
+        self.lake_dir = lake_dir or markets.lake_dir(market, dataset=dataset)
+        self.store = markets.open_store(self.lake_dir, dataset)
+        self.base_url = (base_url or markets.base_url(market, 'daily', symbol, dataset=dataset)).rstrip('/')
+        self.workers = workers
+        self._engine = None
         os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
         
         if trades_dir is None:
@@ -35,6 +37,13 @@ class BinanceDailyTradesManager:
             os.makedirs(self.trades_dir, exist_ok=True)
             print(f"Using provided directory: {self.trades_dir}")
     
+    @property
+    def engine(self):
+        if self._engine is None:
+            from downloader import DEFAULT_WORKERS, DownloadEngine
+            self._engine = DownloadEngine(workers=self.workers or DEFAULT_WORKERS)
+        return self._engine
+    
     def get_free_space(self, path):
         try:
             total, used, free = shutil.disk_usage(path)
@@ -47,96 +56,70 @@ class BinanceDailyTradesManager:
                 return 0
 
     def get_file_size(self, url):
-        try:
-            response = requests.head(url, timeout=10)
-            response.raise_for_status()
-            return int(response.headers.get('content-length', 0))
-        except Exception as e:
-            print(f"Error checking file size for {url}: {e}")
-            return 0
+        return self.engine.head(url)
 
     def download_file(self, url, output_path):
-        response = requests.get(url, stream=True, timeout=30)
-        total_size = int(response.headers.get('content-length', 0))
+        from tqdm import tqdm
+        from downloader import DownloadJob
         
-        with open(output_path, 'wb') as file, tqdm(
+        job = DownloadJob(url, output_path, self.get_file_size(url))
+        with tqdm(
             desc=os.path.basename(output_path),
-            total=total_size,
+            total=job.size,
             unit='iB',
             unit_scale=True,
             unit_divisor=1024,
         ) as pbar:
-            for data in response.iter_content(chunk_size=1024):
-                size = file.write(data)
-                pbar.update(size)
+            self.engine.fetch(job, pbar)
 
     def convert_csv_to_parquet(self, csv_path, parquet_path):
+        from converter import csv_to_parquet
+        
         try:
-            chunk_size = 500000
-            
-            first_chunk = pd.read_csv(csv_path, nrows=1)
-            schema = {}
-            for column in first_chunk.columns:
-                if column == 'timestamp':
-                    schema[column] = 'datetime64[ns]'
-                else:
-                    schema[column] = first_chunk[column].dtype
-            
-            chunks = pd.read_csv(csv_path, chunksize=chunk_size, dtype=schema)
-            
-            first = True
-            for chunk in chunks:
-                if 'timestamp' in chunk.columns:
-                    chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
-                mode = 'write' if first else 'append'
-                chunk.to_parquet(
-                    parquet_path,
-                    compression='snappy',
-                    index=False,
-                    engine='fastparquet',
-                    append=not first
-                )
-                first = False
-            
+            rows = csv_to_parquet(csv_path, parquet_path)
             os.remove(csv_path)
-            print(f"Converted and compressed: {os.path.basename(csv_path)} → {os.path.basename(parquet_path)}")
+            print(f"Converted and compressed: {os.path.basename(csv_path)} → {os.path.basename(parquet_path)} ({rows:,} rows)")
             return True
         except Exception as e:
             print(f"Error converting to parquet: {e}")
-            if os.path.exists(parquet_path):
-                os.remove(parquet_path)
             return False
 
     def get_existing_files(self):
-        existing_files = set()
-        for file in glob.glob(os.path.join(self.trades_dir, "*.parquet")):
-            basename = os.path.basename(file)
-            if basename.startswith("ETHUSDT-trades-"):
-                date_str = basename.split("ETHUSDT-trades-")[1].split(".")[0]
-                existing_files.add(date_str)
-        return existing_files
+        # Days already covered by any dump, so days a monthly file holds are not fetched again
+        return set(self.store.days(self.symbol))
 
-    def extract_and_convert(self, zip_path, extract_path):
-        success = False
+    def extract_and_convert(self, zip_path, remote=None):
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                csv_files = [f for f in zip_ref.namelist() if f.endswith('.csv')]
-                for csv_file in csv_files:
-                    zip_ref.extract(csv_file, extract_path)
-                    csv_path = os.path.join(extract_path, csv_file)
-                    parquet_path = csv_path.replace('.csv', '.parquet')
-                    
-                    print(f"Converting {csv_file} to Parquet format...")
-                    if self.convert_csv_to_parquet(csv_path, parquet_path):
-                        success = True
-                    elif os.path.exists(csv_path):
-                        os.remove(csv_path)
-            return success
+            written = self.store.ingest_zip(zip_path, self.symbol, markets.schema(self.market, self.dataset), remote=remote)
+            for source, days in written.items():
+                merged = sum(1 for entry in days.values() if entry['merged'])
+                print(f"Converted {source}: {len(days)} days" + (f", {merged} merged with other dumps" if merged else ""))
+            return bool(written)
         except Exception as e:
-            print(f"Error extracting zip: {e}")
+            print(f"Error converting {os.path.basename(zip_path)}: {e}")
             return False
 
+    def process_download(self, job):
+        try:
+            print(f"Processing {os.path.basename(job.path)}...")
+            return self.extract_and_convert(job.path, self.remote_entry(job))
+        finally:
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+    def remote_entry(self, job):
+        return {
+            'url': job.url,
+            'size': os.path.getsize(job.path),
+            'sha256': job.digest,
+            'verified': job.sha256 is not None,
+            'downloaded': datetime.now().isoformat(timespec='seconds'),
+        }
+
     def download_daily_trades(self, year=2025, month=3):
+        import humanize
+        from downloader import DownloadJob
+        
         existing_files = self.get_existing_files()
         print(f"\nFound {len(existing_files)} existing processed files")
         if existing_files:
@@ -156,10 +139,12 @@ class BinanceDailyTradesManager:
             date = first_day + timedelta(days=day-1)
             date_str = date.strftime('%Y-%m-%d')
             
-            parquet_filename = f"ETHUSDT-trades-{date_str}.parquet"
-            parquet_path = os.path.join(self.trades_dir, parquet_filename)
-            if os.path.exists(parquet_path):
-                print(f"Skipping {date_str} - parquet file already exists")
+            # Daily dumps appear the day after, so today and later cannot be fetched yet
+            if date.date() >= datetime.now(timezone.utc).date():
+                break
+            
+            if date_str in existing_files:
+                print(f"Skipping {date_str} - already in the lake")
                 continue
             
             days_to_download.append(date)
@@ -168,60 +153,54 @@ class BinanceDailyTradesManager:
             print("\nAll files are up to date!")
             return
         
-        total_files = len(days_to_download)
-        print(f"\nFiles to download: {total_files}")
+        print(f"\n{len(days_to_download)} days to check remotely, the rest are complete in the manifest")
         
-        processed_count = 0
-        for idx, date in enumerate(days_to_download, 1):
-            date_str = date.strftime('%Y-%m-%d')
-            zip_filename = f"ETHUSDT-trades-{date_str}.zip"
-            
-            zip_url = f"{BASE_URL}/{zip_filename}"
-            zip_path = os.path.join(self.trades_dir, zip_filename)
-            
-            try:
-                print(f"\nProcessing file {idx}/{total_files}: {zip_filename}")
-                
-                file_size = self.get_file_size(zip_url)
-                if file_size == 0:
-                    print(f"Skipping {zip_filename} - file not available or empty")
-                    continue
-                
-                print(f"File size: {humanize.naturalsize(file_size)}")
-                
-                free_space = self.get_free_space(self.trades_dir)
-                required_space = file_size * 2
-                
-                if required_space > free_space:
-                    print(f"Warning: Not enough disk space!")
-                    print(f"Required: {humanize.naturalsize(required_space)}")
-                    print(f"Available: {humanize.naturalsize(free_space)}")
-                    print("Please free up some space and try again.")
-                    break
-                
-                print(f"Downloading {zip_filename}...")
-                self.download_file(zip_url, zip_path)
-                
-                print(f"Processing {zip_filename}...")
-                if self.extract_and_convert(zip_path, self.trades_dir):
-                    processed_count += 1
-                
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error processing {zip_filename}: {e}")
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                continue
+        jobs = []
+        for date in days_to_download:
+            zip_filename = markets.dump_name(self.symbol, date.strftime('%Y-%m-%d'), self.dataset)
+            jobs.append(DownloadJob(f"{self.base_url}/{zip_filename}", os.path.join(self.trades_dir, zip_filename)))
+        self.engine.sizes(jobs)
         
-        print(f"\nDownload completed! Data saved to: {self.trades_dir}")
+        available = []
+        for job in jobs:
+            if job.size == 0:
+                print(f"Skipping {os.path.basename(job.path)} - file not available or empty")
+            else:
+                available.append(job)
+        
+        self.engine.checksums(available)
+        for job in available:
+            if job.sha256 is None:
+                print(f"Warning: no checksum published for {os.path.basename(job.path)}, it will not be verified")
+        
+        free_space = self.get_free_space(self.trades_dir)
+        jobs = []
+        for job in available:
+            candidate = jobs + [job]
+            required_space = sum(j.size for j in candidate) * 2
+            if required_space > free_space:
+                print(f"Warning: Not enough disk space!")
+                print(f"Required: {humanize.naturalsize(required_space)}")
+                print(f"Available: {humanize.naturalsize(free_space)}")
+                print("Please free up some space and try again.")
+                break
+            jobs = candidate
+        
+        if not jobs:
+            return
+        
+        total_files = len(jobs)
+        total_size = sum(job.size for job in jobs)
+        print(f"\nFiles to download: {total_files} ({humanize.naturalsize(total_size)}, {self.engine.workers} workers)")
+        
+        results = self.engine.run(jobs, process=self.process_download)
+        processed_count = sum(1 for result in results.values() if result is True)
+        
+        print(f"\nDownload completed! Data saved to: {self.lake_dir}")
         
         final_files = self.get_existing_files()
         print(f"Total files processed this run: {processed_count}")
-        print(f"Total files in directory: {len(final_files)}")
+        print(f"Total days in lake: {len(final_files)}")
         if final_files:
             print("Date range:", min(final_files), "to", max(final_files))
     
@@ -236,19 +215,7 @@ class BinanceDailyTradesManager:
             sys.exit(1)
     
     def get_daily_dates(self):
-        all_files = glob.glob(os.path.join(self.trades_dir, "ETHUSDT-trades-????-??-??.parquet"))
-        dates = []
-        
-        for file_path in all_files:
-            file_name = os.path.basename(file_path)
-            try:
-                date_part = file_name.split('-trades-')[1].split('.')[0]
-                dates.append(date_part)
-            except (IndexError, ValueError):
-                continue
-        
-        dates.sort()
-        return dates
+        return sorted(self.get_existing_files())
     
     def get_parquet_files(self, start_date, end_date=None):
         start_dt = self.parse_date(start_date)
@@ -261,7 +228,7 @@ class BinanceDailyTradesManager:
         if end_dt < start_dt:
             raise ValueError("End date must be after or equal to start date")
         
-        all_files = glob.glob(os.path.join(self.trades_dir, "ETHUSDT-trades-????-??-??.parquet"))
+        all_files = glob.glob(os.path.join(self.trades_dir, f"{self.symbol}-trades-????-??-??.parquet"))
         filtered_files = []
         for file_path in all_files:
             file_name = os.path.basename(file_path)
@@ -279,6 +246,11 @@ class BinanceDailyTradesManager:
         return filtered_files
     
     def load_parquet_files(self, file_paths, columns=None, sample_rate=None, verbose=True):
+        import pandas as pd
+        import pyarrow.parquet as pq
+        from tqdm import tqdm
+        import lake
+        
         if not file_paths:
             if verbose:
                 print("No files found for the specified date range")
@@ -287,6 +259,11 @@ class BinanceDailyTradesManager:
         dfs = []
         total_size = 0
         
+        sample = None
+        if sample_rate and 0 < sample_rate < 1:
+            sample = lake.sample_files(file_paths, sample_rate)
+            file_paths = [path for path in file_paths if path in sample]
+        
         if verbose:
             print(f"Loading {len(file_paths)} files...")
             file_iter = tqdm(file_paths)
@@ -295,14 +272,13 @@ class BinanceDailyTradesManager:
             
         for file_path in file_iter:
             try:
-                if columns:
+                if sample is not None:
+                    df = pq.ParquetFile(file_path).read_row_groups(sample[file_path], columns=columns).to_pandas()
+                elif columns:
                     df = pd.read_parquet(file_path, columns=columns, engine='pyarrow')
                 else:
                     df = pd.read_parquet(file_path, engine='pyarrow')
                 
-                if sample_rate and 0 < sample_rate < 1:
-                    df = df.sample(frac=sample_rate, random_state=42)
-                
                 dfs.append(df)
                 total_size += len(df)
                 
@@ -327,46 +303,58 @@ class BinanceDailyTradesManager:
         return result
     
     def load_trades(self, start_date, end_date=None, columns=None, sample_rate=None, verbose=True):
-        files = self.get_parquet_files(start_date, end_date)
+        import pandas as pd
+        import lake
+        
+        table = lake.load_trades(self.lake_dir, self.symbol, start_date, end_date, columns, sample_rate=sample_rate)
         
-        if not files:
+        if table is None or table.num_rows == 0:
             if verbose:
-                print(f"No files found for the specified date range: {start_date} to {end_date or start_date}")
+                print(f"No trades found for the specified date range: {start_date} to {end_date or start_date}")
             return None
         
         if verbose:
-            print(f"Found {len(files)} files for the specified date range")
-            for file in files:
-                print(f"  - {os.path.basename(file)}")
+            print(f"Loaded {table.num_rows:,} rows from {self.lake_dir}")
         
-        return self.load_parquet_files(files, columns, sample_rate, verbose)
-
-    def visualize_trades(self, df, timeframe='1min', price_col='price', save_path=None):
-        if df is None or len(df) == 0:
-            print("No data to visualize")
-            return
-        
-        if 'datetime' not in df.columns and 'time' in df.columns:
-            df['datetime'] = pd.to_datetime(df['time'], unit='ms')
+        result = table.to_pandas()
         
-        if 'datetime' not in df.columns:
-            print("No datetime column found in data")
-            return
-        
-        df = df.set_index('datetime')
+        if 'time' in result.columns:
+            result['datetime'] = pd.to_datetime(result['time'], unit='ms')
         
-        resampled = df[price_col].resample(timeframe).agg(['first', 'max', 'min', 'last'])
+        return result
+
+    def migrate_to_lake(self, remove=False):
+        files = sorted(glob.glob(os.path.join(self.trades_dir, f"{self.symbol}-trades-????-??-??.parquet")))
+        print(f"Importing {len(files)} files into {self.lake_dir}")
+        for file_path in files:
+            days = self.store.ingest_parquet(file_path, self.symbol)
+            print(f"  - {os.path.basename(file_path)}: {sum(entry['rows'] for entry in days.values()):,} rows in {len(days)} days")
+            if remove:
+                os.remove(file_path)
+
+    def visualize_trades(self, start_date, end_date=None, timeframe=None, width=None, save_path=None):
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
         
         fig, ax = plt.figure(figsize=(12, 6)), plt.gca()
+        width = width or int(fig.get_figwidth() * fig.dpi)
         
-        ax.plot(resampled.index, resampled['last'], label=f'ETH/USDT ({timeframe} timeframe)')
+        bars, level = self.store.ohlc(self.symbol, start_date, end_date, width=width, timeframe=timeframe)
+        if len(bars) == 0:
+            plt.close(fig)
+            print("No data to visualize")
+            return
+        timeframe = timeframe or level
+        
+        ax.fill_between(bars.index, bars['low'], bars['high'], alpha=0.2, step='post', label='High/low')
+        ax.plot(bars.index, bars['close'], label=f'{self.symbol} ({timeframe} timeframe)')
         
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
         plt.xticks(rotation=45)
         
         plt.xlabel('Time')
         plt.ylabel('Price (USDT)')
-        plt.title(f'ETH/USDT Price ({timeframe} timeframe)')
+        plt.title(f'{self.symbol} Price ({timeframe} timeframe)')
         
         plt.grid(True, alpha=0.3)
         plt.legend()
@@ -379,19 +367,20 @@ class BinanceDailyTradesManager:
         else:
             plt.show()
 
-def main():
-    pd.set_option('display.max_rows', 20)
-    pd.set_option('display.max_columns', None)
-    pd.set_option('display.width', None)
-    pd.set_option('display.float_format', lambda x: '%.5f' % x)
-    
-    manager = BinanceDailyTradesManager()
-    
-    start_date = datetime(2025, 5, 1)
-    today = datetime.now()
-    yesterday = today - timedelta(days=1)
+def manager_for(args, trades_dir=None, **kwargs):
+    """A manager for the symbol, market, dataset and lake the command line names"""
+    return BinanceDailyTradesManager(trades_dir, lake_dir=args.lake_dir, symbol=args.symbol, market=args.market,
+                                     dataset=args.dataset, **kwargs)
+
+# ===== COMMANDS =====
+# One function per sub-command, importing only what that command uses
+
+def run_download(args):
+    manager = manager_for(args, args.output_dir, workers=args.workers, base_url=args.base_url)
     
-    print(f"Downloading ETH/USDT trades data from March 2025 to {yesterday.strftime('%Y-%m-%d')}...")
+    start_date = datetime(args.start_year, args.start_month, 1)
+    yesterday = datetime.now() - timedelta(days=1)
+    print(f"Downloading {manager.symbol} daily {manager.dataset} from {start_date.strftime('%B %Y')} to {yesterday.strftime('%Y-%m-%d')}...")
     
     current_date = start_date
     while current_date <= yesterday:
@@ -403,6 +392,10 @@ def main():
         else:
             current_date = datetime(current_date.year, current_date.month + 1, 1)
     
+    run_list(args, manager)
+
+def run_list(args, manager=None):
+    manager = manager or manager_for(args)
     daily_dates = manager.get_daily_dates()
     if daily_dates:
         print(f"\nAvailable data files ({len(daily_dates)}):")
@@ -412,5 +405,69 @@ def main():
     else:
         print("No data files found")
 
+def run_migrate(args):
+    manager = manager_for(args, args.data_dir)
+    manager.migrate_to_lake(remove=args.remove)
+
+def run_visualize(args):
+    manager = manager_for(args)
+    print(f"Visualizing {args.start_date} to {args.end_date or args.start_date}")
+    manager.visualize_trades(args.start_date, args.end_date, timeframe=args.timeframe, width=args.width, save_path=args.save)
+
+def build_parser():
+    """
+    The command line: only plain data goes into it (no heavy module is
+    imported to fill in defaults or choices), so --help stays instant
+    """
+    parser = argparse.ArgumentParser(description='Binance Trades Manager - Download and Analyze Daily Trade Data')
+    parser.add_argument('--symbol', type=str, default=SYMBOL, help=f'Symbol (default: {SYMBOL})')
+    parser.add_argument('--market', type=str, default=markets.DEFAULT_MARKET, choices=list(markets.MARKETS),
+                        help=f'Market: um, cm or spot (default: {markets.DEFAULT_MARKET})')
+    parser.add_argument('--dataset', type=str, default=markets.DEFAULT_DATASET, choices=list(markets.DATASETS),
+                        help=f'Dump dataset and the lake it goes to (default: {markets.DEFAULT_DATASET})')
+    subparsers = parser.add_subparsers(dest='command', help='Command to run')
+    
+    # Download command
+    download_parser = subparsers.add_parser('download', help='Download daily trade data up to yesterday')
+    download_parser.add_argument('--start_year', type=int, default=2025, help='Starting year (default: 2025)')
+    download_parser.add_argument('--start_month', type=int, default=5, help='Starting month (default: 5)')
+    download_parser.add_argument('--output_dir', type=str, help='Directory zips are downloaded to (optional)')
+    download_parser.add_argument('--workers', type=int, help='Concurrent downloads (default: downloader.DEFAULT_WORKERS)')
+    download_parser.add_argument('--base_url', type=str, help='Download base URL (default: the symbol\'s Binance data vision directory)')
+    download_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    download_parser.set_defaults(run=run_download)
+    
+    # List command
+    list_parser = subparsers.add_parser('list', help='List the days in the lake')
+    list_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    list_parser.set_defaults(run=run_list)
+    
+    # Migrate command
+    migrate_parser = subparsers.add_parser('migrate', help='Import flat daily Parquet files into the lake')
+    migrate_parser.add_argument('--data_dir', type=str, help='Directory with the flat files (optional)')
+    migrate_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    migrate_parser.add_argument('--remove', action='store_true', help='Delete flat files once imported')
+    migrate_parser.set_defaults(run=run_migrate)
+    
+    # Visualize command
+    visualize_parser = subparsers.add_parser('visualize', help='Visualize daily trade data')
+    visualize_parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    visualize_parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    visualize_parser.add_argument('--timeframe', type=str, help='Timeframe for resampling (default: fit the span to the plot width)')
+    visualize_parser.add_argument('--width', type=int, help='Plot width in pixels (default: the figure width)')
+    visualize_parser.add_argument('--save', type=str, help='Path to save the figure (optional)')
+    visualize_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    visualize_parser.set_defaults(run=run_visualize)
+    
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return
+    args.run(args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+Download engine shared by the Binance trade managers.
+
+- one keep-alive requests.Session with a connection pool sized to the workers
+- a thread pool of concurrent downloads
+- resumable transfers: data goes to <file>.part and an interrupted file is
+  continued with an HTTP Range request instead of starting over
+- 1 MiB buffered chunks instead of 1 KiB
+- pipelining: each finished file is handed to a processing pool (e.g. zip ->
+  parquet conversion) while the remaining downloads keep running
+- budgets: the worker count caps concurrent transfers and an optional
+  bandwidth limit (token bucket shared by all workers) caps bytes/s
+- per-group progress: jobs tagged with a group (e.g. a symbol) get their
+  own progress bar under the overall one
+- integrity: files are SHA-256 hashed as they stream in and checked against
+  the <file>.CHECKSUM companion data.binance.vision publishes
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+DEFAULT_WORKERS = 4
+CHUNK_SIZE = 1 << 20
+PART_SUFFIX = ".part"
+CHECKSUM_SUFFIX = ".CHECKSUM"
+
+
+@dataclass
+class DownloadJob:
+    url: str
+    path: str
+    size: int = 0  # Expected bytes from HEAD (0 = unknown)
+    sha256: str = None  # Expected digest from the .CHECKSUM file (None = unchecked)
+    digest: str = None  # SHA-256 of the finished file, set by fetch
+    group: str = None  # Progress bar the job counts towards, besides the overall one
+
+
+class RateLimiter:
+    """Token bucket shared by all download threads: rate bytes/s on average, bursts up to one second's worth."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Go into debt and sleep it off, so chunks larger than the bucket still pass
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ProgressGroup:
+    """Forwards progress updates to several bars."""
+
+    def __init__(self, *bars):
+        self.bars = [bar for bar in bars if bar is not None]
+
+    def update(self, amount):
+        for bar in self.bars:
+            bar.update(amount)
+
+
+class DownloadEngine:
+    """Concurrent, resumable HTTP downloads over a shared session."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, chunk_size=CHUNK_SIZE, timeout=30, retries=3, retry_delay=2,
+                 bandwidth=None):
+        self.workers = workers
+        self.limiter = RateLimiter(bandwidth) if bandwidth else None
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def head(self, url):
+        """Content length of url, or 0 if it is missing or unreachable."""
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if response.status_code != 200:
+                return 0
+            return int(response.headers.get('content-length', 0))
+        except requests.RequestException as e:
+            print(f"Error checking file size for {url}: {e}")
+            return 0
+
+    def sizes(self, jobs):
+        """Fill in job.size for all jobs with concurrent HEAD requests."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for job, size in zip(jobs, pool.map(lambda j: self.head(j.url), jobs)):
+                job.size = size
+        return jobs
+
+    def checksum(self, url):
+        """SHA-256 hex digest published in url's .CHECKSUM file, or None if there is none."""
+        try:
+            response = self.session.get(url + CHECKSUM_SUFFIX, timeout=self.timeout)
+            if response.status_code != 200:
+                return None
+            # "<sha256>  <file name>"
+            return response.text.split()[0].lower() if response.text.strip() else None
+        except requests.RequestException as e:
+            print(f"Error fetching checksum for {url}: {e}")
+            return None
+
+    def checksums(self, jobs):
+        """Fill in job.sha256 for all jobs with concurrent .CHECKSUM requests."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for job, sha256 in zip(jobs, pool.map(lambda j: self.checksum(j.url), jobs)):
+                job.sha256 = sha256
+        return jobs
+
+    def _hash_part(self, part_path):
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as file:
+            for data in iter(lambda: file.read(self.chunk_size), b''):
+                hasher.update(data)
+        return hasher
+
+    def fetch(self, job, progress=None):
+        """
+        Download one job to job.path, resuming a leftover .part file, and set
+        job.digest. A file that does not match job.sha256 is discarded.
+
+        Returns the number of bytes transferred by this call.
+        """
+        part_path = job.path + PART_SUFFIX
+        transferred = 0
+        reported = 0  # bytes of this job already counted on the progress bar
+        for attempt in range(1, self.retries + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if job.size and offset > job.size:
+                # Left over from a different file: no range of this one can complete it
+                os.remove(part_path)
+                offset = 0
+            hasher = self._hash_part(part_path) if offset else hashlib.sha256()
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self.session.get(job.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 416 and offset:
+                        break  # the .part file already holds the whole body
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # Server ignored the range: start over
+                        offset = 0
+                        hasher = hashlib.sha256()
+                    if progress is not None:
+                        progress.update(offset - reported)
+                        reported = offset
+                    with open(part_path, 'ab' if offset else 'wb') as file:
+                        for data in response.iter_content(chunk_size=self.chunk_size):
+                            if self.limiter is not None:
+                                self.limiter.acquire(len(data))
+                            file.write(data)
+                            hasher.update(data)
+                            transferred += len(data)
+                            if progress is not None:
+                                progress.update(len(data))
+                                reported += len(data)
+                break
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    raise
+                print(f"Retrying {os.path.basename(job.path)} ({attempt}/{self.retries}): {e}")
+                time.sleep(self.retry_delay * attempt)
+
+        actual = os.path.getsize(part_path)
+        if job.size and actual != job.size:
+            if actual > job.size:
+                # Resuming past the end would only ever get a 416: start over next time
+                os.remove(part_path)
+            raise IOError(f"Incomplete download {job.path}: {actual} of {job.size} bytes")
+        job.digest = hasher.hexdigest()
+        if job.sha256 and job.digest != job.sha256:
+            # Resuming a corrupt file would never succeed: start over next time
+            os.remove(part_path)
+            raise IOError(f"Checksum mismatch for {job.path}: got {job.digest}, expected {job.sha256}")
+        os.replace(part_path, job.path)
+        return transferred
+
+    def run(self, jobs, process=None, process_workers=1, desc="Downloading"):
+        """
+        Download all jobs concurrently, passing each finished file to process(job).
+
+        Processing runs in its own pool, so converting one file overlaps the
+        downloads still in flight. Returns {job.path: result or Exception}.
+        """
+        results = {}
+        total = sum(job.size for job in jobs)
+        groups = sorted({job.group for job in jobs if job.group})
+        with tqdm(desc=desc, total=total or None, unit='iB', unit_scale=True, unit_divisor=1024) as progress, \
+                ThreadPoolExecutor(max_workers=self.workers) as downloads, \
+                ThreadPoolExecutor(max_workers=process_workers) as processing:
+            group_bars = {group: tqdm(desc=group, total=sum(job.size for job in jobs if job.group == group) or None,
+                                      unit='iB', unit_scale=True, unit_divisor=1024, position=i, leave=False)
+                          for i, group in enumerate(groups, 1)}
+            pending = {downloads.submit(self.fetch, job, ProgressGroup(progress, group_bars.get(job.group))): job
+                       for job in jobs}
+            processed = {}
+            for future in as_completed(pending):
+                job = pending[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    results[job.path] = e
+                    tqdm.write(f"Download failed for {os.path.basename(job.path)}: {e}")
+                    continue
+                if process is None:
+                    results[job.path] = True
+                else:
+                    processed[processing.submit(process, job)] = job
+            for future in as_completed(processed):
+                job = processed[future]
+                try:
+                    results[job.path] = future.result()
+                except Exception as e:
+                    results[job.path] = e
+                    tqdm.write(f"Processing failed for {os.path.basename(job.path)}: {e}")
+            for bar in group_bars.values():
+                bar.close()
+        return results
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Store for Binance 1s kline dumps: a lake with the trade lake's partitions
+whose days hold only OHLC pyramid files (see pyramid.py).
+
+A day's _ohlc_1s.parquet comes straight from the dump, at most 86,400 rows
+a day however busy the market was, and the coarser levels are rolled up
+from it as for trades. Seconds without trades are dropped on the way in:
+their bar repeats the previous close, which would leak into the open, high
+and low of coarser bars, and the trade pyramid has no such bars either. Charts and 5s/1m candles (TradeStore.ohlc with a timeframe)
+then never touch individual trades. What klines lack is per-trade detail:
+no trade sides or sizes, only the trade count per second. For those use
+the trades or aggTrades lakes.
+
+The manifest has the trade store's shape. Klines carry no ids to merge by,
+so a day is simply taken from the preferred dump (monthly over daily, newer
+over older within a kind), and a dump never partially covers a day.
+"""
+
+import os
+import zipfile
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import lake
+import pyramid
+from converter import KLINES_SCHEMA, open_member
+from trade_store import TradeStore, source_kind
+
+BASE_LEVEL = '1s'
+
+
+class KlineStore(TradeStore):
+    """A TradeStore whose day files are 1s bars instead of trades."""
+
+    def day_path(self, symbol, day):
+        return pyramid.level_path(self.lake_dir, symbol, day, BASE_LEVEL)
+
+    # ===== INGEST =====
+
+    def ingest_zip(self, zip_path, symbol, schema=KLINES_SCHEMA, remote=None):
+        """
+        Read a 1s klines dump (a day or a month, a few million rows at most)
+        into the store. remote describes the downloaded file (see
+        TradeStore.commit). Returns {source: {date: entry}}.
+        """
+        committed = {}
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            members = [member for member in zip_ref.namelist() if member.endswith('.csv')]
+            for member in members:
+                if len(members) == 1:
+                    source = os.path.splitext(os.path.basename(zip_path))[0]
+                else:
+                    source = os.path.basename(member)[:-len('.csv')]
+                bars = pyramid.kline_bars(open_member(zip_ref, member, schema).read_all())
+                bars = bars.filter(pc.greater(bars.column('trades'), 0)).sort_by('time')
+                committed[source] = self.commit(symbol, source, split_days(bars), remote)
+        return committed
+
+    def ingest_parquet(self, parquet_path, symbol, source=None):
+        raise ValueError("Kline lakes are filled from kline dumps only")
+
+    def _commit_day(self, symbol, day, source, incoming):
+        bars = incoming['bars']
+        days = self._symbol(symbol)['days']
+        key = day.isoformat()
+        times = pc.min_max(bars.column('time'))
+        entry = {'rows': bars.num_rows, 'first_time': times['min'].as_py(), 'last_time': times['max'].as_py(),
+                 'source': source, 'kind': source_kind(source), 'merged': []}
+        current = days.get(key)
+        if current is not None and os.path.exists(self.day_path(symbol, day)) and self._rank(current) > self._rank(entry):
+            return current
+        os.makedirs(lake.partition_dir(self.lake_dir, symbol, day), exist_ok=True)
+        pyramid.build_day(self.lake_dir, symbol, day, bars)
+        days[key] = entry
+        return entry
+
+    # ===== MAINTENANCE =====
+
+    def rewrite(self, layout, symbols=None, progress=None):
+        raise ValueError("Kline lakes hold OHLC bars only and have no trade layout to rewrite")
+
+    def _day_stale(self, symbol, day):
+        return pyramid.is_stale(self.lake_dir, symbol, day, base_level=BASE_LEVEL)
+
+    def _build_day(self, symbol, day):
+        bars = pq.read_table(self.day_path(symbol, day), schema=pyramid.BAR_SCHEMA)
+        pyramid.build_day(self.lake_dir, symbol, day, bars.sort_by('time'))
+
+
+def split_days(bars):
+    """Time-ordered bars as {date: {'bars', 'rows'}} per UTC day, the shape TradeStore.commit takes."""
+    days = pc.divide(bars.column('time'), lake.DAY_MS)
+    staged = {}
+    for day in pc.unique(days).to_pylist():
+        day_bars = bars.filter(pc.equal(days, day))
+        staged[lake.day_of(day)] = {'bars': day_bars, 'rows': day_bars.num_rows}
+    return staged
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Hive-partitioned trade lake: <lake>/symbol=ETHUSDT/year=2025/month=05/day=03/trades.parquet
+
+Source dumps (monthly or daily zips) are split into one file per UTC day,
+sorted by time, written in row groups with column statistics and the time
+sort order recorded in the Parquet metadata. Codec, encodings, qty width and
+row-group size form the lake's layout (see DEFAULT_LAYOUT); which layout the
+lake uses and which dump each day file came from are tracked by
+trade_store.TradeStore, which owns writes.
+Reads go through a pyarrow dataset scanner: the year/month/day filter prunes
+directories, the time filter is checked against row-group statistics, and
+only the requested columns are decoded, using all cores, into one Arrow table.
+"""
+
+import os
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from converter import COMPRESSION, TRADES_SCHEMA
+
+DEFAULT_LAKE_DIR = "/allah/data/trades/lake"
+DAY_FILE = "trades.parquet"
+# Smaller than the flat-file row groups: about an hour of ETHUSDT trades, so
+# short time ranges only decode a few groups
+ROW_GROUP_ROWS = 250_000
+SAMPLE_SEED = 42
+# id and time only ever grow, which delta encoding exploits
+DELTA_COLUMNS = ('id', 'time')
+ID_TIME_ENCODINGS = ('dictionary', 'plain', 'delta')
+QTY_TYPES = {'float64': pa.float64(), 'float32': pa.float32()}
+DEFAULT_LAYOUT = {
+    'compression': COMPRESSION,
+    'compression_level': None,
+    'id_time_encoding': 'dictionary',
+    'qty_type': 'float64',
+    'row_group_rows': ROW_GROUP_ROWS,
+}
+DAY_MS = 86_400_000
+PARTITION_FIELDS = ('symbol', 'year', 'month', 'day')
+PARTITIONING = ds.partitioning(pa.schema([
+    ('symbol', pa.string()),
+    ('year', pa.int16()),
+    ('month', pa.int8()),
+    ('day', pa.int8()),
+]), flavor='hive')
+
+
+def day_of(day_index):
+    return (datetime(1970, 1, 1) + timedelta(days=int(day_index))).date()
+
+
+def partition_dir(lake_dir, symbol, day):
+    return os.path.join(lake_dir, f"symbol={symbol}", f"year={day.year}", f"month={day.month:02d}", f"day={day.day:02d}")
+
+
+def layout_schema(schema=TRADES_SCHEMA, layout=DEFAULT_LAYOUT):
+    """The schema day files are stored with under layout."""
+    index = schema.get_field_index('qty')
+    return schema.set(index, schema.field(index).with_type(QTY_TYPES[layout['qty_type']]))
+
+
+def writer_options(schema, layout=DEFAULT_LAYOUT):
+    """ParquetWriter keyword arguments for layout."""
+    options = {'compression': layout['compression'], 'write_statistics': True,
+               'sorting_columns': [pq.SortingColumn(schema.get_field_index('time'))]}
+    if layout['compression_level'] is not None:
+        options['compression_level'] = layout['compression_level']
+    encoding = layout['id_time_encoding']
+    if encoding != 'dictionary':
+        options['use_dictionary'] = [name for name in schema.names if name not in DELTA_COLUMNS]
+    if encoding == 'delta':
+        options['column_encoding'] = {name: 'DELTA_BINARY_PACKED' for name in DELTA_COLUMNS}
+    return options
+
+
+def open_day_writer(path, schema=TRADES_SCHEMA, layout=DEFAULT_LAYOUT):
+    """Writer for a day file; schema must already be layout_schema(..., layout)."""
+    return pq.ParquetWriter(path, schema, **writer_options(schema, layout))
+
+
+def write_day(table, path, layout=DEFAULT_LAYOUT):
+    """Write a whole day table sorted by time, in layout."""
+    table = table.cast(layout_schema(table.schema, layout))
+    with open_day_writer(path, table.schema, layout) as writer:
+        writer.write_table(table.sort_by([('time', 'ascending'), ('id', 'ascending')]),
+                           row_group_size=layout['row_group_rows'])
+
+
+def table_stats(table):
+    """Row count and id/time bounds of a day table, as stored in the manifest."""
+    ids = pc.min_max(table.column('id'))
+    times = pc.min_max(table.column('time'))
+    return {'rows': table.num_rows, 'first_id': ids['min'].as_py(), 'last_id': ids['max'].as_py(),
+            'first_time': times['min'].as_py(), 'last_time': times['max'].as_py()}
+
+
+class PartitionWriter:
+    """
+    Split a stream of trade batches from one source into staged per-day files.
+
+    Dumps arrive in time order, so each day's rows are buffered into row groups
+    that are sorted before writing; a day whose row groups turn out to overlap
+    is re-sorted as a whole on close(). Days are staged under a hidden name in
+    their partition directory (ignored by dataset scans) for the caller to
+    commit, so readers never see a partially converted source.
+    """
+
+    def __init__(self, lake_dir, symbol, source, schema=TRADES_SCHEMA, layout=DEFAULT_LAYOUT):
+        self.lake_dir = lake_dir
+        self.symbol = symbol
+        self.source = source
+        self.schema = layout_schema(schema, layout)
+        self.layout = layout
+        self.row_group_rows = layout['row_group_rows']
+        self.days = {}  # day index -> staging state
+
+    def write(self, batch):
+        if batch.num_rows == 0:
+            return
+        days = pc.divide(batch.column('time'), DAY_MS)
+        first, last = pc.min_max(days).values()
+        if first == last:
+            self._append(first.as_py(), batch)
+        else:
+            for day in pc.unique(days).to_pylist():
+                self._append(day, batch.filter(pc.equal(days, day)))
+
+    def _state(self, day):
+        state = self.days.get(day)
+        if state is None:
+            directory = partition_dir(self.lake_dir, self.symbol, day_of(day))
+            os.makedirs(directory, exist_ok=True)
+            state = {
+                'tmp': os.path.join(directory, f".{self.source}.parquet.tmp"),
+                'writer': None, 'pending': [], 'pending_rows': 0, 'sorted': True,
+                'rows': 0, 'first_id': None, 'last_id': None, 'first_time': None, 'last_time': None,
+            }
+            self.days[day] = state
+        return state
+
+    def _append(self, day, batch):
+        # The stream has moved past earlier days: write out what they still hold
+        for other, state in self.days.items():
+            if other < day and state['pending_rows']:
+                self._flush(state)
+        state = self._state(day)
+        state['pending'].append(batch)
+        state['pending_rows'] += batch.num_rows
+        if state['pending_rows'] >= self.row_group_rows:
+            self._flush(state)
+
+    def _flush(self, state):
+        table = pa.Table.from_batches(state['pending']).sort_by([('time', 'ascending'), ('id', 'ascending')])
+        table = table.cast(self.schema)
+        state['pending'], state['pending_rows'] = [], 0
+        if state['writer'] is None:
+            state['writer'] = open_day_writer(state['tmp'], self.schema, self.layout)
+        stats = table_stats(table)
+        if state['last_time'] is not None and stats['first_time'] < state['last_time']:
+            state['sorted'] = False
+        if state['first_id'] is None:
+            state.update(stats)
+        else:
+            state['rows'] += stats['rows']
+            state['first_id'] = min(state['first_id'], stats['first_id'])
+            state['last_id'] = max(state['last_id'], stats['last_id'])
+            state['first_time'] = min(state['first_time'], stats['first_time'])
+            state['last_time'] = max(state['last_time'], stats['last_time'])
+        state['writer'].write_table(table, row_group_size=self.row_group_rows)
+
+    def close(self):
+        """
+        Finish every staged day file.
+
+        Returns {date: {'tmp': staged path, 'rows', 'first_id', 'last_id',
+        'first_time', 'last_time'}}.
+        """
+        for state in self.days.values():
+            if state['pending_rows']:
+                self._flush(state)
+            state['writer'].close()
+            if not state['sorted']:
+                write_day(pq.read_table(state['tmp']), state['tmp'], self.layout)
+        keys = ('tmp', 'rows', 'first_id', 'last_id', 'first_time', 'last_time')
+        return {day_of(day): {key: state[key] for key in keys} for day, state in sorted(self.days.items())}
+
+    def abort(self):
+        for state in self.days.values():
+            if state['writer'] is not None:
+                state['writer'].close()
+            if os.path.exists(state['tmp']):
+                os.remove(state['tmp'])
+
+
+def stage_source(batches, lake_dir, symbol, source, schema=TRADES_SCHEMA, layout=DEFAULT_LAYOUT):
+    """Stage an iterable of record batches as one source (see PartitionWriter.close)."""
+    writer = PartitionWriter(lake_dir, symbol, source, schema, layout)
+    try:
+        for batch in batches:
+            writer.write(batch)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def dataset(lake_dir):
+    # An explicit schema so day files in any layout (e.g. float32 qty, or a
+    # lake halfway through a rewrite) read back as TRADES_SCHEMA
+    schema = pa.unify_schemas([TRADES_SCHEMA, PARTITIONING.schema])
+    return ds.dataset(lake_dir, schema=schema, format='parquet', partitioning=PARTITIONING)
+
+
+def period_bounds(value):
+    """
+    [start, end) in epoch ms of the period a value names: 'YYYY-MM' is a whole
+    month, 'YYYY-MM-DD' a whole day, anything else pandas can parse an instant.
+    """
+    if isinstance(value, str) and len(value) in (7, 10):
+        start = pd.Timestamp(value, tz='UTC')
+        end = start + (pd.DateOffset(months=1) if len(value) == 7 else pd.Timedelta(days=1))
+    else:
+        start = pd.Timestamp(value)
+        start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+        end = start
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def _on_or_after(day):
+    year, month, dom = ds.field('year'), ds.field('month'), ds.field('day')
+    return ((year > day.year) | ((year == day.year) & (month > day.month)) |
+            ((year == day.year) & (month == day.month) & (dom >= day.day)))
+
+
+def _on_or_before(day):
+    year, month, dom = ds.field('year'), ds.field('month'), ds.field('day')
+    return ((year < day.year) | ((year == day.year) & (month < day.month)) |
+            ((year == day.year) & (month == day.month) & (dom <= day.day)))
+
+
+def trade_filter(symbol, start_ms, end_ms):
+    """Partition pruning on symbol/year/month/day plus the row-level time range."""
+    first_day = day_of(start_ms // DAY_MS)
+    last_day = day_of((end_ms - 1) // DAY_MS)
+    return ((ds.field('symbol') == symbol) & _on_or_after(first_day) & _on_or_before(last_day) &
+            (ds.field('time') >= start_ms) & (ds.field('time') < end_ms))
+
+
+def sample_units(sizes, rate, seed=SAMPLE_SEED):
+    """
+    Indices of the units (row groups, in time order) to read for a sample of
+    about rate of all rows.
+
+    Systematic sampling by error diffusion: every unit adds rate * its rows to
+    a quota, and a unit is read whole once the quota covers at least half of
+    it. The sampled share of rows therefore tracks rate through the whole time
+    range, so each stretch of history is represented in proportion to its
+    trade count. A seeded starting phase makes the pick deterministic per
+    seed; nothing outside the picked units is decoded.
+    """
+    if not sizes or not sum(sizes):
+        return []
+    rng = random.Random(seed)
+    mean = sum(sizes) / len(sizes)
+    quota = (rng.random() - 0.5) * mean
+    selected = []
+    for index, size in enumerate(sizes):
+        quota += rate * size
+        if quota >= size / 2:
+            selected.append(index)
+            quota -= size
+    return selected or [rng.randrange(len(sizes))]
+
+
+def sample_files(file_paths, rate, seed=SAMPLE_SEED):
+    """
+    Row groups to read from time-ordered flat Parquet files for a sample of
+    about rate of their rows (see sample_units). Returns {path: [row group]}.
+    """
+    units = []
+    for path in file_paths:
+        metadata = pq.ParquetFile(path).metadata
+        units.extend((path, i, metadata.row_group(i).num_rows) for i in range(metadata.num_row_groups))
+    plan = {}
+    for index in sample_units([rows for _, _, rows in units], rate, seed):
+        path, group, _ = units[index]
+        plan.setdefault(path, []).append(group)
+    return plan
+
+
+def _sampled(data, symbol, start_ms, end_ms, rate, seed):
+    """The dataset restricted to a time-stratified sample of the row groups in range."""
+    time_filter = (ds.field('time') >= start_ms) & (ds.field('time') < end_ms)
+    groups = []
+    for fragment in sorted(data.get_fragments(filter=trade_filter(symbol, start_ms, end_ms)), key=lambda f: f.path):
+        groups.extend(fragment.split_by_row_group(time_filter))
+    picked = [groups[i] for i in sample_units([g.row_groups[0].num_rows for g in groups], rate, seed)]
+    return ds.FileSystemDataset(picked, data.schema, data.format, data.filesystem)
+
+
+def load_trades(lake_dir, symbol, start, end=None, columns=None, use_threads=True, sample_rate=None, seed=SAMPLE_SEED):
+    """
+    Trades of symbol from the start of period start to the end of period end
+    (see period_bounds) as one Arrow table.
+
+    With a sample_rate below 1 only a time-stratified subset of the row groups
+    in range is read (see sample_units).
+    """
+    start_ms = period_bounds(start)[0]
+    end_ms = period_bounds(end if end is not None else start)[1]
+    if not os.path.isdir(lake_dir):
+        return None
+    data = dataset(lake_dir)
+    if columns is None:
+        columns = [name for name in data.schema.names if name not in PARTITION_FIELDS]
+    if sample_rate and 0 < sample_rate < 1:
+        data = _sampled(data, symbol, start_ms, end_ms, sample_rate, seed)
+    return data.to_table(columns=columns, filter=trade_filter(symbol, start_ms, end_ms), use_threads=use_threads)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Binance markets and datasets whose dumps the tools can download.
+
+data.binance.vision lays dumps out as
+  <DATA_URL>/<market path>/<monthly|daily>/trades/<SYMBOL>/<SYMBOL>-trades-<YYYY-MM[-DD]>.zip
+  <DATA_URL>/<market path>/<monthly|daily>/aggTrades/<SYMBOL>/<SYMBOL>-aggTrades-<YYYY-MM[-DD]>.zip
+  <DATA_URL>/<market path>/<monthly|daily>/klines/<SYMBOL>/1s/<SYMBOL>-1s-<YYYY-MM[-DD]>.zip
+
+Each market has its own lake (same layout, see lake.py) since the same
+symbol names a different instrument in each. COIN-M lakes hold the dumps'
+base_qty (coin amount) in quote_qty, see converter.to_trades. COIN-M
+aggTrades only give quantity in contracts, so their quote_qty is NULL (and
+so is quote_qty_sum in bars aggregated from them); qty is the contract count.
+
+Each dataset gets its own lake next to the market's trade lake:
+  - trades: every fill, the reference
+  - aggTrades: fills of one taker order at one price merged, several times
+    fewer rows with the trade side kept (TradeStore, same layout as trades)
+  - klines_1s: 1s OHLCV bars, at most 86,400 rows a day, for candles of 1s and
+    up when no per-trade detail is needed (KlineStore)
+
+Only plain data lives here, so CLIs can build their argument parsers from it
+without importing pyarrow; schemas (converter attributes) and stores are
+looked up when asked for.
+"""
+
+import importlib
+import os
+
+DATA_URL = "https://data.binance.vision/data"
+DEFAULT_MARKET = 'um'
+DEFAULT_DATASET = 'trades'
+MARKETS = {
+    'um': {'path': 'futures/um', 'schema': 'TRADES_SCHEMA', 'agg_schema': 'AGG_TRADES_SCHEMA',
+           'lake_dir': "/allah/data/trades/lake"},  # lake.DEFAULT_LAKE_DIR
+    'cm': {'path': 'futures/cm', 'schema': 'CM_TRADES_SCHEMA', 'agg_schema': 'CM_AGG_TRADES_SCHEMA',
+           'lake_dir': "/allah/data/trades/lake_cm"},
+    'spot': {'path': 'spot', 'schema': 'SPOT_TRADES_SCHEMA', 'agg_schema': 'SPOT_AGG_TRADES_SCHEMA',
+             'lake_dir': "/allah/data/trades/lake_spot"},
+}
+# path: directory under <period>/, name: the part of dump names after the symbol
+DATASETS = {
+    'trades': {'path': 'trades', 'name': 'trades', 'suffix': '', 'store': 'trade_store.TradeStore'},
+    'aggTrades': {'path': 'aggTrades', 'name': 'aggTrades', 'suffix': '_agg', 'store': 'trade_store.TradeStore'},
+    'klines_1s': {'path': 'klines', 'interval': '1s', 'name': '1s', 'suffix': '_klines_1s',
+                  'store': 'kline_store.KlineStore'},
+}
+
+
+def base_url(market, period, symbol, data_url=DATA_URL, dataset=DEFAULT_DATASET):
+    """Directory URL of a symbol's monthly or daily dumps of dataset."""
+    url = f"{data_url.rstrip('/')}/{MARKETS[market]['path']}/{period}/{DATASETS[dataset]['path']}/{symbol}"
+    if 'interval' in DATASETS[dataset]:
+        url += f"/{DATASETS[dataset]['interval']}"
+    return url
+
+
+def source_prefix(symbol, dataset=DEFAULT_DATASET):
+    """What every dump (and store source) name of symbol's dataset starts with."""
+    return f"{symbol}-{DATASETS[dataset]['name']}-"
+
+
+def dump_name(symbol, key, dataset=DEFAULT_DATASET):
+    """Zip name of the dump for key 'YYYY-MM' (monthly) or 'YYYY-MM-DD' (daily)."""
+    return f"{source_prefix(symbol, dataset)}{key}.zip"
+
+
+def schema(market, dataset=DEFAULT_DATASET):
+    """CSV schema of the market's dumps of dataset (see converter)."""
+    import converter
+
+    if dataset == 'klines_1s':
+        return converter.KLINES_SCHEMA
+    return getattr(converter, MARKETS[market]['agg_schema' if dataset == 'aggTrades' else 'schema'])
+
+
+def lake_dir(market, root=None, dataset=DEFAULT_DATASET):
+    """
+    The market's lake of dataset: <root>/<market><suffix> with a root, else
+    the market's default directory plus the dataset suffix.
+    """
+    suffix = DATASETS[dataset]['suffix']
+    return os.path.join(root, market + suffix) if root else MARKETS[market]['lake_dir'] + suffix
+
+
+def open_store(directory, dataset=DEFAULT_DATASET):
+    """The store kind dataset is kept in (TradeStore or KlineStore), on the lake at directory."""
+    module, name = DATASETS[dataset]['store'].split('.')
+    return getattr(importlib.import_module(module), name)(directory)
@@ -1,25 +1,20 @@
 #!/usr/bin/env python
-import requests
+# Only the standard library and markets (plain data) are imported up front:
+# each command imports what it needs, so --help or a download never loads
+# the plotting stack and reading the lake never loads requests
 import os
-import time
 import sys
 import glob
-import zipfile
 import shutil
 import argparse
 import io
 from datetime import datetime
-from tqdm import tqdm
-import humanize
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from matplotlib.dates import DateFormatter
-import matplotlib.dates as mdates
-from tabulate import tabulate
 
-# Base URL for Binance data
-BASE_URL = "https://data.binance.vision/data/futures/um/monthly/trades/ETHUSDT"
+import markets
+
+# Default symbol and base URL for Binance data
+SYMBOL = "ETHUSDT"
+BASE_URL = markets.base_url(markets.DEFAULT_MARKET, 'monthly', SYMBOL)
 
 # Default directories
 DEFAULT_OUTPUT_DIR = "/allah/data/trades"
@@ -31,13 +26,29 @@ class BinanceTradesManager:
     Class for downloading and aggregating Binance monthly trade data
     """
     
-    def __init__(self, trades_dir=None):
+    def __init__(self, trades_dir=None, workers=None, base_url=None, lake_dir=None,
+                 symbol=SYMBOL, market=markets.DEFAULT_MARKET, dataset=markets.DEFAULT_DATASET):
         """
         Initialize the manager
         
         Parameters:
-        - trades_dir: Path to the directory containing trade Parquet files
+        - trades_dir: Path to the directory containing (pre-lake) flat trade Parquet files
+        - workers: Number of concurrent downloads (default: downloader.DEFAULT_WORKERS)
+        - base_url: Where the monthly zips are served from (default: the symbol's Binance data vision directory)
+        - lake_dir: Root of the partitioned trade lake (default: the market's lake, see markets.py)
+        - symbol: Symbol to manage, e.g. ETHUSDT
+        - market: 'um' (USD-M futures), 'cm' (COIN-M futures) or 'spot'
+        - dataset: 'trades', 'aggTrades' or 'klines_1s' (bars only: no trades to load)
         """
+        self.symbol = symbol
+        self.market = market
+        self.dataset = dataset
+        self.lake_dir = lake_dir or markets.lake_dir(market, dataset=dataset)
+        self.store = markets.open_store(self.lake_dir, dataset)
+        self.base_url = (base_url or markets.base_url(market, 'monthly', symbol, dataset=dataset)).rstrip('/')
+        self.workers = workers
+        self._engine = None
+
         # Create or use existing output directory
         os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
         
@@ -53,6 +64,16 @@ class BinanceTradesManager:
     
     # ===== DOWNLOADER METHODS =====
     
+    @property
+    def engine(self):
+        """
+        The download engine, created on first use (only downloads need requests)
+        """
+        if self._engine is None:
+            from downloader import DEFAULT_WORKERS, DownloadEngine
+            self._engine = DownloadEngine(workers=self.workers or DEFAULT_WORKERS)
+        return self._engine
+    
     def get_free_space(self, path):
         """
         Get free space in bytes for the given path
@@ -72,123 +93,105 @@ class BinanceTradesManager:
         """
         Get file size from URL without downloading
         """
-        try:
-            response = requests.head(url)
-            return int(response.headers.get('content-length', 0))
-        except:
-            return 0
+        return self.engine.head(url)
 
     def download_file(self, url, output_path):
         """
-        Download a file with progress bar
+        Download a file with progress bar, resuming a partial download if one exists
         """
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
+        from tqdm import tqdm
+        from downloader import DownloadJob
         
-        with open(output_path, 'wb') as file, tqdm(
+        job = DownloadJob(url, output_path, self.get_file_size(url))
+        with tqdm(
             desc=os.path.basename(output_path),
-            total=total_size,
+            total=job.size,
             unit='iB',
             unit_scale=True,
             unit_divisor=1024,
         ) as pbar:
-            for data in response.iter_content(chunk_size=1024):
-                size = file.write(data)
-                pbar.update(size)
+            self.engine.fetch(job, pbar)
 
     def convert_csv_to_parquet(self, csv_path, parquet_path):
         """
-        Convert CSV to Parquet with high compression, processing in chunks to handle large files
+        Convert a loose CSV to Parquet, streaming it through Arrow in row groups
         """
+        from converter import csv_to_parquet
+        
         try:
-            # Process CSV in chunks to handle large files
-            chunk_size = 500000  # Reduced chunk size for better memory management
-            
-            # Read the first chunk to get the schema
-            first_chunk = pd.read_csv(csv_path, nrows=1)
-            schema = {}
-            for column in first_chunk.columns:
-                if column == 'timestamp':
-                    schema[column] = 'datetime64[ns]'
-                else:
-                    schema[column] = first_chunk[column].dtype
-            
-            # Process chunks and write directly to parquet
-            chunks = pd.read_csv(csv_path, chunksize=chunk_size, dtype=schema)
-            
-            first = True
-            for chunk in chunks:
-                # Convert timestamp to datetime if it exists
-                if 'timestamp' in chunk.columns:
-                    chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
-                
-                # Write mode: 'write' for first chunk, 'append' for subsequent chunks
-                mode = 'write' if first else 'append'
-                chunk.to_parquet(
-                    parquet_path,
-                    compression='snappy',
-                    index=False,
-                    engine='fastparquet',  # Using fastparquet engine which supports append mode
-                    append=not first
-                )
-                first = False
-            
+            rows = csv_to_parquet(csv_path, parquet_path)
             # Remove the original CSV file
             os.remove(csv_path)
-            print(f"Converted and compressed: {os.path.basename(csv_path)} → {os.path.basename(parquet_path)}")
+            print(f"Converted and compressed: {os.path.basename(csv_path)} → {os.path.basename(parquet_path)} ({rows:,} rows)")
             return True
         except Exception as e:
             print(f"Error converting to parquet: {e}")
-            # Clean up any partial files
-            if os.path.exists(parquet_path):
-                os.remove(parquet_path)
             return False
 
     def get_existing_files(self):
         """
-        Get list of already processed files
+        Get list of months whose monthly dump is already in the trade store
         """
+        from trade_store import source_key, source_kind
+        
         existing_files = set()
-        for file in glob.glob(os.path.join(self.trades_dir, "*.parquet")):
-            # Extract year and month from filename
-            basename = os.path.basename(file)
-            if basename.startswith("ETHUSDT-trades-"):
-                year_month = basename.split("ETHUSDT-trades-")[1].split(".")[0]  # e.g., "2019-11"
-                existing_files.add(year_month)
+        for source in self.store.sources(self.symbol):
+            # Monthly sources look like ETHUSDT-trades-2019-11, daily ones carry a day as well
+            if source.startswith(markets.source_prefix(self.symbol, self.dataset)) and source_kind(source) == 'monthly':
+                existing_files.add(source_key(source))
         return existing_files
 
-    def extract_and_convert(self, zip_path, extract_path):
+    def extract_and_convert(self, zip_path, remote=None):
         """
-        Extract ZIP file, convert CSV to Parquet, and clean up
+        Stream the CSVs inside a ZIP into the trade store, one sorted file per
+        day, without extracting to disk (replacing or merging with daily data).
+        remote describes where the ZIP came from and is kept in the manifest.
         """
-        success = False
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Extract CSV file
-                csv_files = [f for f in zip_ref.namelist() if f.endswith('.csv')]
-                for csv_file in csv_files:
-                    zip_ref.extract(csv_file, extract_path)
-                    csv_path = os.path.join(extract_path, csv_file)
-                    parquet_path = csv_path.replace('.csv', '.parquet')
-                    
-                    print(f"Converting {csv_file} to Parquet format...")
-                    if self.convert_csv_to_parquet(csv_path, parquet_path):
-                        success = True
-                    elif os.path.exists(csv_path):
-                        os.remove(csv_path)  # Clean up CSV if conversion failed
-            return success
+            written = self.store.ingest_zip(zip_path, self.symbol, markets.schema(self.market, self.dataset), remote=remote)
+            for source, days in written.items():
+                merged = sum(1 for entry in days.values() if entry['merged'])
+                print(f"Converted {source}: {len(days)} days" + (f", {merged} merged with other dumps" if merged else ""))
+            return bool(written)
         except Exception as e:
-            print(f"Error extracting zip: {e}")
+            print(f"Error converting {os.path.basename(zip_path)}: {e}")
             return False
 
+    def process_download(self, job):
+        """
+        Convert a downloaded ZIP to Parquet and remove it (runs alongside the remaining downloads)
+        """
+        try:
+            print(f"Processing {os.path.basename(job.path)}...")
+            return self.extract_and_convert(job.path, self.remote_entry(job))
+        finally:
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+    def remote_entry(self, job):
+        """
+        Manifest record of a finished download: its size, SHA-256 and whether
+        that matched Binance's .CHECKSUM
+        """
+        return {
+            'url': job.url,
+            'size': os.path.getsize(job.path),
+            'sha256': job.digest,
+            'verified': job.sha256 is not None,
+            'downloaded': datetime.now().isoformat(timespec='seconds'),
+        }
+
     def download_monthly_trades(self, start_year=2019, start_month=11):
         """
-        Download monthly ETH/USDT perpetual futures trade data from Binance
+        Download monthly trade data of the manager's symbol and market from Binance
         
         Args:
             start_year (int): Starting year (default: 2019)
             start_month (int): Starting month (default: 11)
         """
+        import humanize
+        from downloader import DownloadJob
+        
         # Get list of already processed files
         existing_files = self.get_existing_files()
         print(f"\nFound {len(existing_files)} existing processed files")
@@ -204,8 +207,8 @@ class BinanceTradesManager:
         months_to_download = []
         for year in range(start_year, current_year + 1):
             for month in range(1, 13):
-                # Skip future months
-                if year == current_year and month > current_month:
+                # Skip the current and future months: a monthly dump only appears once the month is over
+                if year == current_year and month >= current_month:
                     continue
                 # Skip months before start date
                 if year == start_year and month < start_month:
@@ -214,11 +217,9 @@ class BinanceTradesManager:
                 month_str = f"{month:02d}"
                 year_month = f"{year}-{month_str}"
                 
-                # Check if parquet file already exists
-                parquet_filename = f"ETHUSDT-trades-{year_month}.parquet"
-                parquet_path = os.path.join(self.trades_dir, parquet_filename)
-                if os.path.exists(parquet_path):
-                    print(f"Skipping {year_month} - parquet file already exists")
+                # Check if the month is already in the lake
+                if year_month in existing_files:
+                    print(f"Skipping {year_month} - already in the lake")
                     continue
                 
                 months_to_download.append((year, month))
@@ -227,70 +228,62 @@ class BinanceTradesManager:
             print("\nAll files are up to date!")
             return
         
-        total_files = len(months_to_download)
-        print(f"\nFiles to download: {total_files}")
+        # Only months missing from the manifest reach the network
+        print(f"\n{len(months_to_download)} months to check remotely, the rest are complete in the manifest")
         
-        # Download and process files
-        processed_count = 0
-        for idx, (year, month) in enumerate(months_to_download, 1):
-            month_str = f"{month:02d}"
-            zip_filename = f"ETHUSDT-trades-{year}-{month_str}.zip"
-            
-            # Create URLs and paths
-            zip_url = f"{BASE_URL}/{zip_filename}"
-            zip_path = os.path.join(self.trades_dir, zip_filename)
-            
-            try:
-                print(f"\nProcessing file {idx}/{total_files}: {zip_filename}")
-                
-                # Get and show file size
-                file_size = self.get_file_size(zip_url)
-                if file_size == 0:
-                    print(f"Skipping {zip_filename} - file not available or empty")
-                    continue
-                
-                print(f"File size: {humanize.naturalsize(file_size)}")
-                
-                # Check available disk space
-                free_space = self.get_free_space(self.trades_dir)
-                required_space = file_size * 2  # Need roughly 2x zip size for extraction
-                
-                if required_space > free_space:
-                    print(f"Warning: Not enough disk space!")
-                    print(f"Required: {humanize.naturalsize(required_space)}")
-                    print(f"Available: {humanize.naturalsize(free_space)}")
-                    print("Please free up some space and try again.")
-                    break
-                
-                # Download file
-                print(f"Downloading {zip_filename}...")
-                self.download_file(zip_url, zip_path)
-                
-                # Extract, convert to parquet, and clean up
-                print(f"Processing {zip_filename}...")
-                if self.extract_and_convert(zip_path, self.trades_dir):
-                    processed_count += 1
-                
-                # Remove the zip file
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                
-                # Small delay between downloads
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error processing {zip_filename}: {e}")
-                # Clean up any partial downloads
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                continue
+        # Look up all sizes up front with concurrent HEAD requests
+        jobs = []
+        for year, month in months_to_download:
+            zip_filename = markets.dump_name(self.symbol, f"{year}-{month:02d}", self.dataset)
+            jobs.append(DownloadJob(f"{self.base_url}/{zip_filename}", os.path.join(self.trades_dir, zip_filename)))
+        self.engine.sizes(jobs)
+        
+        available = []
+        for job in jobs:
+            if job.size == 0:
+                print(f"Skipping {os.path.basename(job.path)} - file not available or empty")
+            else:
+                available.append(job)
+        
+        # Fetch the published checksums; downloads are verified against them as they stream
+        self.engine.checksums(available)
+        for job in available:
+            if job.sha256 is None:
+                print(f"Warning: no checksum published for {os.path.basename(job.path)}, it will not be verified")
+        
+        # Keep the months that fit on disk: every zip may be on disk at once, plus its
+        # Parquet output (about the zip size again). The CSV itself is never extracted.
+        free_space = self.get_free_space(self.trades_dir)
+        jobs = []
+        for job in available:
+            candidate = jobs + [job]
+            required_space = sum(j.size for j in candidate) * 2
+            if required_space > free_space:
+                print(f"Warning: Not enough disk space!")
+                print(f"Required: {humanize.naturalsize(required_space)}")
+                print(f"Available: {humanize.naturalsize(free_space)}")
+                print("Please free up some space and try again.")
+                break
+            jobs = candidate
+        
+        if not jobs:
+            return
+        
+        total_files = len(jobs)
+        total_size = sum(job.size for job in jobs)
+        print(f"\nFiles to download: {total_files} ({humanize.naturalsize(total_size)}, {self.engine.workers} workers)")
         
-        print(f"\nDownload completed! Data saved to: {self.trades_dir}")
+        # Download concurrently; each finished zip is converted while the rest download.
+        # Failed downloads leave a .part file that the next run resumes.
+        results = self.engine.run(jobs, process=self.process_download)
+        processed_count = sum(1 for result in results.values() if result is True)
+        
+        print(f"\nDownload completed! Data saved to: {self.lake_dir}")
         
         # Show final statistics
         final_files = self.get_existing_files()
         print(f"Total files processed this run: {processed_count}")
-        print(f"Total files in directory: {len(final_files)}")
+        print(f"Total months in lake: {len(final_files)}")
         if final_files:  # Only show date range if there are files
             print("Date range:", min(final_files), "to", max(final_files))
     
@@ -318,22 +311,7 @@ class BinanceTradesManager:
         Returns:
         - List of dates in format YYYY-MM
         """
-        all_files = glob.glob(os.path.join(self.trades_dir, "ETHUSDT-trades-????-??.parquet"))
-        dates = []
-        
-        for file_path in all_files:
-            file_name = os.path.basename(file_path)
-            # Extract date from filename (format: ETHUSDT-trades-YYYY-MM.parquet)
-            try:
-                date_part = file_name.split('-trades-')[1].split('.')[0]
-                dates.append(date_part)
-            except (IndexError, ValueError):
-                # Skip files that don't match the expected format
-                continue
-        
-        # Sort dates
-        dates.sort()
-        return dates
+        return sorted(self.get_existing_files())
     
     def get_parquet_files(self, start_date, end_date=None):
         """
@@ -360,7 +338,7 @@ class BinanceTradesManager:
             raise ValueError("End date must be after or equal to start date")
         
         # Get all Parquet files
-        all_files = glob.glob(os.path.join(self.trades_dir, "ETHUSDT-trades-????-??.parquet"))
+        all_files = glob.glob(os.path.join(self.trades_dir, f"{self.symbol}-trades-????-??.parquet"))
         
         # Filter files based on date range
         filtered_files = []
@@ -391,12 +369,18 @@ class BinanceTradesManager:
         Parameters:
         - file_paths: List of file paths to load
         - columns: List of columns to load (optional)
-        - sample_rate: Float between 0 and 1 for random sampling (optional)
+        - sample_rate: Float between 0 and 1; only a time-stratified subset of
+          row groups is read (deterministic, see lake.sample_units) (optional)
         - verbose: Whether to print progress information
         
         Returns:
         - Concatenated DataFrame
         """
+        import pandas as pd
+        import pyarrow.parquet as pq
+        from tqdm import tqdm
+        import lake
+        
         if not file_paths:
             if verbose:
                 print("No files found for the specified date range")
@@ -405,6 +389,12 @@ class BinanceTradesManager:
         dfs = []
         total_size = 0
         
+        # Pick the row groups to decode up front instead of sampling loaded rows
+        sample = None
+        if sample_rate and 0 < sample_rate < 1:
+            sample = lake.sample_files(file_paths, sample_rate)
+            file_paths = [path for path in file_paths if path in sample]
+        
         if verbose:
             print(f"Loading {len(file_paths)} files...")
             file_iter = tqdm(file_paths)
@@ -413,16 +403,14 @@ class BinanceTradesManager:
             
         for file_path in file_iter:
             try:
-                # Load with specified columns if provided
-                if columns:
+                # Load the sampled row groups, or the whole file, with specified columns if provided
+                if sample is not None:
+                    df = pq.ParquetFile(file_path).read_row_groups(sample[file_path], columns=columns).to_pandas()
+                elif columns:
                     df = pd.read_parquet(file_path, columns=columns, engine='pyarrow')
                 else:
                     df = pd.read_parquet(file_path, engine='pyarrow')
                 
-                # Apply sampling if specified
-                if sample_rate and 0 < sample_rate < 1:
-                    df = df.sample(frac=sample_rate, random_state=42)
-                
                 dfs.append(df)
                 total_size += len(df)
                 
@@ -451,68 +439,91 @@ class BinanceTradesManager:
     
     def load_trades(self, start_date, end_date=None, columns=None, sample_rate=None, verbose=True):
         """
-        Load trades for a specific date range
+        Load trades for a specific date range from the lake
+        
+        Only the day partitions and row groups overlapping the range are read,
+        and only the requested columns are decoded (multithreaded, into a single
+        Arrow table converted to pandas once).
         
         Parameters:
-        - start_date: string in format 'YYYY-MM'
-        - end_date: string in format 'YYYY-MM' (optional)
+        - start_date: 'YYYY-MM' (whole month), 'YYYY-MM-DD' (whole day) or a timestamp
+        - end_date: same formats, inclusive for months/days, exclusive for timestamps (optional)
         - columns: List of columns to load (optional)
-        - sample_rate: Float between 0 and 1 for random sampling (optional)
+        - sample_rate: Float between 0 and 1; reads a time-stratified subset of row groups (optional)
         - verbose: Whether to print progress information
         
         Returns:
         - DataFrame with trade data
         """
-        files = self.get_parquet_files(start_date, end_date)
+        import pandas as pd
+        import lake
+        
+        table = lake.load_trades(self.lake_dir, self.symbol, start_date, end_date, columns, sample_rate=sample_rate)
         
-        if not files:
+        if table is None or table.num_rows == 0:
             if verbose:
-                print(f"No files found for the specified date range: {start_date} to {end_date or start_date}")
+                print(f"No trades found for the specified date range: {start_date} to {end_date or start_date}")
             return None
         
         if verbose:
-            print(f"Found {len(files)} files for the specified date range")
-            for file in files:
-                print(f"  - {os.path.basename(file)}")
+            print(f"Loaded {table.num_rows:,} rows from {self.lake_dir}")
         
-        return self.load_parquet_files(files, columns, sample_rate, verbose)
+        result = table.to_pandas()
+        
+        # Convert timestamp to datetime
+        if 'time' in result.columns:
+            result['datetime'] = pd.to_datetime(result['time'], unit='ms')
+        
+        return result
+
+    def migrate_to_lake(self, remove=False):
+        """
+        Import the flat Parquet files in trades_dir into the trade store
+        
+        Parameters:
+        - remove: Delete each flat file after it has been imported
+        """
+        files = sorted(glob.glob(os.path.join(self.trades_dir, f"{self.symbol}-trades-????-??.parquet")))
+        print(f"Importing {len(files)} files into {self.lake_dir}")
+        for file_path in files:
+            days = self.store.ingest_parquet(file_path, self.symbol)
+            print(f"  - {os.path.basename(file_path)}: {sum(entry['rows'] for entry in days.values()):,} rows in {len(days)} days")
+            if remove:
+                os.remove(file_path)
 
-    def visualize_trades(self, df, timeframe='5m', price_col='price', save_path=None):
+    def visualize_trades(self, start_date, end_date=None, timeframe=None, width=None, save_path=None):
         """
-        Visualize trade data with the specified timeframe
+        Visualize trade data from the OHLC pyramid
         
         Parameters:
-        - df: DataFrame with trade data
-        - timeframe: Timeframe for resampling (default: '5m')
-        - price_col: Column name for price data (default: 'price')
+        - start_date: Start date in format 'YYYY-MM', 'YYYY-MM-DD' or a timestamp
+        - end_date: End date in the same formats (optional)
+        - timeframe: Timeframe to resample to (optional, default: the pyramid level fitting the span)
+        - width: Plot width in pixels the level is chosen for (default: the figure width)
         - save_path: Path to save the figure (optional)
         
         Returns:
         - None (displays or saves the figure)
         """
-        if df is None or len(df) == 0:
-            print("No data to visualize")
-            return
-        
-        # Make sure datetime column exists
-        if 'datetime' not in df.columns and 'time' in df.columns:
-            df['datetime'] = pd.to_datetime(df['time'], unit='ms')
-        
-        if 'datetime' not in df.columns:
-            print("No datetime column found in data")
-            return
-        
-        # Set datetime as index for resampling
-        df = df.set_index('datetime')
-        
-        # Resample data to the specified timeframe
-        resampled = df[price_col].resample(timeframe).agg(['first', 'max', 'min', 'last'])
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
         
         # Create figure and axis
         fig, ax = plt.figure(figsize=(12, 6)), plt.gca()
+        width = width or int(fig.get_figwidth() * fig.dpi)
+        
+        # Read the pyramid level matching the span and width
+        bars, level = self.store.ohlc(self.symbol, start_date, end_date, width=width, timeframe=timeframe)
+        if len(bars) == 0:
+            plt.close(fig)
+            print("No data to visualize")
+            return
+        timeframe = timeframe or level
+        print(f"Plotting {len(bars):,} bars ({timeframe} timeframe from the {level} level)")
         
-        # Plot the price data
-        ax.plot(resampled.index, resampled['last'], label=f'ETH/USDT ({timeframe} timeframe)')
+        # Plot the price data, with the high/low range of each bar behind it
+        ax.fill_between(bars.index, bars['low'], bars['high'], alpha=0.2, step='post', label='High/low')
+        ax.plot(bars.index, bars['close'], label=f'{self.symbol} ({timeframe} timeframe)')
         
         # Format the x-axis
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
@@ -521,7 +532,7 @@ class BinanceTradesManager:
         # Add labels and title
         plt.xlabel('Time')
         plt.ylabel('Price (USDT)')
-        plt.title(f'ETH/USDT Price ({timeframe} timeframe)')
+        plt.title(f'{self.symbol} Price ({timeframe} timeframe)')
         
         # Add grid and legend
         plt.grid(True, alpha=0.3)
@@ -537,114 +548,263 @@ class BinanceTradesManager:
         else:
             plt.show()
 
-def main():
+def manager_for(args, trades_dir=None, **kwargs):
+    """A manager for the symbol, market, dataset and lake the command line names"""
+    return BinanceTradesManager(trades_dir, lake_dir=args.lake_dir, symbol=args.symbol, market=args.market,
+                                dataset=args.dataset, **kwargs)
+
+# ===== COMMANDS =====
+# One function per sub-command, importing only what that command uses
+
+def run_download(args):
+    # Initialize manager with output directory if provided
+    manager = manager_for(args, args.output_dir, workers=args.workers, base_url=args.base_url)
+    # Download trades
+    manager.download_monthly_trades(args.start_year, args.start_month)
+
+def run_list(args):
+    # Initialize manager with lake directory if provided
+    manager = manager_for(args)
+    
+    # Get monthly dates
+    monthly_dates = manager.get_monthly_dates()
+    if monthly_dates:
+        print(f"\nMonthly data files ({len(monthly_dates)}):")
+        for date in monthly_dates:
+            print(f"  - {date}")
+        print(f"\nDate range: {monthly_dates[0]} to {monthly_dates[-1]}")
+    else:
+        print("No monthly data files found")
+    
+    # Show which kind of dump each stored day comes from
+    coverage = manager.store.coverage(manager.symbol)
+    print(f"\nDays in store: {len(coverage['monthly'])} from monthly dumps, {len(coverage['daily'])} from daily dumps")
+    if coverage['daily']:
+        print(f"Daily-only range: {coverage['daily'][0]} to {coverage['daily'][-1]}")
+    print(f"Layout: {manager.store.layout}")
+
+def run_migrate(args):
+    manager = manager_for(args, args.data_dir)
+    manager.migrate_to_lake(remove=args.remove)
+
+def run_verify(args):
+    manager = manager_for(args)
+    problems, unverified = manager.store.verify(manager.symbol)
+    for problem in problems:
+        print(f"  - {problem}")
+    print(f"{len(manager.store.days(manager.symbol))} days checked, {len(problems)} problems")
+    if unverified:
+        print(f"{len(unverified)} dumps were ingested without a verified checksum: {', '.join(unverified)}")
+
+def run_compact(args):
+    manager = manager_for(args)
+    folded = manager.store.compact(manager.symbol)
+    print(f"Folded {folded} stray files into {manager.lake_dir}")
+
+def run_rewrite(args):
+    manager = manager_for(args)
+    fields = ('compression', 'compression_level', 'id_time_encoding', 'qty_type', 'row_group_rows')
+    layout = {field: getattr(args, field) for field in fields if getattr(args, field) is not None}
+    if args.compression is not None and args.compression_level is None:
+        # A level only applies to the codec it was chosen for
+        layout['compression_level'] = None
+    print(f"Current layout: {manager.store.layout}")
+    before, after = manager.store.rewrite(layout, progress=lambda symbol, day: print(f"Rewrote {symbol} {day}"))
+    print(f"New layout: {manager.store.layout}")
+    print(f"Lake size: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+def run_aggregate(args):
+    import pandas as pd
+    from tabulate import tabulate
+    
     # Configure pandas display options for better terminal output
     pd.set_option('display.max_rows', 20)
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', None)
     pd.set_option('display.float_format', lambda x: '%.5f' % x)
     
-    parser = argparse.ArgumentParser(description='Binance Trades Manager - Download and Analyze ETH/USDT Monthly Trade Data')
+    manager = manager_for(args)
+    # Load data
+    df = manager.load_trades(args.start_date, args.end_date, args.columns, args.sample_rate)
+    
+    if df is not None:
+        print(f"\nLoaded DataFrame with {len(df):,} rows and {len(df.columns)} columns")
+        
+        # Display DataFrame info in a nicer format
+        print("\nDataFrame Info:")
+        buffer = io.StringIO()
+        df.info(buf=buffer)
+        print(buffer.getvalue())
+        
+        # Display DataFrame preview with tabulate
+        print("\nDataFrame Preview:")
+        print(tabulate(df.head(20), headers='keys', tablefmt='psql', showindex=True))
+        
+        # Display basic statistics
+        print("\nDataFrame Statistics:")
+        print(tabulate(df.describe(), headers='keys', tablefmt='psql', showindex=True))
+        
+        # Save to file if output path is specified
+        if args.output:
+            file_ext = os.path.splitext(args.output)[1].lower()
+            if file_ext == '.csv':
+                df.to_csv(args.output, index=False)
+                print(f"Saved to CSV: {args.output}")
+            elif file_ext == '.parquet':
+                df.to_parquet(args.output, index=False, engine='pyarrow')
+                print(f"Saved to Parquet: {args.output}")
+            else:
+                print(f"Unsupported output format: {file_ext}")
+
+def run_bars(args):
+    manager = manager_for(args)
+    if args.dataset == 'klines_1s':
+        if args.volume is not None:
+            sys.exit("Volume bars need trades: use --dataset trades or aggTrades")
+        df, level = manager.store.ohlc(manager.symbol, args.start_date, args.end_date, timeframe=args.interval)
+        df.to_parquet(args.output, engine='pyarrow')
+        print(f"Wrote {len(df):,} bars rolled up from the {level} klines to {args.output}")
+        return
+    
+    import aggregator
+    
+    bars = aggregator.aggregate(manager.lake_dir, manager.symbol, args.start_date, args.end_date, args.interval, args.volume,
+                                args.workers or aggregator.DEFAULT_WORKERS, args.memory_mb or aggregator.DEFAULT_MEMORY_MB,
+                                args.output)
+    print(f"Wrote {bars:,} bars to {args.output}")
+
+def run_visualize(args):
+    manager = manager_for(args)
+    print(f"Visualizing {args.start_date} to {args.end_date or args.start_date}")
+    manager.visualize_trades(args.start_date, args.end_date, timeframe=args.timeframe, width=args.width, save_path=args.save)
+
+def run_check(args):
+    import consistency
+    
+    results = consistency.check(args.symbol, args.start_date, args.end_date, args.market, args.datasets, args.timeframe,
+                                args.lake_root)
+    for dataset, result in results.items():
+        print(f"{dataset}: {result['bars']:,} bars, {result['matching']:.4%} matching the trades bars, "
+              f"{result['only_reference']:,} only in trades, {result['only_candidate']:,} only in {dataset}, "
+              f"total volume {result['volume_diff']:+.2e}, trade ratio {result['trades_ratio']:.3f}")
+
+def run_pyramid(args):
+    manager = manager_for(args)
+    built = manager.store.build_pyramid(manager.symbol, rebuild=args.rebuild, progress=lambda symbol, day: print(f"Built {symbol} {day}"))
+    print(f"Built the OHLC pyramid for {built} days")
+
+def build_parser():
+    """
+    The command line: only plain data goes into it (no heavy module is
+    imported to fill in defaults or choices), so --help stays instant
+    """
+    parser = argparse.ArgumentParser(description='Binance Trades Manager - Download and Analyze Monthly Trade Data')
+    parser.add_argument('--symbol', type=str, default=SYMBOL, help=f'Symbol (default: {SYMBOL})')
+    parser.add_argument('--market', type=str, default=markets.DEFAULT_MARKET, choices=list(markets.MARKETS),
+                        help=f'Market: um, cm or spot (default: {markets.DEFAULT_MARKET}; for many symbols at once see sync.py)')
+    parser.add_argument('--dataset', type=str, default=markets.DEFAULT_DATASET, choices=list(markets.DATASETS),
+                        help=f'Dump dataset and the lake it goes to (default: {markets.DEFAULT_DATASET}; klines_1s holds bars only)')
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
     # Download command
     download_parser = subparsers.add_parser('download', help='Download monthly trade data')
     download_parser.add_argument('--start_year', type=int, default=2025, help='Starting year (default: 2019)')
     download_parser.add_argument('--start_month', type=int, default=6, help='Starting month (default: 11)')
-    download_parser.add_argument('--output_dir', type=str, help='Output directory (optional)')
+    download_parser.add_argument('--output_dir', type=str, help='Directory zips are downloaded to (optional)')
+    download_parser.add_argument('--workers', type=int, help='Concurrent downloads (default: downloader.DEFAULT_WORKERS)')
+    download_parser.add_argument('--base_url', type=str, help='Download base URL (default: the symbol\'s Binance data vision directory)')
+    download_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    download_parser.set_defaults(run=run_download)
     
     # List command
     list_parser = subparsers.add_parser('list', help='List available monthly dates')
-    list_parser.add_argument('--data_dir', type=str, help='Data directory (optional)')
+    list_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    list_parser.set_defaults(run=run_list)
+    
+    # Migrate command
+    migrate_parser = subparsers.add_parser('migrate', help='Import flat monthly Parquet files into the lake')
+    migrate_parser.add_argument('--data_dir', type=str, help='Directory with the flat files (optional)')
+    migrate_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    migrate_parser.add_argument('--remove', action='store_true', help='Delete flat files once imported')
+    migrate_parser.set_defaults(run=run_migrate)
+    
+    # Verify command
+    verify_parser = subparsers.add_parser('verify', help='Check the lake against the manifest (Parquet footers only, no network)')
+    verify_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    verify_parser.set_defaults(run=run_verify)
+    
+    # Compact command
+    compact_parser = subparsers.add_parser('compact', help='Fold stray per-dump lake files into the canonical day files')
+    compact_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    compact_parser.set_defaults(run=run_compact)
+    
+    # Rewrite command (choices mirror lake.ID_TIME_ENCODINGS and lake.QTY_TYPES)
+    rewrite_parser = subparsers.add_parser('rewrite', help='Re-encode the lake in another layout (see bench_format.py)')
+    rewrite_parser.add_argument('--compression', type=str, choices=['snappy', 'zstd', 'lz4', 'gzip', 'none'], help='Parquet codec')
+    rewrite_parser.add_argument('--compression_level', type=int, help='Codec level, e.g. 1-22 for zstd')
+    rewrite_parser.add_argument('--id_time_encoding', type=str, choices=['dictionary', 'plain', 'delta'], help='Encoding of the id and time columns')
+    rewrite_parser.add_argument('--qty_type', type=str, choices=['float32', 'float64'], help='Storage type of qty')
+    rewrite_parser.add_argument('--row_group_rows', type=int, help='Rows per row group')
+    rewrite_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    rewrite_parser.set_defaults(run=run_rewrite)
     
     # Aggregate command
     aggregate_parser = subparsers.add_parser('aggregate', help='Aggregate monthly trade data')
-    aggregate_parser.add_argument('start_date', type=str, help='Start date in format YYYY-MM')
-    aggregate_parser.add_argument('--end_date', type=str, help='End date in format YYYY-MM (optional)')
+    aggregate_parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    aggregate_parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
     aggregate_parser.add_argument('--columns', type=str, nargs='+', help='Columns to load (optional)')
     aggregate_parser.add_argument('--sample_rate', type=float, help='Sample rate between 0 and 1 (optional)')
     aggregate_parser.add_argument('--output', type=str, help='Output file path (optional)')
-    aggregate_parser.add_argument('--data_dir', type=str, help='Data directory (optional)')
+    aggregate_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    aggregate_parser.set_defaults(run=run_aggregate)
+    
+    # Pyramid command
+    pyramid_parser = subparsers.add_parser('pyramid', help='Build the OHLC pyramid of days that lack one')
+    pyramid_parser.add_argument('--rebuild', action='store_true', help='Rebuild every day')
+    pyramid_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    pyramid_parser.set_defaults(run=run_pyramid)
+    
+    # Bars command
+    bars_parser = subparsers.add_parser('bars', help='Stream time or volume bars out of the lake (out of core, see aggregator.py)')
+    bars_parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    bars_parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    bar_type = bars_parser.add_mutually_exclusive_group(required=True)
+    bar_type.add_argument('--interval', type=str, help='Time bars of this interval, e.g. 5s, 1min, 1h (with --dataset klines_1s: rolled up from 1s klines)')
+    bar_type.add_argument('--volume', type=float, help='Volume bars of this much of the base asset (trades or aggTrades only)')
+    bars_parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    bars_parser.add_argument('--memory_mb', type=int, help='Memory budget for trade batches (default: aggregator.DEFAULT_MEMORY_MB)')
+    bars_parser.add_argument('--output', type=str, required=True, help='Parquet file to write the bars to')
+    bars_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    bars_parser.set_defaults(run=run_bars)
+    
+    # Check command
+    check_parser = subparsers.add_parser('check', help='Compare the aggTrades and 1s kline lakes with the trades lake (see consistency.py)')
+    check_parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    check_parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    check_parser.add_argument('--datasets', nargs='+', default=['aggTrades', 'klines_1s'], choices=['aggTrades', 'klines_1s'])
+    check_parser.add_argument('--timeframe', type=str, default='1s', help='Bars to compare (default: 1s)')
+    check_parser.add_argument('--lake_root', type=str, help='Lakes are in <lake_root>/<market><dataset suffix> (default: per-market lakes)')
+    check_parser.set_defaults(run=run_check)
     
     # Visualize command
     visualize_parser = subparsers.add_parser('visualize', help='Visualize monthly trade data')
-    visualize_parser.add_argument('start_date', type=str, help='Start date in format YYYY-MM')
-    visualize_parser.add_argument('--end_date', type=str, help='End date in format YYYY-MM (optional)')
-    visualize_parser.add_argument('--timeframe', type=str, default='5m', help='Timeframe for resampling (default: 5m)')
-    visualize_parser.add_argument('--sample_rate', type=float, default=0.1, help='Sample rate between 0 and 1 (default: 0.1)')
+    visualize_parser.add_argument('start_date', type=str, help='Start: YYYY-MM, YYYY-MM-DD or a timestamp')
+    visualize_parser.add_argument('--end_date', type=str, help='End: YYYY-MM, YYYY-MM-DD or a timestamp (optional)')
+    visualize_parser.add_argument('--timeframe', type=str, help='Timeframe for resampling (default: fit the span to the plot width)')
+    visualize_parser.add_argument('--width', type=int, help='Plot width in pixels (default: the figure width)')
     visualize_parser.add_argument('--save', type=str, help='Path to save the figure (optional)')
-    visualize_parser.add_argument('--data_dir', type=str, help='Data directory (optional)')
+    visualize_parser.add_argument('--lake_dir', type=str, help='Trade lake directory (optional)')
+    visualize_parser.set_defaults(run=run_visualize)
     
+    return parser
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
-    
-    if args.command == 'download':
-        # Initialize manager with output directory if provided
-        manager = BinanceTradesManager(args.output_dir if hasattr(args, 'output_dir') and args.output_dir else None)
-        # Download trades
-        manager.download_monthly_trades(args.start_year, args.start_month)
-    
-    elif args.command == 'list':
-        # Initialize manager with data directory if provided
-        manager = BinanceTradesManager(args.data_dir if hasattr(args, 'data_dir') and args.data_dir else None)
-        
-        # Get monthly dates
-        monthly_dates = manager.get_monthly_dates()
-        if monthly_dates:
-            print(f"\nMonthly data files ({len(monthly_dates)}):")
-            for date in monthly_dates:
-                print(f"  - {date}")
-            print(f"\nDate range: {monthly_dates[0]} to {monthly_dates[-1]}")
-        else:
-            print("No monthly data files found")
-    
-    elif args.command == 'aggregate':
-        # Initialize manager with data directory if provided
-        manager = BinanceTradesManager(args.data_dir if hasattr(args, 'data_dir') and args.data_dir else None)
-        # Load data
-        df = manager.load_trades(args.start_date, args.end_date, args.columns, args.sample_rate)
-        
-        if df is not None:
-            print(f"\nLoaded DataFrame with {len(df):,} rows and {len(df.columns)} columns")
-            
-            # Display DataFrame info in a nicer format
-            print("\nDataFrame Info:")
-            buffer = io.StringIO()
-            df.info(buf=buffer)
-            print(buffer.getvalue())
-            
-            # Display DataFrame preview with tabulate
-            print("\nDataFrame Preview:")
-            print(tabulate(df.head(20), headers='keys', tablefmt='psql', showindex=True))
-            
-            # Display basic statistics
-            print("\nDataFrame Statistics:")
-            print(tabulate(df.describe(), headers='keys', tablefmt='psql', showindex=True))
-            
-            # Save to file if output path is specified
-            if args.output:
-                file_ext = os.path.splitext(args.output)[1].lower()
-                if file_ext == '.csv':
-                    df.to_csv(args.output, index=False)
-                    print(f"Saved to CSV: {args.output}")
-                elif file_ext == '.parquet':
-                    df.to_parquet(args.output, index=False, engine='pyarrow')
-                    print(f"Saved to Parquet: {args.output}")
-                else:
-                    print(f"Unsupported output format: {file_ext}")
-    
-    elif args.command == 'visualize':
-        # Initialize manager with data directory if provided
-        manager = BinanceTradesManager(args.data_dir if hasattr(args, 'data_dir') and args.data_dir else None)
-        # Load data
-        print(f"Loading data from {args.start_date} to {args.end_date or args.start_date} (sample rate: {args.sample_rate})")
-        df = manager.load_trades(args.start_date, args.end_date, sample_rate=args.sample_rate)
-        
-        if df is not None:
-            print(f"Visualizing {len(df):,} trades")
-            manager.visualize_trades(df, timeframe=args.timeframe, save_path=args.save)
-    
-    else:
+    if args.command is None:
         parser.print_help()
+        return
+    args.run(args)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Multi-resolution OHLC pyramid next to the trade lake.
+
+Every day partition gets one _ohlc_<level>.parquet per level up to 15m,
+built when the day is committed to the store: 1s bars from the trades, then
+each coarser level rolled up from the one below. The levels in
+MONTH_LEVELS have so few bars per day that they are kept as one file per
+month partition instead, rolled up from the month's 15m day files, so long
+spans open a dozen files rather than hundreds. The leading underscore keeps
+these files out of trade dataset scans.
+
+Kline lakes (see kline_store.py) store the 1s level straight from Binance's
+1s klines and roll the coarser levels up from it the same way.
+
+Charts read the level whose bar count over the requested span best fits the
+pixel width, so plotting a year touches a few thousand bars instead of
+hundreds of millions of trades.
+"""
+
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import lake
+from converter import to_millis
+
+# Each level's interval divides the next one's and the day
+LEVELS = {
+    '1s': 1_000,
+    '1m': 60_000,
+    '15m': 900_000,
+    '1h': 3_600_000,
+    '4h': 14_400_000,
+    '1d': 86_400_000,
+}
+# Stored per month partition rather than per day
+MONTH_LEVELS = ('1h', '4h', '1d')
+# Bars per pixel worth reading before the next coarser level is better
+MAX_BARS_PER_PIXEL = 2
+DEFAULT_WIDTH = 1200
+
+BAR_SCHEMA = pa.schema([
+    ('time', pa.int64()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('trades', pa.int64()),
+])
+
+
+def level_path(lake_dir, symbol, day, level):
+    directory = lake.partition_dir(lake_dir, symbol, day)
+    if level in MONTH_LEVELS:
+        directory = os.path.dirname(directory)
+    return os.path.join(directory, f"_ohlc_{level}.parquet")
+
+
+def write_bars(bars, path):
+    pq.write_table(bars, path + '.tmp', compression=lake.COMPRESSION)
+    os.replace(path + '.tmp', path)
+
+
+def rollup(bars, interval_ms):
+    """Time-ordered bars (or trades as one-trade bars) into bars of interval_ms."""
+    table = bars.append_column('bucket', pc.multiply(pc.divide(bars.column('time'), interval_ms), interval_ms))
+    grouped = table.group_by('bucket', use_threads=False).aggregate([
+        ('open', 'first'), ('high', 'max'), ('low', 'min'), ('close', 'last'),
+        ('volume', 'sum'), ('trades', 'sum'),
+    ])
+    columns = ['bucket', 'open_first', 'high_max', 'low_min', 'close_last', 'volume_sum', 'trades_sum']
+    return pa.Table.from_arrays([grouped.column(name) for name in columns], schema=BAR_SCHEMA).sort_by('time')
+
+
+def trade_bars(trades):
+    """Trades as one-trade bars, the input of the 1s level."""
+    price = trades.column('price')
+    return pa.Table.from_arrays([trades.column('time'), price, price, price, price, trades.column('qty'),
+                                 pa.repeat(1, trades.num_rows).cast(pa.int64())], schema=BAR_SCHEMA)
+
+
+def kline_bars(klines):
+    """A klines table or batch (converter.KLINES_SCHEMA) as bars of its interval."""
+    return pa.Table.from_arrays([to_millis(klines.column('open_time')), klines.column('open'), klines.column('high'),
+                                 klines.column('low'), klines.column('close'), klines.column('volume'),
+                                 klines.column('count')], schema=BAR_SCHEMA)
+
+
+def build_day(lake_dir, symbol, day, bars=None):
+    """
+    (Re)build the day levels of one stored day, from its trades or, for a
+    kline lake, from its stored 1s bars. The month levels are left to
+    build_month, once all days of a commit are done. Returns {level: bars}.
+    """
+    if bars is None:
+        trades = pq.read_table(os.path.join(lake.partition_dir(lake_dir, symbol, day), lake.DAY_FILE),
+                               columns=['time', 'id', 'price', 'qty'])
+        bars = trade_bars(trades.sort_by([('time', 'ascending'), ('id', 'ascending')]))
+    counts = {}
+    for level, interval_ms in LEVELS.items():
+        if level in MONTH_LEVELS:
+            break
+        bars = rollup(bars, interval_ms)
+        write_bars(bars, level_path(lake_dir, symbol, day, level))
+        counts[level] = bars.num_rows
+    return counts
+
+
+def _month_sources(lake_dir, symbol, day):
+    """The day files of the finest level below MONTH_LEVELS in day's month, in day order."""
+    source_level = list(LEVELS)[list(LEVELS).index(MONTH_LEVELS[0]) - 1]
+    month_dir = os.path.dirname(lake.partition_dir(lake_dir, symbol, day))
+    return sorted(glob.glob(os.path.join(month_dir, "day=*", f"_ohlc_{source_level}.parquet")))
+
+
+def build_month(lake_dir, symbol, day):
+    """(Re)build the month levels of the month containing day. Returns {level: bars}."""
+    paths = _month_sources(lake_dir, symbol, day)
+    bars = pa.concat_tables([pq.read_table(path, schema=BAR_SCHEMA) for path in paths] or [BAR_SCHEMA.empty_table()])
+    counts = {}
+    for level in MONTH_LEVELS:
+        bars = rollup(bars, LEVELS[level])
+        write_bars(bars, level_path(lake_dir, symbol, day, level))
+        counts[level] = bars.num_rows
+    return counts
+
+
+def is_stale(lake_dir, symbol, day, base_level=None):
+    """
+    Whether any day level of day is missing or older than its trades, or
+    than the stored base_level the others are rolled up from (kline lakes).
+    """
+    if base_level is None:
+        base_mtime = os.path.getmtime(os.path.join(lake.partition_dir(lake_dir, symbol, day), lake.DAY_FILE))
+    else:
+        base_mtime = os.path.getmtime(level_path(lake_dir, symbol, day, base_level))
+    for level in LEVELS:
+        if level in MONTH_LEVELS or level == base_level:
+            continue
+        path = level_path(lake_dir, symbol, day, level)
+        if not os.path.exists(path) or os.path.getmtime(path) < base_mtime:
+            return True
+    return False
+
+
+def is_month_stale(lake_dir, symbol, day):
+    """Whether any month level of day's month is missing or older than one of its day files."""
+    newest = max((os.path.getmtime(path) for path in _month_sources(lake_dir, symbol, day)), default=0)
+    for level in MONTH_LEVELS:
+        path = level_path(lake_dir, symbol, day, level)
+        if not os.path.exists(path) or os.path.getmtime(path) < newest:
+            return True
+    return False
+
+
+def choose_level(span_ms, width=DEFAULT_WIDTH, timeframe=None):
+    """
+    The level to read: for a timeframe, the coarsest level it is a multiple
+    of; otherwise the finest level with at most MAX_BARS_PER_PIXEL bars per
+    pixel over span_ms.
+    """
+    if timeframe is not None:
+        timeframe_ms = int(pd.Timedelta(timeframe).total_seconds() * 1000)
+        fitting = [level for level, interval_ms in LEVELS.items() if timeframe_ms % interval_ms == 0]
+        return fitting[-1] if fitting else '1s'
+    for level, interval_ms in LEVELS.items():
+        if span_ms / interval_ms <= width * MAX_BARS_PER_PIXEL:
+            return level
+    return list(LEVELS)[-1]
+
+
+def load_bars(lake_dir, symbol, days, start_ms, end_ms, level):
+    """Bars of level from the given stored days within [start_ms, end_ms) as an Arrow table."""
+    paths = list(dict.fromkeys(level_path(lake_dir, symbol, day, level) for day in days))
+    if not paths:
+        return BAR_SCHEMA.empty_table()
+    data = ds.dataset(paths, schema=BAR_SCHEMA, format='parquet')
+    return data.to_table(filter=(ds.field('time') >= start_ms) & (ds.field('time') < end_ms))
+
+
+def bars_frame(bars, timeframe=None):
+    """Bars as a pandas DataFrame indexed by bar start, optionally resampled to timeframe."""
+    if timeframe is not None:
+        bars = rollup(bars, int(pd.Timedelta(timeframe).total_seconds() * 1000))
+    df = bars.to_pandas()
+    df.index = pd.to_datetime(df.pop('time'), unit='ms')
+    df.index.name = 'datetime'
+    return df
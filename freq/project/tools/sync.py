@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Sync Binance trade dumps for many symbols, markets and datasets in one run.
+
+For every (market, symbol, dataset) the plan is worked out from the store of
+that market's dataset lake alone (see markets.py):
+  - monthly dumps for each complete month from --start on that the store
+    has no monthly dump of
+  - daily dumps for the days of the current and previous month the store
+    lacks, dropped again for the previous month once its monthly dump is
+    published (the store compacts leftover daily files when it lands)
+
+All transfers share one DownloadEngine, so --workers caps concurrent
+downloads and --bandwidth the total rate across every symbol. Each symbol
+gets its own progress bar; finished zips are converted into their
+lake while the rest download.
+
+Usage:
+    python sync.py ETHUSDT BTCUSDT SOLUSDT --markets um spot --start 2024-01
+    python sync.py BTCUSD_PERP --markets cm --workers 8 --bandwidth 20
+    python sync.py ETHUSDT --datasets aggTrades klines_1s
+"""
+
+import argparse
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import humanize
+from tabulate import tabulate
+
+import markets
+from downloader import DEFAULT_WORKERS, DownloadEngine, DownloadJob
+from trade_store import source_key, source_kind
+
+DEFAULT_DOWNLOAD_DIR = "/allah/data/trades/downloads"
+DEFAULT_PROCESS_WORKERS = 2
+
+
+def month_keys(start, today):
+    """'YYYY-MM' of every complete month from start ('YYYY-MM') to before today's month."""
+    year, month = map(int, start.split('-')[:2])
+    keys = []
+    while (year, month) < (today.year, today.month):
+        keys.append(f"{year}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def recent_days(today):
+    """Every day of the previous and current month before today."""
+    first = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+    return [first + timedelta(days=i) for i in range((today - first).days)]
+
+
+class SyncPlan:
+    """Download jobs for a set of (market, symbol, dataset) targets, with one store per market and dataset."""
+
+    def __init__(self, targets, start, download_dir=DEFAULT_DOWNLOAD_DIR, lake_root=None,
+                 data_url=markets.DATA_URL, today=None):
+        self.targets = targets
+        self.start = start
+        self.download_dir = download_dir
+        self.data_url = data_url
+        self.today = today or datetime.now(timezone.utc).date()
+        self.stores = {(market, dataset): markets.open_store(markets.lake_dir(market, lake_root, dataset), dataset)
+                       for market, _, dataset in targets}
+        self.jobs = {}  # path -> (market, symbol, dataset, kind, key)
+
+    def build(self):
+        """All jobs the stores do not cover yet (sizes and checksums not looked up)."""
+        jobs = []
+        for market, symbol, dataset in self.targets:
+            store = self.stores[(market, dataset)]
+            monthly = {source_key(source) for source in store.sources(symbol) if source_kind(source) == 'monthly'}
+            stored_days = set(store.days(symbol))
+            for key in month_keys(self.start, self.today):
+                if key not in monthly:
+                    jobs.append(self._job(market, symbol, dataset, 'monthly', key))
+            for day in recent_days(self.today):
+                key = day.isoformat()
+                if key not in stored_days and key[:7] not in monthly and key[:7] >= self.start[:7]:
+                    jobs.append(self._job(market, symbol, dataset, 'daily', key))
+        return jobs
+
+    def _job(self, market, symbol, dataset, period, key):
+        name = markets.dump_name(symbol, key, dataset)
+        path = os.path.join(self.download_dir, market, name)
+        self.jobs[path] = (market, symbol, dataset, period, key)
+        return DownloadJob(f"{markets.base_url(market, period, symbol, self.data_url, dataset)}/{name}", path,
+                           group=f"{market}:{symbol}" + (f":{dataset}" if dataset != markets.DEFAULT_DATASET else ''))
+
+    def available(self, jobs):
+        """Jobs with a published file, minus daily dumps of months whose monthly dump is available."""
+        published = set()
+        for job in jobs:
+            market, symbol, dataset, period, key = self.jobs[job.path]
+            if job.size and period == 'monthly':
+                published.add((market, symbol, dataset, key))
+        available = []
+        for job in jobs:
+            market, symbol, dataset, period, key = self.jobs[job.path]
+            if job.size and not (period == 'daily' and (market, symbol, dataset, key[:7]) in published):
+                available.append(job)
+        return available
+
+    def ingest(self, job):
+        """Convert one downloaded dump into its store and remove it. Returns rows ingested."""
+        market, symbol, dataset, _, _ = self.jobs[job.path]
+        try:
+            remote = {
+                'url': job.url,
+                'size': os.path.getsize(job.path),
+                'sha256': job.digest,
+                'verified': job.sha256 is not None,
+                'downloaded': datetime.now().isoformat(timespec='seconds'),
+            }
+            written = self.stores[(market, dataset)].ingest_zip(job.path, symbol, markets.schema(market, dataset), remote=remote)
+            return sum(entry['rows'] for days in written.values() for entry in days.values())
+        finally:
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+
+def sync(targets, start, workers=DEFAULT_WORKERS, bandwidth=None, process_workers=DEFAULT_PROCESS_WORKERS,
+         download_dir=DEFAULT_DOWNLOAD_DIR, lake_root=None, data_url=markets.DATA_URL, today=None):
+    """
+    Bring every (market, symbol, dataset) target up to date. bandwidth is in
+    bytes/s (None = unlimited). Returns {(market, symbol, dataset): summary dict}.
+    """
+    plan = SyncPlan(targets, start, download_dir, lake_root, data_url, today)
+    engine = DownloadEngine(workers=workers, bandwidth=bandwidth)
+    for market in {market for market, _, _ in targets}:
+        os.makedirs(os.path.join(download_dir, market), exist_ok=True)
+
+    candidates = plan.build()
+    print(f"{len(candidates)} dumps missing from the stores across {len(targets)} targets")
+    engine.sizes(candidates)
+    jobs = plan.available(candidates)
+    engine.checksums(jobs)
+
+    # Every zip may be on disk at once, plus its converted days (about the zip size again)
+    free_space = shutil.disk_usage(download_dir).free
+    required = sum(job.size for job in jobs) * 2
+    if required > free_space:
+        print(f"Warning: Not enough disk space! Required: {humanize.naturalsize(required)}, "
+              f"available: {humanize.naturalsize(free_space)}")
+        return {}
+
+    print(f"Files to download: {len(jobs)} ({humanize.naturalsize(sum(job.size for job in jobs))}, {workers} workers"
+          + (f", {humanize.naturalsize(bandwidth)}/s" if bandwidth else "") + ")")
+    results = engine.run(jobs, process=plan.ingest, process_workers=process_workers) if jobs else {}
+
+    summary = {target: {'missing': 0, 'available': 0, 'bytes': 0, 'done': 0, 'failed': 0, 'rows': 0}
+               for target in targets}
+    for job in candidates:
+        summary[plan.jobs[job.path][:3]]['missing'] += 1
+    for job in jobs:
+        entry = summary[plan.jobs[job.path][:3]]
+        entry['available'] += 1
+        entry['bytes'] += job.size
+        result = results.get(job.path)
+        if isinstance(result, int) and not isinstance(result, bool):
+            entry['done'] += 1
+            entry['rows'] += result
+        else:
+            entry['failed'] += 1
+    engine.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync Binance trade dumps for many symbols, markets and datasets')
+    parser.add_argument('symbols', nargs='+', help='Symbols, e.g. ETHUSDT BTCUSDT (COIN-M: BTCUSD_PERP)')
+    parser.add_argument('--markets', nargs='+', default=[markets.DEFAULT_MARKET], choices=list(markets.MARKETS),
+                        help=f'Markets to sync every symbol in (default: {markets.DEFAULT_MARKET})')
+    parser.add_argument('--datasets', nargs='+', default=[markets.DEFAULT_DATASET], choices=list(markets.DATASETS),
+                        help=f'Datasets to sync, each into its own lake (default: {markets.DEFAULT_DATASET})')
+    parser.add_argument('--start', type=str, default='2025-01', help='First month to sync, YYYY-MM (default: 2025-01)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Concurrent downloads across all symbols (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--bandwidth', type=float, help='Total download rate in MB/s (default: unlimited)')
+    parser.add_argument('--process_workers', type=int, default=DEFAULT_PROCESS_WORKERS,
+                        help=f'Concurrent conversions (default: {DEFAULT_PROCESS_WORKERS})')
+    parser.add_argument('--download_dir', type=str, default=DEFAULT_DOWNLOAD_DIR, help='Where zips wait for conversion')
+    parser.add_argument('--lake_root', type=str, help='Put every lake in <lake_root>/<market><dataset suffix> (default: per-market lakes)')
+    parser.add_argument('--data_url', type=str, default=markets.DATA_URL, help='Dump server (default: Binance data vision)')
+    args = parser.parse_args()
+
+    targets = [(market, symbol.upper(), dataset)
+               for market in args.markets for symbol in args.symbols for dataset in args.datasets]
+    bandwidth = int(args.bandwidth * 1e6) if args.bandwidth else None
+    summary = sync(targets, args.start, args.workers, bandwidth, args.process_workers, args.download_dir,
+                   args.lake_root, args.data_url)
+    if summary:
+        table = [[market, symbol, dataset, s['missing'], s['available'], humanize.naturalsize(s['bytes']), s['done'],
+                  s['failed'], f"{s['rows']:,}"] for (market, symbol, dataset), s in summary.items()]
+        print(tabulate(table, headers=['market', 'symbol', 'dataset', 'missing', 'published', 'size', 'ingested',
+                                       'failed', 'rows'],
+                       tablefmt='psql'))
+
+
+if __name__ == '__main__':
+    main()
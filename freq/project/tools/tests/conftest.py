@@ -0,0 +1,20 @@
+"""
+The tools run as scripts with bare sibling imports, so the tools directory
+goes on sys.path the same way.
+"""
+
+import os
+import sys
+import zipfile
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
+
+
+def write_dump(path, header, rows):
+    """A data.binance.vision style zip of one CSV named after it, header first."""
+    name = os.path.basename(path).replace('.zip', '.csv')
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(name, '\n'.join([header] + [','.join(map(str, row)) for row in rows]) + '\n')
+    return path
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import aggregator
+from conftest import write_dump
+from trade_store import TradeStore
+
+SYMBOL = 'ETHUSDT'
+DAY_MS = 1_746_057_600_000  # 2025-05-01 00:00 UTC
+TRADES = 20_000  # over two days
+VOLUME = 25.0
+
+
+@pytest.fixture(scope='module')
+def lake_dir(tmp_path_factory):
+    rng = np.random.default_rng(3)
+    qty = rng.exponential(0.5, TRADES).round(3)
+    price = (3000 + np.cumsum(rng.normal(0, 0.5, TRADES))).round(2)
+    times = DAY_MS + np.arange(TRADES) * (2 * 86_400_000 // TRADES)
+    rows = [(i, p, q, round(p * q, 5), t, 'true' if i % 3 else 'false')
+            for i, (p, q, t) in enumerate(zip(price, qty, times))]
+    directory = tmp_path_factory.mktemp('lake')
+    zip_path = write_dump(str(tmp_path_factory.mktemp('dumps') / f'{SYMBOL}-trades-2025-05.zip'),
+                          'id,price,qty,quote_qty,time,is_buyer_maker', rows)
+    TradeStore(str(directory)).ingest_zip(zip_path, SYMBOL)
+    return str(directory), np.array(qty), np.array(price)
+
+
+def expected_volume_bars(qty, price):
+    """A trade belongs to the bar in which the volume before it falls, in QTY_SCALE integers."""
+    units = np.round(qty * aggregator.QTY_SCALE).astype(np.int64)
+    buckets = (np.cumsum(units) - units) // int(VOLUME * aggregator.QTY_SCALE)
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    return {
+        'bucket': buckets[starts],
+        'open': price[starts],
+        'close': price[np.append(starts[1:], len(price)) - 1],
+        'volume': np.add.reduceat(qty, starts),
+        'trades': np.diff(np.append(starts, len(price))),
+    }
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_volume_bars_do_not_depend_on_batches_days_or_workers(lake_dir, monkeypatch, workers):
+    directory, qty, price = lake_dir
+    # Batches of 1,000 trades, so bars span batch as well as day boundaries
+    monkeypatch.setattr(aggregator, 'MIN_BATCH_ROWS', 1_000)
+    bars = aggregator.aggregate(directory, SYMBOL, '2025-05-01', '2025-05-02', volume=VOLUME, workers=workers,
+                                memory_mb=0, verbose=False)
+    expected = expected_volume_bars(qty, price)
+    assert len(bars) == len(expected['bucket'])
+    np.testing.assert_array_equal(bars['bucket'], expected['bucket'])
+    np.testing.assert_array_equal(bars['trades'], expected['trades'])
+    np.testing.assert_allclose(bars['open'], expected['open'])
+    np.testing.assert_allclose(bars['close'], expected['close'])
+    np.testing.assert_allclose(bars['volume'], expected['volume'])
+    assert bars['trades'].sum() == TRADES
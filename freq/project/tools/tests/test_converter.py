@@ -0,0 +1,72 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import converter
+from conftest import write_dump
+
+TRADES_HEADER = 'id,price,qty,quote_qty,time,is_buyer_maker'
+SPOT_HEADER = 'id,price,qty,quote_qty,time,is_buyer_maker,is_best_match'
+TIME_MS = 1_746_057_600_000  # 2025-05-01 00:00 UTC
+
+
+def trade_rows(count, time_scale=1):
+    return [(i, 3000.0 + i, 0.5, 1500.0 + i / 2, (TIME_MS + i * 1000) * time_scale, 'true' if i % 2 else 'false')
+            for i in range(count)]
+
+
+def dump_without_header(path, rows):
+    """Older dumps start straight with the first row."""
+    return write_dump(path, ','.join(map(str, rows[0])), rows[1:])
+
+
+def test_header_and_headerless_dumps_convert_alike(tmp_path):
+    rows = trade_rows(10)
+    with_header = write_dump(str(tmp_path / 'ETHUSDT-trades-2025-05-01.zip'), TRADES_HEADER, rows)
+    without_header = dump_without_header(str(tmp_path / 'ETHUSDT-trades-2025-05-02.zip'), rows)
+
+    [(path, count)] = converter.zip_to_parquet(with_header, str(tmp_path / 'out'))
+    [(headerless_path, headerless_count)] = converter.zip_to_parquet(without_header, str(tmp_path / 'out'))
+    assert path.endswith('ETHUSDT-trades-2025-05-01.parquet')
+    assert count == headerless_count == 10
+
+    table, headerless = pq.read_table(path), pq.read_table(headerless_path)
+    assert table.schema == headerless.schema == converter.TRADES_SCHEMA
+    assert table.equals(headerless)
+    assert table.column('id').to_pylist() == list(range(10))
+
+
+def test_csv_to_parquet_detects_a_header_the_same_way(tmp_path):
+    rows = trade_rows(3)
+    for name, header in [('header', TRADES_HEADER), ('headerless', None)]:
+        lines = ([header] if header else []) + [','.join(map(str, row)) for row in rows]
+        (tmp_path / f'{name}.csv').write_text('\n'.join(lines) + '\n')
+        assert converter.csv_to_parquet(str(tmp_path / f'{name}.csv'), str(tmp_path / f'{name}.parquet')) == 3
+    assert pq.read_table(str(tmp_path / 'header.parquet')).equals(pq.read_table(str(tmp_path / 'headerless.parquet')))
+
+
+def test_microsecond_times_become_milliseconds(tmp_path):
+    rows = [row + ('true',) for row in trade_rows(5, time_scale=1000)]
+    zip_path = write_dump(str(tmp_path / 'ETHUSDT-trades-2025-05-01.zip'), SPOT_HEADER, rows)
+    [(path, _)] = converter.zip_to_parquet(zip_path, str(tmp_path / 'out'), converter.SPOT_TRADES_SCHEMA)
+    [batch] = pq.read_table(path).to_batches()
+    assert batch.column('time')[0].as_py() == TIME_MS * 1000
+
+    trades = converter.to_trades(batch, converter.SPOT_TRADES_SCHEMA)
+    assert trades.schema == converter.TRADES_SCHEMA
+    assert trades.column('time').to_pylist() == [TIME_MS + i * 1000 for i in range(5)]
+
+
+def test_millisecond_times_are_kept():
+    times = pa.array([TIME_MS, TIME_MS + 1], pa.int64())
+    assert converter.to_millis(times) is times
+    assert converter.to_millis(pa.array([], pa.int64())).to_pylist() == []
+
+
+def test_aggtrades_microsecond_times_become_milliseconds():
+    batch = pa.RecordBatch.from_pylist([
+        {'agg_trade_id': 7, 'price': 3000.0, 'quantity': 2.0, 'first_trade_id': 70, 'last_trade_id': 71,
+         'transact_time': (TIME_MS + 5) * 1000, 'is_buyer_maker': True},
+    ], schema=converter.AGG_TRADES_SCHEMA)
+    trades = converter.to_trades(batch, converter.AGG_TRADES_SCHEMA)
+    assert trades.to_pylist() == [{'id': 7, 'price': 3000.0, 'qty': 2.0, 'quote_qty': 6000.0,
+                                   'time': TIME_MS + 5, 'is_buyer_maker': True}]
@@ -0,0 +1,104 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import lake
+import pyramid
+from conftest import write_dump
+from trade_store import TradeStore
+
+SYMBOL = 'ETHUSDT'
+DAY_MS = 1_746_057_600_000  # 2025-05-01 00:00 UTC
+DAYS = [date(2025, 5, 1), date(2025, 5, 2)]
+TRADES = 5_000  # over both days
+HOUR_MS = 3_600_000
+
+
+@pytest.mark.parametrize('span_ms, width, level', [
+    (2_400 * 1_000, 1200, '1s'),  # exactly MAX_BARS_PER_PIXEL bars per pixel
+    (2_401 * 1_000, 1200, '1m'),
+    (HOUR_MS, 1200, '1m'),
+    (24 * HOUR_MS, 1200, '1m'),
+    (24 * HOUR_MS, 500, '15m'),  # narrower chart, coarser level
+    (30 * 24 * HOUR_MS, 1200, '1h'),
+    (365 * 24 * HOUR_MS, 1200, '4h'),
+    (365 * 24 * HOUR_MS, 100, '1d'),  # too wide for any level: the coarsest
+])
+def test_choose_level_by_span_and_width(span_ms, width, level):
+    assert pyramid.choose_level(span_ms, width) == level
+
+
+@pytest.mark.parametrize('timeframe, level', [
+    ('500ms', '1s'), ('5s', '1s'), ('5m', '1m'), ('30m', '15m'), ('2h', '1h'), ('8h', '4h'), ('1D', '1d'),
+])
+def test_choose_level_by_timeframe(timeframe, level):
+    assert pyramid.choose_level(24 * HOUR_MS, timeframe=timeframe) == level
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    rng = np.random.default_rng(7)
+    times = np.sort(DAY_MS + rng.integers(0, 2 * 86_400_000, TRADES))
+    price = (3000 + np.cumsum(rng.normal(0, 0.5, TRADES))).round(2)
+    qty = rng.exponential(0.5, TRADES).round(3)
+    rows = [(i, p, q, round(p * q, 5), t, 'false') for i, (p, q, t) in enumerate(zip(price, qty, times))]
+    zip_path = write_dump(str(tmp_path_factory.mktemp('dumps') / f'{SYMBOL}-trades-2025-05.zip'),
+                          'id,price,qty,quote_qty,time,is_buyer_maker', rows)
+    store = TradeStore(str(tmp_path_factory.mktemp('lake')))
+    store.ingest_zip(zip_path, SYMBOL)
+    return store, pd.DataFrame({'time': times, 'price': price, 'qty': qty})
+
+
+def expected_bars(trades, interval_ms):
+    """Bars of interval_ms aggregated straight from the trades."""
+    grouped = trades.groupby(trades['time'] // interval_ms * interval_ms)
+    bars = pd.DataFrame({
+        'open': grouped['price'].first(), 'high': grouped['price'].max(), 'low': grouped['price'].min(),
+        'close': grouped['price'].last(), 'volume': grouped['qty'].sum(), 'trades': grouped.size(),
+    })
+    bars.index.name = 'time'
+    return bars.reset_index()
+
+
+def assert_bars_equal(table, expected):
+    pd.testing.assert_frame_equal(table.to_pandas(), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('level', [level for level in pyramid.LEVELS if level not in pyramid.MONTH_LEVELS])
+def test_ingest_writes_day_levels(store, level):
+    store, trades = store
+    for day in DAYS:
+        path = pyramid.level_path(store.lake_dir, SYMBOL, day, level)
+        assert os.path.dirname(path) == lake.partition_dir(store.lake_dir, SYMBOL, day)
+        start = DAY_MS + (day - DAYS[0]).days * 86_400_000
+        day_trades = trades[(trades['time'] >= start) & (trades['time'] < start + 86_400_000)]
+        assert_bars_equal(pq.read_table(path), expected_bars(day_trades, pyramid.LEVELS[level]))
+    assert not pyramid.is_stale(store.lake_dir, SYMBOL, DAYS[0])
+
+
+@pytest.mark.parametrize('level', pyramid.MONTH_LEVELS)
+def test_ingest_writes_month_levels(store, level):
+    store, trades = store
+    # One file for the whole month, shared by its days
+    path = pyramid.level_path(store.lake_dir, SYMBOL, DAYS[0], level)
+    assert path == pyramid.level_path(store.lake_dir, SYMBOL, DAYS[1], level)
+    assert_bars_equal(pq.read_table(path), expected_bars(trades, pyramid.LEVELS[level]))
+    assert not pyramid.is_month_stale(store.lake_dir, SYMBOL, DAYS[0])
+
+
+def test_ohlc_reads_the_level_fitting_the_span(store):
+    store, trades = store
+    bars, level = store.ohlc(SYMBOL, '2025-05-01')
+    assert level == '1m'
+    expected = expected_bars(trades[trades['time'] < DAY_MS + 86_400_000], 60_000)
+    assert list(bars.index) == list(pd.to_datetime(expected['time'], unit='ms'))
+    assert np.allclose(bars['volume'], expected['volume'])
+
+    bars, level = store.ohlc(SYMBOL, '2025-05-01', '2025-05-02', width=40)
+    assert level == '1h'
+    assert len(bars) == 48
+    assert bars['trades'].sum() == TRADES
@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+import sync
+
+
+class StubStore:
+    """What SyncPlan reads from a trade store: ingested sources and stored days."""
+
+    def __init__(self, sources=(), days=()):
+        self._sources, self._days = list(sources), list(days)
+
+    def sources(self, symbol):
+        return {source: {} for source in self._sources}
+
+    def days(self, symbol):
+        return {day: {} for day in self._days}
+
+
+@pytest.fixture
+def plan(monkeypatch, tmp_path):
+    store = StubStore(sources=['ETHUSDT-trades-2024-10', 'ETHUSDT-trades-2024-12-05'], days=['2024-12-05'])
+    monkeypatch.setattr(sync.markets, 'open_store', lambda directory, dataset: store)
+
+    def build(start, today=date(2025, 1, 3)):
+        return sync.SyncPlan([('um', 'ETHUSDT', 'trades')], start, str(tmp_path), today=today)
+    return build
+
+
+def keys(plan, jobs, period):
+    return [plan.jobs[job.path][4] for job in jobs if plan.jobs[job.path][3] == period]
+
+
+def test_month_keys_cross_year_boundaries():
+    assert sync.month_keys('2024-11', date(2025, 2, 10)) == ['2024-11', '2024-12', '2025-01']
+    assert sync.month_keys('2025-02', date(2025, 2, 10)) == []
+
+
+def test_recent_days_cover_the_previous_and_current_month_before_today():
+    days = sync.recent_days(date(2025, 1, 3))
+    assert (days[0], days[-1], len(days)) == (date(2024, 12, 1), date(2025, 1, 2), 33)
+    assert sync.recent_days(date(2025, 3, 1))[0] == date(2025, 2, 1)
+
+
+def test_build_skips_what_the_store_holds(plan):
+    sync_plan = plan('2024-10')
+    jobs = sync_plan.build()
+    assert keys(sync_plan, jobs, 'monthly') == ['2024-11', '2024-12']
+    daily = keys(sync_plan, jobs, 'daily')
+    assert len(daily) == 32 and '2024-12-05' not in daily
+    assert jobs[0].url.endswith('/futures/um/monthly/trades/ETHUSDT/ETHUSDT-trades-2024-11.zip')
+
+
+@pytest.mark.parametrize('start, monthly, first_daily', [
+    ('2024-12-15', ['2024-12'], '2024-12-01'),  # --start counts whole months
+    ('2025-01', [], '2025-01-01'),
+])
+def test_build_honours_start(plan, start, monthly, first_daily):
+    sync_plan = plan(start)
+    jobs = sync_plan.build()
+    assert keys(sync_plan, jobs, 'monthly') == monthly
+    assert keys(sync_plan, jobs, 'daily')[0] == first_daily
+
+
+def test_available_drops_daily_dumps_once_the_monthly_one_is_published(plan):
+    sync_plan = plan('2024-10')
+    jobs = sync_plan.build()
+    for job in jobs:
+        key = sync_plan.jobs[job.path][4]
+        # November was never published; December's monthly dump is out; 2 January is not yet
+        job.size = 0 if key in ('2024-11', '2025-01-02') else 1000
+    available = sync_plan.available(jobs)
+    assert keys(sync_plan, available, 'monthly') == ['2024-12']
+    assert keys(sync_plan, available, 'daily') == ['2025-01-01']
@@ -0,0 +1,69 @@
+import os
+from datetime import date
+
+import pyarrow.parquet as pq
+
+import markets
+from conftest import write_dump
+from trade_store import TradeStore
+
+SYMBOL = 'ETHUSD_PERP'
+TRADES_HEADER = 'id,price,qty,quote_qty,time,is_buyer_maker'
+AGG_HEADER = 'agg_trade_id,price,quantity,first_trade_id,last_trade_id,transact_time,is_buyer_maker'
+DAY_MS = 1_746_057_600_000  # 2025-05-01 00:00 UTC
+
+
+def agg_rows(count):
+    return [(i, 3000.0 + i, 2, 10 * i, 10 * i + 9, DAY_MS + i * 1000, 'true' if i % 2 else 'false')
+            for i in range(count)]
+
+
+def ingested_quote_qty(tmp_path, market):
+    zip_path = write_dump(str(tmp_path / f'{SYMBOL}-aggTrades-2025-05-01.zip'), AGG_HEADER, agg_rows(5))
+    store = TradeStore(str(tmp_path / market))
+    store.ingest_zip(zip_path, SYMBOL, markets.schema(market, 'aggTrades'))
+    return pq.read_table(store.day_path(SYMBOL, date(2025, 5, 1))).column('quote_qty').to_pylist()
+
+
+def test_aggtrades_quote_qty(tmp_path):
+    assert ingested_quote_qty(tmp_path, 'um') == [(3000.0 + i) * 2 for i in range(5)]
+    # COIN-M quantities are contracts: no quote value to derive
+    assert ingested_quote_qty(tmp_path, 'cm') == [None] * 5
+
+
+def trades(ids, price):
+    """One trade per id, 10 s apart from the start of 2025-05-01."""
+    return [(i, price, 1.0, price, DAY_MS + i * 10_000, 'true') for i in ids]
+
+
+def ingest(store, source, rows):
+    zip_path = write_dump(os.path.join(os.path.dirname(store.lake_dir), f'{SYMBOL}-trades-{source}.zip'), TRADES_HEADER, rows)
+    return store.ingest_zip(zip_path, SYMBOL)
+
+
+def stored(store):
+    table = pq.read_table(store.day_path(SYMBOL, date(2025, 5, 1)))
+    return dict(zip(table.column('id').to_pylist(), table.column('price').to_pylist()))
+
+
+def test_monthly_dump_replaces_the_daily_files_it_covers(tmp_path):
+    store = TradeStore(str(tmp_path / 'lake'))
+    ingest(store, '2025-05-01', trades(range(0, 100), price=1.0))
+    ingest(store, '2025-05', trades(range(0, 200), price=2.0))
+    assert stored(store) == {i: 2.0 for i in range(200)}
+    assert store.days(SYMBOL)['2025-05-01']['kind'] == 'monthly'
+    assert store.days(SYMBOL)['2025-05-01']['merged'] == []
+
+    # A daily file arriving later adds nothing to a day the monthly dump holds
+    ingest(store, '2025-05-01', trades(range(50, 150), price=1.0))
+    assert stored(store) == {i: 2.0 for i in range(200)}
+
+
+def test_monthly_dump_is_kept_whole_and_daily_fills_what_it_lacks(tmp_path):
+    store = TradeStore(str(tmp_path / 'lake'))
+    ingest(store, '2025-05-01', trades(range(0, 100), price=1.0))
+    ingest(store, '2025-05', trades([i for i in range(0, 100) if i % 10], price=2.0))
+    assert stored(store) == {i: 1.0 if i % 10 == 0 else 2.0 for i in range(100)}
+    entry = store.days(SYMBOL)['2025-05-01']
+    assert (entry['kind'], entry['rows'], entry['merged']) == ('monthly', 100, [f'{SYMBOL}-trades-2025-05-01'])
+    assert store.verify(SYMBOL)[0] == []
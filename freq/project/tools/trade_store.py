@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Canonical trade store: the lake holds exactly one trades.parquet per symbol
+and UTC day, and <lake>/_manifest.json records which Binance dump covers
+each day.
+
+Monthly and daily dumps are ingested into the same store:
+  - a day nobody covers yet takes the incoming file as is
+  - an incoming dump whose (contiguous) trade ids span everything already
+    stored for the day replaces it outright; this is how daily files are
+    compacted away once the monthly dump lands
+  - anything else is merged: the preferred source (monthly over daily, newer
+    over older within a kind) is kept whole and the other side contributes
+    only trade ids it lacks
+
+Every reader therefore scans each trade exactly once.
+
+The same store holds aggTrades dumps (in a lake of their own, see
+markets.py): an aggregate trade is stored as one trade keyed by its
+agg_trade_id, which is just as contiguous.
+
+Committed days also get their OHLC pyramid (see pyramid.py) rebuilt.
+
+Each source entry records the remote file it was downloaded from (url,
+size, SHA-256 checked against Binance's .CHECKSUM, download time) next to
+the rows it contributed, so sync runs work out what is missing without
+touching the network and verify() checks the lake from Parquet footers.
+
+The manifest also records the lake's layout (lake.DEFAULT_LAYOUT unless
+rewrite() chose another), which every write uses.
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+import zipfile
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import lake
+import pyramid
+from converter import TRADES_SCHEMA, open_member, to_trades
+
+MANIFEST_FILE = "_manifest.json"
+KIND_RANK = {'daily': 1, 'monthly': 2}
+
+
+def source_key(source):
+    """'2025-05' of the monthly dump 'ETHUSDT-trades-2025-05', '2025-05-03' of a daily one."""
+    return re.search(r'\d{4}-\d{2}(-\d{2})?$', source).group()
+
+
+def source_kind(source):
+    """'ETHUSDT-trades-2025-05' (or -aggTrades-, -1s-) is a monthly dump, 'ETHUSDT-trades-2025-05-03' a daily one."""
+    return 'monthly' if len(source_key(source)) == 7 else 'daily'
+
+
+def contiguous(entry):
+    return entry['rows'] == entry['last_id'] - entry['first_id'] + 1
+
+
+def covers(a, b):
+    """Whether a holds every trade id of b (a's ids have no gaps and span b's)."""
+    return contiguous(a) and a['first_id'] <= b['first_id'] and a['last_id'] >= b['last_id']
+
+
+class TradeStore:
+    """The lake plus its manifest: ingest, compaction and coverage queries."""
+
+    def __init__(self, lake_dir=lake.DEFAULT_LAKE_DIR):
+        self.lake_dir = lake_dir
+        self.manifest_path = os.path.join(lake_dir, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(lake_dir, exist_ok=True)
+        self.manifest = self._load()
+
+    @property
+    def layout(self):
+        return dict(lake.DEFAULT_LAYOUT, **self.manifest.get('layout', {}))
+
+    # ===== MANIFEST =====
+
+    def _load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {'symbols': {}}
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _symbol(self, symbol):
+        return self.manifest['symbols'].setdefault(symbol, {'days': {}, 'sources': {}})
+
+    def days(self, symbol):
+        """{'YYYY-MM-DD': entry} for every stored day of symbol."""
+        return dict(self._symbol(symbol)['days'])
+
+    def sources(self, symbol):
+        """{source: entry} for every dump ingested for symbol."""
+        return dict(self._symbol(symbol)['sources'])
+
+    def day_path(self, symbol, day):
+        return os.path.join(lake.partition_dir(self.lake_dir, symbol, day), lake.DAY_FILE)
+
+    # ===== INGEST =====
+
+    def ingest_zip(self, zip_path, symbol, schema=TRADES_SCHEMA, remote=None):
+        """
+        Stream every CSV member of a dump into the store. schema is the dump's
+        CSV schema (see converter), trades or aggTrades, normalized to
+        TRADES_SCHEMA on the way in.
+        A single-member dump is named after the zip itself. remote describes
+        the downloaded file (see commit). Returns {source: {date: entry}}.
+        """
+        committed = {}
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            members = [member for member in zip_ref.namelist() if member.endswith('.csv')]
+            for member in members:
+                if len(members) == 1:
+                    source = os.path.splitext(os.path.basename(zip_path))[0]
+                else:
+                    source = os.path.basename(member)[:-len('.csv')]
+                batches = (to_trades(batch, schema) for batch in open_member(zip_ref, member, schema))
+                staged = lake.stage_source(batches, self.lake_dir, symbol, source, layout=self.layout)
+                committed[source] = self.commit(symbol, source, staged, remote)
+        return committed
+
+    def ingest_parquet(self, parquet_path, symbol, source=None):
+        """Import an already converted Parquet file (flat or old per-source lake file)."""
+        source = source or os.path.splitext(os.path.basename(parquet_path))[0]
+        reader = pq.ParquetFile(parquet_path)
+        batches = (batch.select(TRADES_SCHEMA.names).cast(TRADES_SCHEMA)
+                   for batch in reader.iter_batches(batch_size=lake.ROW_GROUP_ROWS))
+        return self.commit(symbol, source, lake.stage_source(batches, self.lake_dir, symbol, source, layout=self.layout))
+
+    def commit(self, symbol, source, staged, remote=None):
+        """
+        Move staged day files into the store and record them, with remote
+        ({'url', 'size', 'sha256', 'verified', 'downloaded'}) if the source
+        was downloaded. Returns {date: entry}.
+        """
+        with self._lock:
+            entries = self._symbol(symbol)
+            committed = {}
+            for day, incoming in staged.items():
+                committed[day] = self._commit_day(symbol, day, source, incoming)
+                if self._day_stale(symbol, day):
+                    self._build_day(symbol, day)
+            self._build_months(symbol, staged)
+            entries['sources'][source] = {
+                'kind': source_kind(source),
+                'days': len(staged),
+                'rows': sum(item['rows'] for item in staged.values()),
+                'ingested': datetime.now().isoformat(timespec='seconds'),
+            }
+            if remote is not None:
+                entries['sources'][source]['remote'] = remote
+            self.save()
+        return committed
+
+    def _commit_day(self, symbol, day, source, incoming):
+        days = self._symbol(symbol)['days']
+        key = day.isoformat()
+        path = self.day_path(symbol, day)
+        stats = {k: incoming[k] for k in ('rows', 'first_id', 'last_id', 'first_time', 'last_time')}
+        entry = dict(stats, source=source, kind=source_kind(source), merged=[])
+        current = days.get(key)
+
+        if current is None or not os.path.exists(path):
+            os.replace(incoming['tmp'], path)
+        elif self._rank(entry) >= self._rank(current) and covers(stats, current):
+            # Compaction: the incoming dump holds every trade already stored
+            os.replace(incoming['tmp'], path)
+        elif self._rank(current) >= self._rank(entry) and covers(current, stats):
+            # Nothing new, e.g. a daily file for a day the monthly dump covers
+            os.remove(incoming['tmp'])
+            entry = current
+        else:
+            entry = self._merge(path, current, incoming['tmp'], entry)
+        days[key] = entry
+        return entry
+
+    @staticmethod
+    def _rank(entry):
+        return KIND_RANK[entry['kind']]
+
+    def _merge(self, path, current, tmp_path, entry):
+        """Union of the stored day and a staged one, deduplicated by trade id."""
+        stored, incoming = pq.read_table(path), pq.read_table(tmp_path)
+        if self._rank(entry) >= self._rank(current):
+            keep, keep_entry, other, other_source = incoming, entry, stored, current['source']
+        else:
+            keep, keep_entry, other, other_source = stored, current, incoming, entry['source']
+        extra = other.filter(pc.invert(pc.is_in(other.column('id'), value_set=keep.column('id'))))
+        merged = pa.concat_tables([keep, extra.cast(keep.schema)])
+        lake.write_day(merged, tmp_path, self.layout)
+        os.replace(tmp_path, path)
+        result = dict(keep_entry, **lake.table_stats(merged))
+        result['merged'] = sorted(set(keep_entry.get('merged', [])) | ({other_source} if extra.num_rows else set()))
+        return result
+
+    # ===== MAINTENANCE =====
+
+    def compact(self, symbol):
+        """
+        Fold any stray per-source day files (the earlier <source>.parquet lake
+        layout, or leftovers of an interrupted run) into the canonical day
+        files. Returns the number of files folded in.
+        """
+        pattern = os.path.join(self.lake_dir, f"symbol={symbol}", "year=*", "month=*", "day=*", "*.parquet")
+        by_source = {}
+        for path in sorted(glob.glob(pattern)):
+            if os.path.basename(path) != lake.DAY_FILE and not os.path.basename(path).startswith('_'):
+                by_source.setdefault(os.path.basename(path)[:-len('.parquet')], []).append(path)
+        # Monthly dumps first so daily files only add what the monthly lacks
+        for source in sorted(by_source, key=lambda name: (-KIND_RANK[source_kind(name)], name)):
+            paths = by_source[source]
+            batches = (batch.select(TRADES_SCHEMA.names).cast(TRADES_SCHEMA)
+                       for path in paths
+                       for batch in pq.ParquetFile(path).iter_batches(batch_size=lake.ROW_GROUP_ROWS))
+            self.commit(symbol, source, lake.stage_source(batches, self.lake_dir, symbol, source, layout=self.layout))
+            for path in paths:
+                os.remove(path)
+        for path in glob.glob(os.path.join(self.lake_dir, f"symbol={symbol}", "year=*", "month=*", "day=*", ".*.tmp")):
+            os.remove(path)
+        return sum(len(paths) for paths in by_source.values())
+
+    def verify(self, symbol):
+        """
+        Check the lake against the manifest without reading any trades: every
+        stored day file must exist and its Parquet footer hold the recorded
+        row count. Returns (problems, sources lacking a verified checksum).
+        """
+        problems = []
+        for day in self._stored_days(symbol):
+            path = self.day_path(symbol, day)
+            expected = self._symbol(symbol)['days'][day.isoformat()]['rows']
+            if not os.path.exists(path):
+                problems.append(f"{day}: day file missing")
+                continue
+            rows = pq.ParquetFile(path).metadata.num_rows
+            if rows != expected:
+                problems.append(f"{day}: {rows:,} rows on disk, {expected:,} in the manifest")
+        unverified = sorted(source for source, entry in self._symbol(symbol)['sources'].items()
+                            if not entry.get('remote', {}).get('verified'))
+        return problems, unverified
+
+    def rewrite(self, layout, symbols=None, progress=None):
+        """
+        Switch the lake to layout (a partial dict, applied over the current
+        one) and re-encode every stored day file in it. The new layout is
+        recorded first, so later ingests use it and an interrupted rewrite can
+        simply be run again; readers cope with a mix of layouts meanwhile.
+        Returns (bytes before, bytes after).
+        """
+        with self._lock:
+            self.manifest['layout'] = dict(self.layout, **layout)
+            self.save()
+            layout = self.layout
+            before = after = 0
+            for symbol in symbols or sorted(self.manifest['symbols']):
+                for key in sorted(self._symbol(symbol)['days']):
+                    path = self.day_path(symbol, datetime.strptime(key, '%Y-%m-%d').date())
+                    tmp_path = os.path.join(os.path.dirname(path), '.rewrite.parquet.tmp')
+                    before += os.path.getsize(path)
+                    lake.write_day(pq.read_table(path), tmp_path, layout)
+                    os.replace(tmp_path, path)
+                    after += os.path.getsize(path)
+                    if progress:
+                        progress(symbol, key)
+        return before, after
+
+    def build_pyramid(self, symbol, rebuild=False, progress=None):
+        """Build the OHLC pyramid of every stored day lacking an up-to-date one. Returns days built."""
+        built = 0
+        for day in self._stored_days(symbol):
+            if rebuild or self._day_stale(symbol, day):
+                self._build_day(symbol, day)
+                built += 1
+                if progress:
+                    progress(symbol, day.isoformat())
+        self._build_months(symbol, self._stored_days(symbol), rebuild)
+        return built
+
+    def _day_stale(self, symbol, day):
+        return pyramid.is_stale(self.lake_dir, symbol, day)
+
+    def _build_day(self, symbol, day):
+        pyramid.build_day(self.lake_dir, symbol, day)
+
+    def _stored_days(self, symbol):
+        return [datetime.strptime(key, '%Y-%m-%d').date() for key in sorted(self._symbol(symbol)['days'])]
+
+    def _build_months(self, symbol, days, rebuild=False):
+        for day in {day.replace(day=1): day for day in days}.values():
+            if rebuild or pyramid.is_month_stale(self.lake_dir, symbol, day):
+                pyramid.build_month(self.lake_dir, symbol, day)
+
+    def ohlc(self, symbol, start, end=None, width=pyramid.DEFAULT_WIDTH, timeframe=None):
+        """
+        OHLC bars from the start of period start to the end of period end (see
+        lake.period_bounds), read from the pyramid level matching the span and
+        width, or resampled to timeframe. Days without an up-to-date pyramid
+        are built first. Returns (DataFrame indexed by bar start, level).
+        """
+        start_ms = lake.period_bounds(start)[0]
+        end_ms = lake.period_bounds(end if end is not None else start)[1]
+        level = pyramid.choose_level(end_ms - start_ms, width, timeframe)
+        days = [day for day in self._stored_days(symbol)
+                if lake.period_bounds(day.isoformat())[0] < end_ms
+                and lake.period_bounds(day.isoformat())[0] + lake.DAY_MS > start_ms]
+        for day in days:
+            if self._day_stale(symbol, day):
+                self._build_day(symbol, day)
+        if level in pyramid.MONTH_LEVELS:
+            self._build_months(symbol, days)
+        bars = pyramid.load_bars(self.lake_dir, symbol, days, start_ms, end_ms, level)
+        return pyramid.bars_frame(bars, timeframe), level
+
+    def coverage(self, symbol):
+        """{'monthly': [days], 'daily': [days]} by the kind of the source each day came from."""
+        result = {'monthly': [], 'daily': []}
+        for key, entry in sorted(self._symbol(symbol)['days'].items()):
+            result[entry['kind']].append(key)
+        return result